@@ -9,10 +9,13 @@
  *
  */
 
+#define PY_SSIZE_T_CLEAN
 #include <Python.h>
 #include <math.h>
 #include <string.h>
 #include <stdio.h>
+#include <stdint.h>
+#include <float.h>
 
 #if PY_MAJOR_VERSION >= 3
     #define PyInt_FromLong PyLong_FromLong
@@ -426,6 +429,8 @@ static PyObject * c_metrics_max_subtotal(PyObject *self, PyObject * args)
 		return NULL;
 	}
 	
+	// The comparison only uses C arrays, other threads can run meanwhile
+	Py_BEGIN_ALLOW_THREADS
 	for (i = 0; i < nr_matches; i++) {
 		pos = i + start_pos;
 		l = get_truncate_len(matrix1_len, matrix2_len, pos);
@@ -452,6 +457,7 @@ static PyObject * c_metrics_max_subtotal(PyObject *self, PyObject * args)
 	}
 	
 	i = index_at_max(scores, nr_matches * 2);
+	Py_END_ALLOW_THREADS
 	return Py_BuildValue("fii", scores[i], positions[i], orients[i]);
 	
 }
@@ -856,11 +862,858 @@ static PyObject * c_metrics_pfmscan(PyObject *self, PyObject * args)
 
 
 
+/*
+ * Scanning of a compiled motif set
+ *
+ * The motif set is supplied as a number of contiguous buffers:
+ *   pwms       - double[sum(lengths)][4], log-odds rows of all motifs
+ *   lengths    - int32[n_motifs], length of every motif
+ *   cutoffs    - double[n_motifs], score cutoff (NaN to skip a motif)
+ *   min_scores - double[n_motifs], minimum score of every motif
+ *
+ * The sequence is translated to nucleotide codes once, after which every
+ * motif is scored against the same code array.
+ */
+
+#define NUC_A 0
+#define NUC_C 1
+#define NUC_G 2
+#define NUC_T 3
+#define NUC_N 4
+#define NUC_OTHER 5
+#define NUC_COLS 6
+
+static unsigned char nuc_codes[256];
+
+static void init_nuc_codes(void) {
+	int i;
+	for (i = 0; i < 256; i++) {
+		nuc_codes[i] = NUC_OTHER;
+	}
+	nuc_codes['A'] = NUC_A; nuc_codes['a'] = NUC_A;
+	nuc_codes['C'] = NUC_C; nuc_codes['c'] = NUC_C;
+	nuc_codes['G'] = NUC_G; nuc_codes['g'] = NUC_G;
+	nuc_codes['T'] = NUC_T; nuc_codes['t'] = NUC_T;
+	nuc_codes['N'] = NUC_N; nuc_codes['n'] = NUC_N;
+}
+
+static void encode_seq(const char *seq, Py_ssize_t seq_len, unsigned char *codes) {
+	Py_ssize_t i;
+	for (i = 0; i < seq_len; i++) {
+		codes[i] = nuc_codes[(unsigned char) seq[i]];
+	}
+}
+
+static void fill_scan_matrices(const double *pwm, int pwm_len, double *fwd, double *rev) {
+	// Extend a motif to a [pwm_len][NUC_COLS] matrix for the forward and the
+	// reverse strand. An N scores as the minimum of the row, any other
+	// character does not contribute to the score.
+	int m, c;
+	double row_min;
+	const double *row;
+
+	for (m = 0; m < pwm_len; m++) {
+		row = pwm + 4 * m;
+		row_min = row[0];
+		for (c = 1; c < 4; c++) {
+			if (row[c] < row_min) {
+				row_min = row[c];
+			}
+		}
+		for (c = 0; c < 4; c++) {
+			fwd[m * NUC_COLS + c] = row[c];
+			rev[(pwm_len - m - 1) * NUC_COLS + c] = row[3 - c];
+		}
+		fwd[m * NUC_COLS + NUC_N] = row_min;
+		fwd[m * NUC_COLS + NUC_OTHER] = 0;
+		rev[(pwm_len - m - 1) * NUC_COLS + NUC_N] = row_min;
+		rev[(pwm_len - m - 1) * NUC_COLS + NUC_OTHER] = 0;
+	}
+}
+
+static double score_window(const double *matrix, int pwm_len, const unsigned char *codes) {
+	int m;
+	double score = 0;
+	for (m = 0; m < pwm_len; m++) {
+		score += matrix[m * NUC_COLS + codes[m]];
+	}
+	return score;
+}
+
+static void insert_hit(double score, Py_ssize_t pos, int strand, int n_report, double *max_scores, Py_ssize_t *max_pos, int *max_strand) {
+	// Keep the n_report highest scores sorted from high to low
+	int p, q;
+
+	p = n_report - 1;
+	while ((p >= 0) && (score > max_scores[p])) {
+		p--;
+	}
+	if (p < (n_report - 1)) {
+		for (q = n_report - 1; q > (p + 1); q--) {
+			max_scores[q] = max_scores[q - 1];
+			max_pos[q] = max_pos[q - 1];
+			max_strand[q] = max_strand[q - 1];
+		}
+		max_scores[p + 1] = score;
+		max_pos[p + 1] = pos;
+		max_strand[p + 1] = strand;
+	}
+}
+
+static int append_hit(PyObject *list, double score, Py_ssize_t pos, int strand) {
+	PyObject *row = Py_BuildValue("[dni]", score, pos, strand);
+	if (row == NULL) {
+		return -1;
+	}
+	if (PyList_Append(list, row) < 0) {
+		Py_DECREF(row);
+		return -1;
+	}
+	Py_DECREF(row);
+	return 0;
+}
+
+static int check_motif_buffers(Py_buffer *pwms, Py_buffer *lengths, Py_buffer *cutoffs, Py_buffer *min_scores, Py_ssize_t *n_motifs) {
+	Py_ssize_t i, total_len = 0;
+	const int32_t *len_p;
+
+	if (lengths->len % sizeof(int32_t) != 0) {
+		PyErr_SetString(PyExc_ValueError, "lengths should be an int32 buffer");
+		return -1;
+	}
+	*n_motifs = lengths->len / sizeof(int32_t);
+	if ((cutoffs->len != *n_motifs * (Py_ssize_t) sizeof(double)) || (min_scores->len != *n_motifs * (Py_ssize_t) sizeof(double))) {
+		PyErr_SetString(PyExc_ValueError, "cutoffs and min_scores should be float64 buffers with one value per motif");
+		return -1;
+	}
+	len_p = (const int32_t *) lengths->buf;
+	for (i = 0; i < *n_motifs; i++) {
+		if (len_p[i] <= 0) {
+			PyErr_SetString(PyExc_ValueError, "motif lengths should be positive");
+			return -1;
+		}
+		total_len += len_p[i];
+	}
+	if (pwms->len != total_len * 4 * (Py_ssize_t) sizeof(double)) {
+		PyErr_SetString(PyExc_ValueError, "pwms should be a float64 buffer of shape (sum(lengths), 4)");
+		return -1;
+	}
+	return 0;
+}
+
+static PyObject * c_metrics_pwmscan_multi(PyObject *self, PyObject * args)
+{
+	const char *seq;
+	Py_ssize_t seq_len;
+	Py_buffer pwms, lengths, cutoffs, min_scores;
+	int n_report, scan_rc;
+	Py_ssize_t n_motifs, k, j, j_max;
+	int i, pwm_len, max_len = 0;
+	const int32_t *len_p;
+	const double *pwm_p, *cutoff_p, *min_p;
+	unsigned char *codes = NULL;
+	double *fwd = NULL, *rev = NULL;
+	double *max_scores = NULL;
+	Py_ssize_t *max_pos = NULL;
+	int *max_strand = NULL;
+	double score, cutoff;
+	PyObject *result = NULL, *hits;
+
+	if (!PyArg_ParseTuple(args, "s#y*y*y*y*ii", &seq, &seq_len, &pwms, &lengths, &cutoffs, &min_scores, &n_report, &scan_rc))
+		return NULL;
+
+	if (check_motif_buffers(&pwms, &lengths, &cutoffs, &min_scores, &n_motifs) < 0)
+		goto done;
+
+	len_p = (const int32_t *) lengths.buf;
+	cutoff_p = (const double *) cutoffs.buf;
+	min_p = (const double *) min_scores.buf;
+	for (k = 0; k < n_motifs; k++) {
+		if (len_p[k] > max_len) {
+			max_len = len_p[k];
+		}
+	}
+
+	codes = PyMem_Malloc(seq_len + 1);
+	fwd = PyMem_Malloc((max_len * NUC_COLS + 1) * sizeof(double));
+	rev = PyMem_Malloc((max_len * NUC_COLS + 1) * sizeof(double));
+	max_scores = PyMem_Malloc((n_report + 1) * sizeof(double));
+	max_pos = PyMem_Malloc((n_report + 1) * sizeof(Py_ssize_t));
+	max_strand = PyMem_Malloc((n_report + 1) * sizeof(int));
+	if (!codes || !fwd || !rev || !max_scores || !max_pos || !max_strand) {
+		PyErr_NoMemory();
+		goto done;
+	}
+	encode_seq(seq, seq_len, codes);
+
+	result = PyList_New(n_motifs);
+	if (result == NULL)
+		goto done;
+
+	pwm_p = (const double *) pwms.buf;
+	for (k = 0; k < n_motifs; k++) {
+		pwm_len = len_p[k];
+		cutoff = cutoff_p[k];
+		hits = PyList_New(0);
+		if (hits == NULL) {
+			Py_CLEAR(result);
+			goto done;
+		}
+		PyList_SET_ITEM(result, k, hits);
+
+		if (isnan(cutoff)) {
+			pwm_p += 4 * pwm_len;
+			continue;
+		}
+
+		fill_scan_matrices(pwm_p, pwm_len, fwd, rev);
+		pwm_p += 4 * pwm_len;
+
+		j_max = seq_len - pwm_len + 1;
+		for (i = 0; i < n_report; i++) {
+			max_scores[i] = -DBL_MAX;
+			max_pos[i] = -1;
+			max_strand[i] = 1;
+		}
+
+		for (j = 0; j < j_max; j++) {
+			score = score_window(fwd, pwm_len, codes + j);
+			if (score >= cutoff) {
+				if (n_report > 0) {
+					insert_hit(score, j, 1, n_report, max_scores, max_pos, max_strand);
+				}
+				else if (append_hit(hits, score, j, 1) < 0) {
+					Py_CLEAR(result);
+					goto done;
+				}
+			}
+		}
+		if (scan_rc) {
+			for (j = 0; j < j_max; j++) {
+				score = score_window(rev, pwm_len, codes + j);
+				if (score >= cutoff) {
+					if (n_report > 0) {
+						insert_hit(score, j, -1, n_report, max_scores, max_pos, max_strand);
+					}
+					else if (append_hit(hits, score, j, -1) < 0) {
+						Py_CLEAR(result);
+						goto done;
+					}
+				}
+			}
+		}
+
+		for (i = 0; i < n_report; i++) {
+			if (max_pos[i] > -1) {
+				if (append_hit(hits, max_scores[i], max_pos[i], max_strand[i]) < 0) {
+					Py_CLEAR(result);
+					goto done;
+				}
+			}
+		}
+
+		// Report the minimum score if no match can be found, for instance
+		// when the sequence is shorter than the motif.
+		if ((n_report > 0) && (PyList_GET_SIZE(hits) == 0) && (cutoff <= min_p[k])) {
+			for (i = 0; i < n_report; i++) {
+				if (append_hit(hits, min_p[k], 0, 1) < 0) {
+					Py_CLEAR(result);
+					goto done;
+				}
+			}
+		}
+	}
+
+done:
+	PyMem_Free(codes);
+	PyMem_Free(fwd);
+	PyMem_Free(rev);
+	PyMem_Free(max_scores);
+	PyMem_Free(max_pos);
+	PyMem_Free(max_strand);
+	PyBuffer_Release(&pwms);
+	PyBuffer_Release(&lengths);
+	PyBuffer_Release(&cutoffs);
+	PyBuffer_Release(&min_scores);
+	return result;
+}
+
+
+/*
+ * Buffer interface
+ *
+ * The functions below work on NumPy (or any other buffer protocol) arrays and
+ * release the GIL while scanning, so they can run in parallel threads:
+ *   seq    - uint8[seq_len], nucleotide codes (A=0, C=1, G=2, T=3, N=4,
+ *            other=5), see gimmemotifs.utils.encode_seq()
+ *   matrix - float64 or float32[pwm_len][4], C-contiguous
+ *   hits   - preallocated records of (float64 score, int32 pos, int32 strand),
+ *            see gimmemotifs.utils.HIT_DTYPE
+ */
+
+typedef struct {
+	double score;
+	int32_t pos;
+	int32_t strand;
+} scan_hit;
+
+static int get_codes(Py_buffer *seq) {
+	// Check that a sequence buffer only contains valid nucleotide codes
+	Py_ssize_t i;
+	const unsigned char *codes = (const unsigned char *) seq->buf;
+	for (i = 0; i < seq->len; i++) {
+		if (codes[i] >= NUC_COLS) {
+			PyErr_SetString(PyExc_ValueError, "sequence should be encoded as uint8 nucleotide codes");
+			return -1;
+		}
+	}
+	return 0;
+}
+
+static double * get_matrix(PyObject *matrix_o, int is_pfm, int *pwm_len) {
+	// Copy a float64 or float32 (pwm_len x 4) buffer into a new double array.
+	// Frequency matrices are converted to log-odds scores.
+	Py_buffer view;
+	Py_ssize_t i, n;
+	char fmt;
+	double *pwm, x;
+
+	if (PyObject_GetBuffer(matrix_o, &view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) < 0)
+		return NULL;
+
+	fmt = view.format == NULL ? 'B' : view.format[strlen(view.format) - 1];
+	if (!((fmt == 'd' && view.itemsize == sizeof(double)) || (fmt == 'f' && view.itemsize == sizeof(float)))) {
+		PyErr_SetString(PyExc_TypeError, "matrix should be a float64 or float32 array");
+		PyBuffer_Release(&view);
+		return NULL;
+	}
+	n = view.len / view.itemsize;
+	if ((n == 0) || (n % 4 != 0) || (n / 4 > INT32_MAX)) {
+		PyErr_SetString(PyExc_ValueError, "matrix should have shape (length, 4)");
+		PyBuffer_Release(&view);
+		return NULL;
+	}
+
+	pwm = PyMem_Malloc(n * sizeof(double));
+	if (pwm == NULL) {
+		PyBuffer_Release(&view);
+		PyErr_NoMemory();
+		return NULL;
+	}
+	for (i = 0; i < n; i++) {
+		x = (fmt == 'd') ? ((const double *) view.buf)[i] : ((const float *) view.buf)[i];
+		pwm[i] = is_pfm ? log(x / 0.25 + 0.01) : x;
+	}
+	*pwm_len = (int) (n / 4);
+	PyBuffer_Release(&view);
+	return pwm;
+}
+
+static Py_ssize_t scan_to_hits(const unsigned char *codes, Py_ssize_t seq_len, const double *fwd, const double *rev, int pwm_len, double cutoff, int n_report, int scan_rc, double *max_scores, Py_ssize_t *max_pos, int *max_strand, scan_hit *hits) {
+	// Scan one motif, write the hits and return the number of hits. With
+	// n_report > 0 the n_report best hits are written from high to low,
+	// otherwise all hits are written in sequence order, forward strand first.
+	// The hits array should be large enough to hold all hits.
+	Py_ssize_t j, j_max, n = 0;
+	int i;
+	double score;
+
+	j_max = seq_len - pwm_len + 1;
+	for (i = 0; i < n_report; i++) {
+		max_scores[i] = -DBL_MAX;
+		max_pos[i] = -1;
+		max_strand[i] = 1;
+	}
+
+	for (j = 0; j < j_max; j++) {
+		score = score_window(fwd, pwm_len, codes + j);
+		if (score >= cutoff) {
+			if (n_report > 0) {
+				insert_hit(score, j, 1, n_report, max_scores, max_pos, max_strand);
+			}
+			else {
+				hits[n].score = score;
+				hits[n].pos = (int32_t) j;
+				hits[n].strand = 1;
+				n++;
+			}
+		}
+	}
+	if (scan_rc) {
+		for (j = 0; j < j_max; j++) {
+			score = score_window(rev, pwm_len, codes + j);
+			if (score >= cutoff) {
+				if (n_report > 0) {
+					insert_hit(score, j, -1, n_report, max_scores, max_pos, max_strand);
+				}
+				else {
+					hits[n].score = score;
+					hits[n].pos = (int32_t) j;
+					hits[n].strand = -1;
+					n++;
+				}
+			}
+		}
+	}
+
+	for (i = 0; i < n_report; i++) {
+		if (max_pos[i] > -1) {
+			hits[n].score = max_scores[i];
+			hits[n].pos = (int32_t) max_pos[i];
+			hits[n].strand = max_strand[i];
+			n++;
+		}
+	}
+	return n;
+}
+
+static PyObject * scan_array(PyObject *args, int is_pfm)
+{
+	Py_buffer seq, hits;
+	PyObject *matrix_o;
+	double cutoff;
+	int n_report, scan_rc, pwm_len;
+	Py_ssize_t capacity, j_max, n = -1;
+	double *pwm = NULL, *fwd = NULL, *rev = NULL, *max_scores = NULL;
+	Py_ssize_t *max_pos = NULL;
+	int *max_strand = NULL;
+
+	if (!PyArg_ParseTuple(args, "y*Odiiw*", &seq, &matrix_o, &cutoff, &n_report, &scan_rc, &hits))
+		return NULL;
+
+	if ((n_report < 0) || (get_codes(&seq) < 0))
+		goto done;
+	if (hits.len % sizeof(scan_hit) != 0) {
+		PyErr_SetString(PyExc_ValueError, "hits should be an array of (score, pos, strand) records");
+		goto done;
+	}
+	pwm = get_matrix(matrix_o, is_pfm, &pwm_len);
+	if (pwm == NULL)
+		goto done;
+
+	capacity = hits.len / sizeof(scan_hit);
+	j_max = seq.len - pwm_len + 1;
+	if (j_max < 0) {
+		j_max = 0;
+	}
+	if (((n_report > 0) && (capacity < n_report)) || ((n_report == 0) && (capacity < (scan_rc ? 2 : 1) * j_max))) {
+		PyErr_SetString(PyExc_ValueError, "hits array is too small");
+		goto done;
+	}
+
+	fwd = PyMem_Malloc(pwm_len * NUC_COLS * sizeof(double));
+	rev = PyMem_Malloc(pwm_len * NUC_COLS * sizeof(double));
+	max_scores = PyMem_Malloc((n_report + 1) * sizeof(double));
+	max_pos = PyMem_Malloc((n_report + 1) * sizeof(Py_ssize_t));
+	max_strand = PyMem_Malloc((n_report + 1) * sizeof(int));
+	if (!fwd || !rev || !max_scores || !max_pos || !max_strand) {
+		PyErr_NoMemory();
+		goto done;
+	}
+	fill_scan_matrices(pwm, pwm_len, fwd, rev);
+
+	Py_BEGIN_ALLOW_THREADS
+	n = scan_to_hits((const unsigned char *) seq.buf, seq.len, fwd, rev, pwm_len, cutoff, n_report, scan_rc, max_scores, max_pos, max_strand, (scan_hit *) hits.buf);
+	Py_END_ALLOW_THREADS
+
+done:
+	PyMem_Free(pwm);
+	PyMem_Free(fwd);
+	PyMem_Free(rev);
+	PyMem_Free(max_scores);
+	PyMem_Free(max_pos);
+	PyMem_Free(max_strand);
+	PyBuffer_Release(&seq);
+	PyBuffer_Release(&hits);
+	if (n < 0) {
+		if (!PyErr_Occurred())
+			PyErr_SetString(PyExc_ValueError, "n_report should be >= 0");
+		return NULL;
+	}
+	return PyLong_FromSsize_t(n);
+}
+
+static PyObject * c_metrics_pwmscan_array(PyObject *self, PyObject * args)
+{
+	return scan_array(args, 0);
+}
+
+static PyObject * c_metrics_pfmscan_array(PyObject *self, PyObject * args)
+{
+	return scan_array(args, 1);
+}
+
+static PyObject * scan_scores(PyObject *args, int is_pfm)
+{
+	// Write the forward strand score of every position to a float64 array
+	Py_buffer seq, scores;
+	PyObject *matrix_o;
+	int pwm_len;
+	Py_ssize_t j, j_max = -1;
+	double *pwm = NULL, *fwd = NULL, *rev = NULL;
+
+	if (!PyArg_ParseTuple(args, "y*Ow*", &seq, &matrix_o, &scores))
+		return NULL;
+
+	if (get_codes(&seq) < 0)
+		goto done;
+	pwm = get_matrix(matrix_o, is_pfm, &pwm_len);
+	if (pwm == NULL)
+		goto done;
+
+	if (seq.len - pwm_len + 1 > 0) {
+		j_max = seq.len - pwm_len + 1;
+	}
+	else {
+		j_max = 0;
+	}
+	if (scores.len < j_max * (Py_ssize_t) sizeof(double)) {
+		PyErr_SetString(PyExc_ValueError, "scores should be a float64 array of length len(seq) - len(matrix) + 1");
+		j_max = -1;
+		goto done;
+	}
+
+	fwd = PyMem_Malloc(pwm_len * NUC_COLS * sizeof(double));
+	rev = PyMem_Malloc(pwm_len * NUC_COLS * sizeof(double));
+	if (!fwd || !rev) {
+		PyErr_NoMemory();
+		j_max = -1;
+		goto done;
+	}
+	fill_scan_matrices(pwm, pwm_len, fwd, rev);
+	Py_BEGIN_ALLOW_THREADS
+	for (j = 0; j < j_max; j++) {
+		((double *) scores.buf)[j] = score_window(fwd, pwm_len, (const unsigned char *) seq.buf + j);
+	}
+	Py_END_ALLOW_THREADS
+
+done:
+	PyMem_Free(pwm);
+	PyMem_Free(fwd);
+	PyMem_Free(rev);
+	PyBuffer_Release(&seq);
+	PyBuffer_Release(&scores);
+	if (j_max < 0)
+		return NULL;
+	return PyLong_FromSsize_t(j_max);
+}
+
+static PyObject * c_metrics_pwmscan_scores(PyObject *self, PyObject * args)
+{
+	return scan_scores(args, 0);
+}
+
+static PyObject * c_metrics_pfmscan_scores(PyObject *self, PyObject * args)
+{
+	return scan_scores(args, 1);
+}
+
+static PyObject * c_metrics_pwmscan_multi_array(PyObject *self, PyObject * args)
+{
+	// Scan an encoded sequence with a compiled motif set. The n_report best
+	// hits of motif k are written to hits[k * n_report:], the number of hits
+	// of motif k to counts[k].
+	Py_buffer seq, pwms, lengths, cutoffs, min_scores, hits, counts;
+	int n_report, scan_rc;
+	Py_ssize_t n_motifs, k, n;
+	int i, pwm_len, max_len = 0, ok = 0;
+	const int32_t *len_p;
+	const double *pwm_p, *cutoff_p, *min_p;
+	double *fwd = NULL, *rev = NULL, *max_scores = NULL;
+	Py_ssize_t *max_pos = NULL;
+	int *max_strand = NULL;
+	scan_hit *hit_p;
+	int32_t *count_p;
+
+	if (!PyArg_ParseTuple(args, "y*y*y*y*y*iiw*w*", &seq, &pwms, &lengths, &cutoffs, &min_scores, &n_report, &scan_rc, &hits, &counts))
+		return NULL;
+
+	if (check_motif_buffers(&pwms, &lengths, &cutoffs, &min_scores, &n_motifs) < 0)
+		goto done;
+	if (get_codes(&seq) < 0)
+		goto done;
+	if (n_report < 1) {
+		PyErr_SetString(PyExc_ValueError, "n_report should be >= 1");
+		goto done;
+	}
+	if ((hits.len != n_motifs * n_report * (Py_ssize_t) sizeof(scan_hit)) || (counts.len != n_motifs * (Py_ssize_t) sizeof(int32_t))) {
+		PyErr_SetString(PyExc_ValueError, "hits should have shape (n_motifs, n_report) and counts should be int32 with one value per motif");
+		goto done;
+	}
+
+	len_p = (const int32_t *) lengths.buf;
+	cutoff_p = (const double *) cutoffs.buf;
+	min_p = (const double *) min_scores.buf;
+	for (k = 0; k < n_motifs; k++) {
+		if (len_p[k] > max_len) {
+			max_len = len_p[k];
+		}
+	}
+
+	fwd = PyMem_Malloc((max_len * NUC_COLS + 1) * sizeof(double));
+	rev = PyMem_Malloc((max_len * NUC_COLS + 1) * sizeof(double));
+	max_scores = PyMem_Malloc(n_report * sizeof(double));
+	max_pos = PyMem_Malloc(n_report * sizeof(Py_ssize_t));
+	max_strand = PyMem_Malloc(n_report * sizeof(int));
+	if (!fwd || !rev || !max_scores || !max_pos || !max_strand) {
+		PyErr_NoMemory();
+		goto done;
+	}
+
+	pwm_p = (const double *) pwms.buf;
+	count_p = (int32_t *) counts.buf;
+	Py_BEGIN_ALLOW_THREADS
+	for (k = 0; k < n_motifs; k++) {
+		pwm_len = len_p[k];
+		hit_p = (scan_hit *) hits.buf + k * n_report;
+		n = 0;
+		if (!isnan(cutoff_p[k])) {
+			fill_scan_matrices(pwm_p, pwm_len, fwd, rev);
+			n = scan_to_hits((const unsigned char *) seq.buf, seq.len, fwd, rev, pwm_len, cutoff_p[k], n_report, scan_rc, max_scores, max_pos, max_strand, hit_p);
+
+			// Report the minimum score if no match can be found
+			if ((n == 0) && (cutoff_p[k] <= min_p[k])) {
+				for (i = 0; i < n_report; i++) {
+					hit_p[i].score = min_p[k];
+					hit_p[i].pos = 0;
+					hit_p[i].strand = 1;
+				}
+				n = n_report;
+			}
+		}
+		count_p[k] = (int32_t) n;
+		pwm_p += 4 * pwm_len;
+	}
+	Py_END_ALLOW_THREADS
+	ok = 1;
+
+done:
+	PyMem_Free(fwd);
+	PyMem_Free(rev);
+	PyMem_Free(max_scores);
+	PyMem_Free(max_pos);
+	PyMem_Free(max_strand);
+	PyBuffer_Release(&seq);
+	PyBuffer_Release(&pwms);
+	PyBuffer_Release(&lengths);
+	PyBuffer_Release(&cutoffs);
+	PyBuffer_Release(&min_scores);
+	PyBuffer_Release(&hits);
+	PyBuffer_Release(&counts);
+	if (!ok)
+		return NULL;
+	Py_RETURN_NONE;
+}
+
+
+static int check_offsets(Py_buffer *offsets, Py_buffer *seqs, Py_ssize_t *n_seqs) {
+	// Check the int64 offsets of a block of concatenated sequences
+	Py_ssize_t i;
+	const int64_t *off_p;
+
+	if ((offsets->len < (Py_ssize_t) sizeof(int64_t)) || (offsets->len % sizeof(int64_t) != 0)) {
+		PyErr_SetString(PyExc_ValueError, "offsets should be an int64 buffer of length n_seqs + 1");
+		return -1;
+	}
+	*n_seqs = offsets->len / sizeof(int64_t) - 1;
+	off_p = (const int64_t *) offsets->buf;
+	for (i = 0; i < *n_seqs; i++) {
+		if ((off_p[i] < 0) || (off_p[i] > off_p[i + 1]) || (off_p[i + 1] > seqs->len)) {
+			PyErr_SetString(PyExc_ValueError, "invalid sequence offsets");
+			return -1;
+		}
+	}
+	return 0;
+}
+
+static void scan_block(const unsigned char *seqs, const int64_t *off_p, Py_ssize_t n_seqs, const double *pwm_p, const int32_t *len_p, const double *cutoff_p, const double *min_p, Py_ssize_t n_motifs, int n_report, int scan_rc, double *fwd, double *rev, int32_t *counts, float *scores)
+{
+	// Scan a block of concatenated sequences, sequence i is
+	// seqs[off_p[i]:off_p[i + 1]], and write the number of matches and/or
+	// the best score of motif k in sequence i to counts / scores[i * n_motifs + k].
+	//
+	// With n_report > 0 at most n_report matches are counted and, like
+	// pwmscan_multi(), n_report matches are counted for a sequence without
+	// matches if the cutoff is not higher than the minimum score. Motifs with
+	// a NaN cutoff have no matches.
+	// The best score is never lower than the minimum score of the motif,
+	// which is also reported for sequences that are shorter than the motif.
+	// The best score does not depend on the cutoff.
+	Py_ssize_t k, i, j, j_max, n;
+	int pwm_len, count;
+	const unsigned char *codes;
+	double score, best, cutoff;
+
+	for (k = 0; k < n_motifs; k++) {
+		pwm_len = len_p[k];
+		cutoff = cutoff_p[k];
+		count = (counts != NULL) && !isnan(cutoff);
+		fill_scan_matrices(pwm_p, pwm_len, fwd, rev);
+		pwm_p += 4 * pwm_len;
+
+		for (i = 0; i < n_seqs; i++) {
+			codes = seqs + off_p[i];
+			j_max = off_p[i + 1] - off_p[i] - pwm_len + 1;
+			best = min_p[k];
+			n = 0;
+			if (count || (scores != NULL)) {
+				for (j = 0; j < j_max; j++) {
+					score = score_window(fwd, pwm_len, codes + j);
+					if (score > best) {
+						best = score;
+					}
+					if (count && (score >= cutoff)) {
+						n++;
+					}
+				}
+				if (scan_rc) {
+					for (j = 0; j < j_max; j++) {
+						score = score_window(rev, pwm_len, codes + j);
+						if (score > best) {
+							best = score;
+						}
+						if (count && (score >= cutoff)) {
+							n++;
+						}
+					}
+				}
+			}
+			if (count && (n_report > 0)) {
+				if ((n > n_report) || ((n == 0) && (cutoff <= min_p[k]))) {
+					n = n_report;
+				}
+			}
+			if (counts != NULL) {
+				counts[i * n_motifs + k] = (int32_t) n;
+			}
+			if (scores != NULL) {
+				scores[i * n_motifs + k] = (float) best;
+			}
+		}
+	}
+}
+
+static PyObject * scan_block_buffers(PyObject *args, int want_counts, int want_scores)
+{
+	// Parse the arguments of pwmscan_best(), pwmscan_count() and
+	// pwmscan_count_best() and run scan_block().
+	Py_buffer seqs, offsets, pwms, lengths, cutoffs, min_scores, counts, scores;
+	int n_report = 0, scan_rc, ok = 0, parsed;
+	Py_ssize_t n_motifs, n_seqs, k;
+	int max_len = 0;
+	const int32_t *len_p;
+	double *fwd = NULL, *rev = NULL;
+
+	counts.obj = NULL;
+	scores.obj = NULL;
+	if (want_counts && want_scores) {
+		parsed = PyArg_ParseTuple(args, "y*y*y*y*y*y*iiw*w*", &seqs, &offsets, &pwms, &lengths, &cutoffs, &min_scores, &n_report, &scan_rc, &counts, &scores);
+	}
+	else if (want_counts) {
+		parsed = PyArg_ParseTuple(args, "y*y*y*y*y*y*iiw*", &seqs, &offsets, &pwms, &lengths, &cutoffs, &min_scores, &n_report, &scan_rc, &counts);
+	}
+	else {
+		parsed = PyArg_ParseTuple(args, "y*y*y*y*y*y*iw*", &seqs, &offsets, &pwms, &lengths, &cutoffs, &min_scores, &scan_rc, &scores);
+	}
+	if (!parsed)
+		return NULL;
+
+	if (check_motif_buffers(&pwms, &lengths, &cutoffs, &min_scores, &n_motifs) < 0)
+		goto done;
+	if ((get_codes(&seqs) < 0) || (check_offsets(&offsets, &seqs, &n_seqs) < 0))
+		goto done;
+	if (n_report < 0) {
+		PyErr_SetString(PyExc_ValueError, "n_report should be >= 0");
+		goto done;
+	}
+	if (want_counts && (counts.len != n_seqs * n_motifs * (Py_ssize_t) sizeof(int32_t))) {
+		PyErr_SetString(PyExc_ValueError, "counts should be an int32 array of shape (n_seqs, n_motifs)");
+		goto done;
+	}
+	if (want_scores && (scores.len != n_seqs * n_motifs * (Py_ssize_t) sizeof(float))) {
+		PyErr_SetString(PyExc_ValueError, "scores should be a float32 array of shape (n_seqs, n_motifs)");
+		goto done;
+	}
+
+	len_p = (const int32_t *) lengths.buf;
+	for (k = 0; k < n_motifs; k++) {
+		if (len_p[k] > max_len) {
+			max_len = len_p[k];
+		}
+	}
+	fwd = PyMem_Malloc((max_len * NUC_COLS + 1) * sizeof(double));
+	rev = PyMem_Malloc((max_len * NUC_COLS + 1) * sizeof(double));
+	if (!fwd || !rev) {
+		PyErr_NoMemory();
+		goto done;
+	}
+
+	Py_BEGIN_ALLOW_THREADS
+	scan_block(
+		(const unsigned char *) seqs.buf, (const int64_t *) offsets.buf, n_seqs,
+		(const double *) pwms.buf, len_p, (const double *) cutoffs.buf, (const double *) min_scores.buf, n_motifs,
+		n_report, scan_rc, fwd, rev,
+		want_counts ? (int32_t *) counts.buf : NULL,
+		want_scores ? (float *) scores.buf : NULL
+	);
+	Py_END_ALLOW_THREADS
+	ok = 1;
+
+done:
+	PyMem_Free(fwd);
+	PyMem_Free(rev);
+	PyBuffer_Release(&seqs);
+	PyBuffer_Release(&offsets);
+	PyBuffer_Release(&pwms);
+	PyBuffer_Release(&lengths);
+	PyBuffer_Release(&cutoffs);
+	PyBuffer_Release(&min_scores);
+	if (want_counts)
+		PyBuffer_Release(&counts);
+	if (want_scores)
+		PyBuffer_Release(&scores);
+	if (!ok)
+		return NULL;
+	Py_RETURN_NONE;
+}
+
+static PyObject * c_metrics_pwmscan_best(PyObject *self, PyObject * args)
+{
+	// pwmscan_best(seqs, offsets, pwms, lengths, cutoffs, min_scores, scan_rc, scores)
+	// Best score of every motif in every sequence, scores is a float32 array
+	// of shape (n_seqs, n_motifs).
+	return scan_block_buffers(args, 0, 1);
+}
+
+static PyObject * c_metrics_pwmscan_count(PyObject *self, PyObject * args)
+{
+	// pwmscan_count(seqs, offsets, pwms, lengths, cutoffs, min_scores, n_report, scan_rc, counts)
+	// Number of matches of every motif in every sequence, counts is an int32
+	// array of shape (n_seqs, n_motifs).
+	return scan_block_buffers(args, 1, 0);
+}
+
+static PyObject * c_metrics_pwmscan_count_best(PyObject *self, PyObject * args)
+{
+	// pwmscan_count_best(seqs, offsets, pwms, lengths, cutoffs, min_scores, n_report, scan_rc, counts, scores)
+	// Number of matches and best score in a single pass.
+	return scan_block_buffers(args, 1, 1);
+}
+
 static PyMethodDef CoreMethods[] = {
 	{"score", c_metrics_score, METH_VARARGS,"Test"},
 	{"c_max_subtotal", c_metrics_max_subtotal, METH_VARARGS,"Test"},
 	{"pfmscan", c_metrics_pfmscan, METH_VARARGS,"Test"},
 	{"pwmscan", c_metrics_pwmscan, METH_VARARGS,"Test"},
+	{"pwmscan_multi", c_metrics_pwmscan_multi, METH_VARARGS, "Scan a sequence with a compiled set of motifs"},
+	{"pwmscan_multi_array", c_metrics_pwmscan_multi_array, METH_VARARGS, "Scan an encoded sequence with a compiled set of motifs into a hit array"},
+	{"pwmscan_best", c_metrics_pwmscan_best, METH_VARARGS, "Best score of a compiled set of motifs in a block of encoded sequences"},
+	{"pwmscan_count", c_metrics_pwmscan_count, METH_VARARGS, "Number of matches of a compiled set of motifs in a block of encoded sequences"},
+	{"pwmscan_count_best", c_metrics_pwmscan_count_best, METH_VARARGS, "Number of matches and best score of a compiled set of motifs in a block of encoded sequences"},
+	{"pwmscan_array", c_metrics_pwmscan_array, METH_VARARGS, "Scan an encoded sequence with a PWM into a hit array"},
+	{"pfmscan_array", c_metrics_pfmscan_array, METH_VARARGS, "Scan an encoded sequence with a PFM into a hit array"},
+	{"pwmscan_scores", c_metrics_pwmscan_scores, METH_VARARGS, "Score every position of an encoded sequence with a PWM"},
+	{"pfmscan_scores", c_metrics_pfmscan_scores, METH_VARARGS, "Score every position of an encoded sequence with a PFM"},
 	{NULL, NULL, NULL, 0, NULL}
 };
 
@@ -880,6 +1733,7 @@ static PyMethodDef CoreMethods[] = {
 
 static PyObject * moduleinit(void) {
     PyObject *m;
+    init_nuc_codes();
 #if PY_MAJOR_VERSION >= 3
     m = PyModule_Create(&moduledef);
 #else
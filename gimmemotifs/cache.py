@@ -0,0 +1,220 @@
+"""Caches for motif scanning results.
+
+Scan results are stored under a key that identifies the sequence, the motifs
+and their thresholds and the scan parameters. All caches have a bounded size:
+when a cache is full the least recently used results are evicted.
+"""
+from collections import OrderedDict
+import logging
+import os
+
+from diskcache import Cache
+import xxhash
+
+from gimmemotifs.config import MotifConfig, CACHE_DIR
+
+logger = logging.getLogger("gimme.cache")
+
+CACHE_BACKENDS = ("memory", "disk", "tiered")
+
+# Default sizes: number of results in memory, megabytes on disk
+DEFAULT_CACHE_SIZE = 100000
+DEFAULT_DISK_CACHE_SIZE = 1024
+
+
+class ResultCache(object):
+    """Base class of the scan result caches.
+
+    Subclasses implement _get() and _set(). The number of cache hits and
+    misses is counted by get().
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached result of key, or None if it is not cached."""
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Store the result of key."""
+        self._set(key, value)
+
+    def stats(self):
+        """Return the number of cache hits and misses.
+
+        Returns
+        -------
+        dict
+            Dictionary with hits, misses and the number of cached results.
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self)}
+
+    def _get(self, key):
+        raise NotImplementedError()
+
+    def _set(self, key, value):
+        raise NotImplementedError()
+
+    def __len__(self):
+        raise NotImplementedError()
+
+
+class MemoryCache(ResultCache):
+    """In-memory least recently used cache.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Maximum number of results.
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        super(MemoryCache, self).__init__()
+        if maxsize < 1:
+            raise ValueError("cache size should be at least 1")
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def _get(self, key):
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+        return value
+
+    def _set(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DiskCache(ResultCache):
+    """On-disk least recently used cache.
+
+    The cache can be shared by different processes.
+
+    Parameters
+    ----------
+    directory : str, optional
+        Cache directory. By default a directory in the GimmeMotifs cache
+        directory is used.
+
+    size_limit : int, optional
+        Maximum size of the cache in megabytes.
+    """
+
+    def __init__(self, directory=None, size_limit=DEFAULT_DISK_CACHE_SIZE):
+        super(DiskCache, self).__init__()
+        if directory is None:
+            directory = os.path.join(CACHE_DIR, "scan")
+        self.directory = directory
+        self._cache = Cache(
+            directory,
+            size_limit=int(size_limit * 2 ** 20),
+            eviction_policy="least-recently-used",
+        )
+
+    def _get(self, key):
+        return self._cache.get(key)
+
+    def _set(self, key, value):
+        self._cache.set(key, value)
+
+    def __len__(self):
+        return len(self._cache)
+
+
+class TieredCache(ResultCache):
+    """Combination of caches, for instance a memory cache in front of a disk
+    cache.
+
+    Results are looked up in order of the caches and copied to the caches
+    before the cache that had the result. New results are stored in all
+    caches.
+
+    Parameters
+    ----------
+    caches : list
+        List of ResultCache instances, fastest first.
+    """
+
+    def __init__(self, caches):
+        super(TieredCache, self).__init__()
+        self.caches = list(caches)
+
+    def _get(self, key):
+        for i, cache in enumerate(self.caches):
+            value = cache.get(key)
+            if value is not None:
+                for faster in self.caches[:i]:
+                    faster.set(key, value)
+                return value
+        return None
+
+    def _set(self, key, value):
+        for cache in self.caches:
+            cache.set(key, value)
+
+    def __len__(self):
+        return len(self.caches[-1])
+
+
+def make_cache(backend=None, size=None, disk_size=None, directory=None):
+    """Create a scan result cache.
+
+    Parameters not specified are read from the configuration (cache_backend,
+    cache_size and cache_disk_size).
+
+    Parameters
+    ----------
+    backend : str, optional
+        "memory", "disk" or "tiered" (memory in front of disk).
+
+    size : int, optional
+        Maximum number of results in memory.
+
+    disk_size : int, optional
+        Maximum size of the disk cache in megabytes.
+
+    directory : str, optional
+        Directory of the disk cache.
+
+    Returns
+    -------
+    ResultCache
+        Cache instance.
+    """
+    params = MotifConfig().get_default_params()
+    if backend is None:
+        backend = params.get("cache_backend", "memory")
+    if size is None:
+        size = int(params.get("cache_size", DEFAULT_CACHE_SIZE))
+    if disk_size is None:
+        disk_size = float(params.get("cache_disk_size", DEFAULT_DISK_CACHE_SIZE))
+
+    if backend == "memory":
+        return MemoryCache(size)
+    if backend == "disk":
+        return DiskCache(directory, disk_size)
+    if backend == "tiered":
+        return TieredCache([MemoryCache(size), DiskCache(directory, disk_size)])
+    raise ValueError(
+        "unknown cache backend {}, choose one of {}".format(
+            backend, ", ".join(CACHE_BACKENDS)
+        )
+    )
+
+
+def seq_digest(seq):
+    """Return a digest of a sequence, independent of case."""
+    return xxhash.xxh64(seq.upper()).digest()
@@ -9,6 +9,7 @@ import sys
 import argparse
 from gimmemotifs.config import MotifConfig, BG_TYPES, BED_VALID_BGS
 from gimmemotifs import commands, __version__
+from gimmemotifs.pool import set_pool_size
 from gimmemotifs.utils import check_genome
 
 
@@ -281,6 +282,13 @@ def cli(sys_args):
         action="store_true",
         default=False,
     )
+    p.add_argument(
+        "--pvalues",
+        dest="hit_pvalue",
+        help="add the empirical p-value of every match (requires -g or -B)",
+        action="store_true",
+        default=False,
+    )
     p.add_argument(
         "-N",
         "--nthreads",
@@ -488,11 +496,27 @@ def cli(sys_args):
 
     # get_fpr_based_pfmscan_threshold.py
     p = subparsers.add_parser("threshold")
-    p.add_argument("pfmfile", help="File with pfms", metavar="pfmfile")
+    p.add_argument(
+        "pfmfile",
+        help="File with pfms, or a comma-separated list of files",
+        metavar="pfmfile",
+    )
     p.add_argument(
         "inputfile", help="FASTA file with background sequences", metavar="FAFILE"
     )
-    p.add_argument("fpr", help="Desired fpr", type=float, metavar="FPR")
+    p.add_argument("fpr", help="Desired fpr(s)", type=float, metavar="FPR", nargs="+")
+    p.add_argument(
+        "-a",
+        "--analytical",
+        dest="method",
+        help=(
+            "calculate the thresholds from the exact score distribution, "
+            "using the nucleotide frequencies of the background sequences"
+        ),
+        action="store_const",
+        const="analytical",
+        default="empirical",
+    )
     p.set_defaults(func=commands.threshold)
 
     # motif_localization_plots.py
@@ -622,4 +646,7 @@ def cli(sys_args):
                     print("Alternatively, you can specify a FASTA file.")
                     exit(1)
 
+        if getattr(args, "ncpus", None) is not None:
+            set_pool_size(args.ncpus)
+
         args.func(args)
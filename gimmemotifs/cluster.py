@@ -4,12 +4,14 @@
 # the terms of the MIT License, see the file COPYING included with this
 # distribution.
 """Module for motif clustering."""
+import heapq
 import os
 import sys
 import logging
 
 import jinja2
 from datetime import datetime
+import numpy as np
 
 # GimmeMotifs imports
 from gimmemotifs.config import MotifConfig
@@ -95,6 +97,7 @@ def cluster_motifs(
     include_bg=True,
     progress=True,
     ncpus=None,
+    tmpdir=None,
 ):
     """
     Clusters a set of sequence motifs. Required arg 'motifs' is a file containing
@@ -126,6 +129,10 @@ def cluster_motifs(
     be kept, or if it should be averaged with background frequencies. Should
     probably be left set to True.
 
+    The scores of all pairs of motifs are kept in a memory-mapped
+    SimilarityStore in the directory 'tmpdir'. By default a temporary directory
+    is used.
+
     """
 
     # First read pfm or pfm formatted motiffile
@@ -141,47 +148,74 @@ def cluster_motifs(
 
     # Make a MotifTree node for every motif
     nodes = [MotifTree(m) for m in motifs]
-
-    # Determine all pairwise scores and maxscore per motif
-    scores = {}
-    motif_nodes = dict([(n.motif.id, n) for n in nodes])
     motifs = [n.motif for n in nodes]
 
+    def cluster_scores(scores):
+        # Scores as float64, higher is better, -inf if there is no score
+        scores = np.array(scores, dtype=np.float64)
+        if pval:
+            scores = 1 - scores
+        scores[np.isnan(scores)] = -np.inf
+        return scores
+
     if progress:
         sys.stderr.write("Calculating initial scores\n")
-    result = mc.get_all_scores(
-        motifs, motifs, match, metric, combine, pval, parallel=True, ncpus=ncpus
+    store = mc.get_similarity_store(
+        motifs, match, metric, combine, pval, dirname=tmpdir, ncpus=ncpus
     )
+    maxscores = cluster_scores(np.diagonal(store.scores))
+    for node, maxscore in zip(nodes, maxscores):
+        node.maxscore = float(maxscore)
+
+    # Every active node has a slot in the store. A merged node is replaced by
+    # the new node, which gets the slot of the first node, and its row holds
+    # the scores with the active nodes. The scores of a row are valid for the
+    # nodes that existed when the node of the row was created. The heap holds
+    # the best score of every row, the pair with the highest score is merged.
+    # Of equal scores the pair of the newest node and target is merged
+    # first. Heap entries of merged nodes are removed or updated when they
+    # are popped.
+    slot_nodes = np.arange(len(nodes))
+    created = np.full(len(nodes), len(nodes))
+    active = np.ones(len(nodes), dtype=bool)
+    heap = []
+
+    def push_best(s):
+        row_scores = cluster_scores(store.scores[s])
+        valid = active & (slot_nodes < created[s])
+        valid[s] = False
+        if not valid.any():
+            return
+        row_scores[~valid] = np.nan
+        best = np.nanmax(row_scores)
+        ties = np.nonzero(row_scores == best)[0]
+        t = ties[np.argmax(slot_nodes[ties])]
+        heapq.heappush(
+            heap, (-best, -slot_nodes[s], -slot_nodes[t], slot_nodes[s], slot_nodes[t])
+        )
 
-    for m1, other_motifs in result.items():
-        for m2, score in other_motifs.items():
-            if m1 == m2:
-                if pval:
-                    motif_nodes[m1].maxscore = 1 - score[0]
-                else:
-                    motif_nodes[m1].maxscore = score[0]
-            else:
-                if pval:
-                    score = [1 - score[0]] + score[1:]
-                scores[(motif_nodes[m1], motif_nodes[m2])] = score
-
-    cluster_nodes = [node for node in nodes]
-    ave_count = 1
-
-    total = len(cluster_nodes)
-
-    while len(cluster_nodes) > 1:
-        length = sorted(scores.keys(), key=lambda x: scores[x][0])
-        i = -1
-        (n1, n2) = length[i]
-        while n1 not in cluster_nodes or n2 not in cluster_nodes:
-            i -= 1
-            (n1, n2) = length[i]
+    try:
+        for s in range(len(nodes)):
+            push_best(s)
+
+        slots = dict((i, i) for i in range(len(nodes)))
+        ave_count = 1
+        total = len(nodes)
+        while heap and active.sum() > 1:
+            score, _, _, i, k = heapq.heappop(heap)
+            s, t = slots.get(i), slots.get(k)
+            if s is None:
+                continue
+            if t is None:
+                push_best(s)
+                continue
+            n1, n2 = nodes[i], nodes[k]
+            pos, orientation = store.positions[s, t], store.strands[s, t]
+            del slots[i], slots[k]
+            active[t] = False
 
-        if len(n1.motif) > 0 and len(n2.motif) > 0:
-            (score, pos, orientation) = scores[(n1, n2)]
             ave_motif = n1.motif.average_motifs(
-                n2.motif, pos, orientation, include_bg=include_bg
+                n2.motif, int(pos), int(orientation), include_bg=include_bg
             )
 
             ave_motif.trim(edge_ic_cutoff)
@@ -206,44 +240,48 @@ def cluster_motifs(
                     new_node.motif, new_node.motif, match, metric, combine, pval
                 )[0]
 
-            new_node.mergescore = score
+            new_node.mergescore = -float(score)
 
             n1.parent = new_node
             n2.parent = new_node
             new_node.left = n1
             new_node.right = n2
 
-            cmp_nodes = dict([(node.motif, node) for node in nodes if not node.parent])
+            active[s] = False
+            targets = np.nonzero(active)[0]
 
             if progress:
-                progress = (1 - len(cmp_nodes) / float(total)) * 100
+                percentage = (1 - len(targets) / float(total)) * 100
                 sys.stderr.write(
                     "\rClustering [{0}{1}] {2}%".format(
-                        "#" * (int(progress) // 10),
-                        " " * (10 - int(progress) // 10),
-                        int(progress),
+                        "#" * (int(percentage) // 10),
+                        " " * (10 - int(percentage) // 10),
+                        int(percentage),
                     )
                 )
 
-            result = mc.get_all_scores(
-                [new_node.motif],
-                list(cmp_nodes.keys()),
-                match,
-                metric,
-                combine,
-                pval,
-                parallel=True,
+            row = np.full((1, len(active)), np.nan)
+            store.write(slice(s, s + 1), slice(None), row, row, row)
+            store.write(
+                [s],
+                targets,
+                *mc.get_all_score_arrays(
+                    [new_node.motif],
+                    [nodes[slot_nodes[t]].motif for t in targets],
+                    match,
+                    metric,
+                    combine,
+                    pval,
+                    parallel=False,
+                )
             )
-
-            for motif, n in cmp_nodes.items():
-                x = result[new_node.motif.id][motif.id]
-                if pval:
-                    x = [1 - x[0]] + x[1:]
-                scores[(new_node, n)] = x
-
+            slots[len(nodes)] = s
+            slot_nodes[s] = created[s] = len(nodes)
+            active[s] = True
             nodes.append(new_node)
-
-        cluster_nodes = [node for node in nodes if not node.parent]
+            push_best(s)
+    finally:
+        store.close()
 
     if progress:
         sys.stderr.write("\n")
@@ -13,11 +13,12 @@ from gimmemotifs.plot import match_plot
 
 def match(args):
     sample = dict([(m.id, m) for m in read_motifs(args.pfmfile)])
-    db = dict([(m.id, m) for m in read_motifs(args.dbpfmfile)])
+    # Motifs are only created for the matches
+    db = read_motifs(args.dbpfmfile, lazy=True)
 
     mc = MotifComparer()
     result = mc.get_best_matches(
-        sample.values(), args.nmatches, db.values(), "partial", "seqcor", "mean"
+        list(sample.values()), args.nmatches, args.dbpfmfile, "partial", "seqcor"
     )
 
     plotdata = []
@@ -25,10 +26,8 @@ def match(args):
     for motif_name, matches in result.items():
         for match in matches:
 
-            pval, pos, orient = mc.compare_motifs(
-                sample[motif_name], db[match[0]], "partial", "seqcor", "mean", pval=True
-            )
-            print("%s\t%s\t%0.2f\t%0.3e" % (motif_name, match[0], match[1][0], pval))
+            score, pos, orient, pval = match[1]
+            print("%s\t%s\t%0.2f\t%0.3e" % (motif_name, match[0], score, pval))
             motif = sample[motif_name]
             dbmotif = db[match[0]]
 
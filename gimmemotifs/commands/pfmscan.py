@@ -34,4 +34,5 @@ def pfmscan(args):
         ncpus=args.ncpus,
         zscore=args.zscore,
         gcnorm=args.gcnorm,
+        hit_pvalue=args.hit_pvalue,
     )
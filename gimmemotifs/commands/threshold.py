@@ -12,23 +12,51 @@ from gimmemotifs.scanner import Scanner
 
 
 def threshold(args):
-    """Calculate motif score threshold for a given FPR."""
-    if args.fpr < 0 or args.fpr > 1:
-        print("Please specify a FPR between 0 and 1")
-        sys.exit(1)
+    """Calculate motif score thresholds for one or more FPRs.
 
-    motifs = read_motifs(args.pfmfile)
+    With a single FPR the output has the columns Motif, Score and Cutoff.
+    With several FPRs there is a Score_<FPR> and a Cutoff_<FPR> column for
+    every FPR. Both can be used with 'gimme scan -c'.
+    """
+    fprs = args.fpr
+    if not isinstance(fprs, list):
+        fprs = [fprs]
+    for fpr in fprs:
+        if fpr <= 0 or fpr >= 1:
+            print("Please specify a FPR between 0 and 1")
+            sys.exit(1)
+
+    motifs = []
+    for pfmfile in args.pfmfile.split(","):
+        motifs += read_motifs(pfmfile)
 
     s = Scanner()
-    s.set_motifs(args.pfmfile)
-    s.set_threshold(args.fpr, filename=args.inputfile)
+    s.set_motifs(motifs)
+    s.set_background(fname=args.inputfile)
+
+    # The background is scanned once, the thresholds of all FPRs are
+    # determined from the same score distribution.
+    scores = {}
+    for fpr in fprs:
+        s.set_threshold(fpr=fpr, method=args.method)
+        scores[fpr] = s.threshold
+
+    if len(fprs) == 1:
+        print("Motif\tScore\tCutoff")
+    else:
+        header = ["Motif"]
+        for fpr in fprs:
+            header += ["Score_{}".format(fpr), "Cutoff_{}".format(fpr)]
+        print("\t".join(header))
 
-    print("Motif\tScore\tCutoff")
     for motif in motifs:
         min_score = motif.pwm_min_score()
         max_score = motif.pwm_max_score()
-        opt_score = s.threshold[motif.id]
-        if opt_score is None:
-            opt_score = motif.pwm_max_score()
-        threshold = (opt_score - min_score) / (max_score - min_score)
-        print("{0}\t{1}\t{2}".format(motif.id, opt_score, threshold))
+        row = [motif.id]
+        for fpr in fprs:
+            opt_score = scores[fpr][motif.id]
+            if opt_score is None:
+                opt_score = motif.pwm_max_score()
+            threshold = (opt_score - min_score) / (max_score - min_score)
+            row += [opt_score, threshold]
+        print("\t".join(str(x) for x in row))
@@ -12,6 +12,9 @@ from __future__ import print_function
 import sys
 import os
 import logging
+import glob
+import shutil
+import tempfile
 
 # External imports
 from scipy.stats import norm, entropy, chi2_contingency
@@ -22,15 +25,29 @@ from sklearn.feature_selection import RFE
 from sklearn.model_selection import train_test_split, cross_val_score
 from sklearn.metrics import average_precision_score, roc_auc_score
 import pandas as pd
+import six
+import xxhash
 
 
 # GimmeMotifs imports
+from gimmemotifs.cache import MemoryCache
 from gimmemotifs.config import MotifConfig
-from gimmemotifs.c_metrics import pfmscan, score
-from gimmemotifs.motif import parse_motifs, read_motifs
-from gimmemotifs.utils import pfmfile_location
-
-# pool import is at the bottom
+from gimmemotifs.c_metrics import pfmscan_scores, score
+from gimmemotifs.motif import (
+    MAX_LOADED_DBS,
+    Motif,
+    load_motif_db,
+    parse_motifs,
+    read_motifs,
+)
+from gimmemotifs.pool import get_pool, get_shared, share
+from gimmemotifs.utils import (
+    pfmfile_location,
+    encode_seq,
+    cached_file_locations,
+    load_cached,
+    save_atomic,
+)
 
 try:
     import copy_reg
@@ -227,6 +244,195 @@ def ssd(p1, p2):
     return 2 - np.sum([(a - b) ** 2 for a, b in zip(p1, p2)])
 
 
+def _pfm_scores(codes, pfm):
+    """Return the forward strand score of every position of an encoded sequence."""
+    pfm = np.array(pfm, dtype=np.float64)
+    scores = np.empty(max(0, len(codes) - len(pfm) + 1))
+    pfmscan_scores(codes, pfm, scores)
+    return scores
+
+
+# Metrics and combine functions of all_pairs_scores()
+ARRAY_METRICS = ("pcc", "ed", "distance", "wic")
+ARRAY_COMBINE = ("mean", "sum")
+
+# Maximum size of the arrays of one block of motifs or motif pairs
+DEFAULT_BLOCK_BYTES = 2 ** 26
+
+# Minimum number of motif pairs that is divided over the worker pool
+PARALLEL_PAIRS = 100000
+
+
+# Maximum number of motifs of which the seqcor scores are cached
+SEQCOR_CACHE_SIZE = 2048
+
+_seqcor_profiles = MemoryCache(SEQCOR_CACHE_SIZE)
+
+
+def _seqcor_profile(motif, seq, codes):
+    """Return the scores of a motif and of its reverse complement on seq.
+
+    The scores are cached by motif hash.
+    """
+    key = (motif.hash(), seq)
+    profile = _seqcor_profiles.get(key)
+    if profile is None:
+        profile = (_pfm_scores(codes, motif.pwm), _pfm_scores(codes, motif.rc().pwm))
+        for scores in profile:
+            scores.flags.writeable = False
+        _seqcor_profiles.set(key, profile)
+    return profile
+
+
+def _profile_matrix(profiles, size):
+    """Return centered score profiles as an array of shape (N, size)."""
+    matrix = np.zeros((len(profiles), size))
+    for i, profile in enumerate(profiles):
+        if len(profile) > 0:
+            matrix[i, : len(profile)] = profile - profile.mean()
+    return matrix
+
+
+def _prefix_sums(matrix):
+    """Return the cumulative sums of the rows and of their squares."""
+    sums = np.zeros((2, len(matrix), matrix.shape[1] + 1))
+    sums[0, :, 1:] = np.cumsum(matrix, axis=1)
+    sums[1, :, 1:] = np.cumsum(matrix ** 2, axis=1)
+    return sums
+
+
+def _window_correlations(x, y, len1, len2, shift):
+    """Return the correlation of every pair of score profiles.
+
+    Profile x[:n] is correlated with y[shift:shift + n], where n is
+    size - max(len1, len2) - shift, as in seqcor(). The profiles are given
+    as tuples of the profile matrix and its _prefix_sums().
+    """
+    (x, xsums), (y, ysums) = x, y
+    size = x.shape[1]
+    n = size - np.maximum(len1[:, None], len2[None, :]) - shift
+    columns = np.arange(size - shift)
+
+    # Columns outside the window of a pair are 0 in one of the profiles
+    xw = x[:, : size - shift] * (columns < (size - len1 - shift)[:, None])
+    yw = y[:, shift:] * (columns < (size - len2 - shift)[:, None])
+    sxy = xw.dot(yw.T)
+
+    sx, sxx = np.take_along_axis(xsums, n[None], axis=2)
+    sy, syy = np.take_along_axis(ysums, (n.T + shift)[None], axis=2).transpose(0, 2, 1)
+    sy, syy = sy - ysums[0, :, shift], syy - ysums[1, :, shift]
+
+    return _correlation(sxy, sx, sxx, sy, syy, n)
+
+
+def _correlation(sxy, sx, sxx, sy, syy, n):
+    """Return the correlation of n values from sums of products and squares."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = sxy - sx * sy / n
+        var = (sxx - sx ** 2 / n) * (syy - sy ** 2 / n)
+        return cov / np.sqrt(var)
+
+
+def _update_best(best, positions, strands, scores, pos, strand):
+    # Of equal scores the last one is used, as by sorted() in seqcor()
+    scores = np.where(np.isnan(scores), -np.inf, scores)
+    tolerance = 1e-12 * np.maximum(1, np.abs(best))
+    with np.errstate(invalid="ignore"):
+        update = scores >= best - tolerance
+    best[update] = scores[update]
+    positions[update] = pos
+    strands[update] = strand
+
+
+def _seqcor_block(x, y, rc, len1, len2):
+    """Return the best seqcor score, position and strand of a block of pairs."""
+    best = np.full((len(x), len(y)), -np.inf)
+    positions = np.zeros(best.shape, dtype=np.int64)
+    strands = np.zeros(best.shape, dtype=np.int64)
+    x, y, rc = [(matrix, _prefix_sums(matrix)) for matrix in [x, y, rc]]
+
+    # Motif 2 is shifted relative to motif 1
+    max_shift1 = len1 - len1 // 3
+    for shift in range(max_shift1.max(initial=0)):
+        invalid = (shift >= max_shift1)[:, None]
+        for strand, matrix in [(1, y), (-1, rc)]:
+            scores = _window_correlations(x, matrix, len1, len2, shift)
+            scores[np.broadcast_to(invalid, scores.shape)] = np.nan
+            _update_best(best, positions, strands, scores, shift, strand)
+
+    # Motif 1 is shifted relative to motif 2
+    max_shift2 = len2 - len2 // 3
+    for shift in range(max_shift2.max(initial=0)):
+        invalid = (shift >= max_shift2)[None, :]
+        for strand, matrix in [(1, y), (-1, rc)]:
+            scores = _window_correlations(matrix, x, len2, len1, shift).T
+            scores[np.broadcast_to(invalid, scores.shape)] = np.nan
+            _update_best(best, positions, strands, scores, -shift, strand)
+
+    best[np.isinf(best)] = np.nan
+    return best, positions, strands
+
+
+def seqcor_scores(motifs1, motifs2, seq=None, block_bytes=DEFAULT_BLOCK_BYTES):
+    """Calculate the seqcor similarity of every pair of motifs.
+
+    The motif scores on the sequence are calculated once per motif and
+    cached. The correlations at all shifts are calculated for all pairs of
+    motifs at once, as normalized dot products of the score profiles. The
+    result is the same as seqcor(), except for rounding.
+
+    Parameters
+    ----------
+    motifs1, motifs2 : list
+        Lists of Motif instances.
+
+    seq : str, optional
+        Sequence to use for scanning instead of k=7 de Bruijn sequence.
+
+    block_bytes : int, optional
+        Maximum size in bytes of the score profiles of a block of motifs.
+        Motifs are compared in blocks of this size.
+
+    Returns
+    -------
+    scores : numpy.ndarray
+        Array of shape (len(motifs1), len(motifs2)) with the best correlation
+        of every pair.
+
+    positions : numpy.ndarray
+        Position of motif 2 relative to motif 1 of the best correlation.
+
+    strands : numpy.ndarray
+        Strand of motif 2 of the best correlation, 1 or -1.
+    """
+    if seq is None:
+        seq = RCDB
+    size = len(seq)
+    codes = encode_seq(seq)
+
+    len1 = np.array([len(m) for m in motifs1], dtype=np.int64)
+    len2 = np.array([len(m) for m in motifs2], dtype=np.int64)
+    scores = np.full((len(motifs1), len(motifs2)), np.nan)
+    positions = np.zeros(scores.shape, dtype=np.int64)
+    strands = np.zeros(scores.shape, dtype=np.int64)
+
+    step = max(1, block_bytes // (size * 8))
+    for i in range(0, len(motifs1), step):
+        block1 = slice(i, i + step)
+        profiles = [_seqcor_profile(m, seq, codes)[0] for m in motifs1[block1]]
+        x = _profile_matrix(profiles, size)
+        for j in range(0, len(motifs2), step):
+            block2 = slice(j, j + step)
+            profiles = [_seqcor_profile(m, seq, codes) for m in motifs2[block2]]
+            y = _profile_matrix([p[0] for p in profiles], size)
+            rc = _profile_matrix([p[1] for p in profiles], size)
+            best, pos, strand = _seqcor_block(x, y, rc, len1[block1], len2[block2])
+            scores[block1, block2] = best
+            positions[block1, block2] = pos
+            strands[block1, block2] = strand
+    return scores, positions, strands
+
+
 def seqcor(m1, m2, seq=None):
     """Calculates motif similarity based on Pearson correlation of scores.
 
@@ -250,73 +456,782 @@ def seqcor(m1, m2, seq=None):
     -------
     score, position, strand
     """
-    l1 = len(m1)
-    l2 = len(m2)
+    scores, positions, strands = seqcor_scores([m1], [m2], seq)
+    return [scores[0, 0], int(positions[0, 0]), int(strands[0, 0])]
 
-    length = max(l1, l2)
 
-    if seq is None:
-        seq = RCDB
+MATCH_INDEX_VERSION = 2
+
+# Correlations of the index are approximate, database motifs with a score
+# within this margin of the best matches are compared again with seqcor_scores()
+MATCH_INDEX_MARGIN = 0.001
 
-    L = len(seq)
 
-    # Scan RC de Bruijn sequence
-    result1 = pfmscan(seq, m1.pwm, m1.pwm_min_score(), len(seq), False, True)
-    result2 = pfmscan(seq, m2.pwm, m2.pwm_min_score(), len(seq), False, True)
+class MatchIndex(object):
+    """Index of a motif database for fast seqcor matching.
 
-    # Reverse complement of motif 2
-    result3 = pfmscan(seq, m2.rc().pwm, m2.rc().pwm_min_score(), len(seq), False, True)
+    The index holds the seqcor score profiles of all motifs in the database
+    on the default de Bruijn sequence, centered and stored as float32. The
+    motifs are sorted by length. The index is created and stored next to the
+    motif file by load_match_index().
 
-    result1 = np.array(result1)
-    result2 = np.array(result2)
-    result3 = np.array(result3)
+    Attributes
+    ----------
+    ids : list
+        Motif ids, sorted by motif length.
+
+    lengths : numpy.ndarray
+        Motif lengths.
+
+    checksum : str
+        Checksum of the motif database the index was created from.
+    """
 
-    # Return maximum correlation
-    c = []
-    for i in range(l1 - l1 // 3):
-        c.append(
+    def __init__(self, arrays):
+        self.checksum = str(arrays["checksum"])
+        self.ids = [str(motif_id) for motif_id in arrays["ids"]]
+        self.lengths = np.asarray(arrays["lengths"], dtype=np.int64)
+        self._profiles = arrays["profiles"]
+        self._sums = arrays["sums"]
+
+    @classmethod
+    def from_motifs(cls, motifs, checksum=""):
+        """Create an index from a list of Motif instances."""
+        motifs = sorted(motifs, key=len)
+        size = len(RCDB)
+        codes = encode_seq(RCDB)
+        profiles = np.zeros((2, len(motifs), size), dtype=np.float32)
+        for i, motif in enumerate(motifs):
+            for strand, pwm in enumerate([motif.pwm, motif.rc().pwm]):
+                # The last score is never part of a correlation window
+                scores = _pfm_scores(codes, pwm)
+                scores = scores[: size - len(motif)] - scores.mean()
+                profiles[strand, i, : len(scores)] = scores
+        sums = np.array(
             [
-                1
-                - distance.correlation(
-                    result1[: L - length - i], result2[i : L - length]
-                ),
-                i,
-                1,
+                profiles.sum(axis=2, dtype=np.float64),
+                (profiles.astype(np.float64) ** 2).sum(axis=2),
             ]
         )
-        c.append(
-            [
-                1
-                - distance.correlation(
-                    result1[: L - length - i], result3[i : L - length]
-                ),
-                i,
-                -1,
-            ]
+        return cls(
+            {
+                "checksum": checksum,
+                "ids": [m.id for m in motifs],
+                "lengths": np.array([len(m) for m in motifs], dtype=np.int64),
+                "profiles": profiles,
+                "sums": sums,
+            }
         )
-    for i in range(l2 - l2 // 3):
-        c.append(
-            [
-                1
-                - distance.correlation(
-                    result1[i : L - length], result2[: L - length - i]
-                ),
-                -i,
-                1,
-            ]
+
+    @classmethod
+    def load(cls, fname):
+        """Load an index saved with save().
+
+        The profiles are memory-mapped. Raises ValueError if the file was
+        saved by another version.
+        """
+        with np.load(fname, allow_pickle=False) as data:
+            if int(data["version"]) != MATCH_INDEX_VERSION:
+                raise ValueError("unsupported match index version")
+            arrays = {name: data[name] for name in data.files}
+        profiles_file = _match_profiles_file(fname, str(arrays["checksum"]))
+        arrays["profiles"] = np.load(profiles_file, mmap_mode="r")
+        if arrays["profiles"].shape[:2] != (2, len(arrays["ids"])):
+            raise ValueError("match index profiles don't match the index")
+        return cls(arrays)
+
+    def save(self, fname):
+        """Save the index to an (uncompressed) .npz file.
+
+        The profiles are saved to a separate .npy file, so that they can be
+        memory-mapped by load(). Both files are replaced atomically, so that
+        other processes never read an incomplete index.
+        """
+        profiles_file = _match_profiles_file(fname, self.checksum)
+        save_atomic(profiles_file, lambda f: np.save(f, self._profiles))
+        save_atomic(
+            fname,
+            lambda f: np.savez(
+                f,
+                version=np.array(MATCH_INDEX_VERSION),
+                checksum=np.array(self.checksum),
+                ids=np.array(self.ids, dtype=str),
+                lengths=self.lengths,
+                sums=self._sums,
+            ),
         )
-        c.append(
-            [
-                1
-                - distance.correlation(
-                    result1[i : L - length], result3[: L - length - i]
-                ),
-                -i,
-                -1,
+
+        # Profiles of earlier versions of the motif database
+        for old_file in glob.glob(glob.escape(os.path.splitext(fname)[0]) + ".*.npy"):
+            if old_file != profiles_file:
+                os.unlink(old_file)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __repr__(self):
+        return "<MatchIndex with {} motifs>".format(len(self))
+
+    def scores(self, motifs, block_bytes=DEFAULT_BLOCK_BYTES):
+        """Return the approximate seqcor scores of motifs with all indexed motifs.
+
+        Parameters
+        ----------
+        motifs : list
+            List of Motif instances.
+
+        block_bytes : int, optional
+            Maximum size in bytes of the shifted score profiles of a block of
+            motifs. Motifs are compared in blocks of this size.
+
+        Returns
+        -------
+        scores, positions, strands : numpy.ndarray
+            Arrays of shape (len(motifs), len(index)) as returned by
+            seqcor_scores(). Motifs are in the order of the index ids. The
+            scores are calculated in single precision.
+        """
+        size = self._profiles.shape[2]
+        max_length = max([len(m) for m in motifs] + [self.lengths.max(initial=0)])
+        scores = np.full((len(motifs), len(self)), np.nan)
+        positions = np.zeros(scores.shape, dtype=np.int64)
+        strands = np.zeros(scores.shape, dtype=np.int64)
+
+        step = max(1, block_bytes // (2 * max_length * size * 4))
+        for i in range(0, len(motifs), step):
+            block = slice(i, i + step)
+            best, pos, strand = self._block_scores(motifs[block])
+            scores[block] = best
+            positions[block] = pos
+            strands[block] = strand
+        return scores, positions, strands
+
+    def _block_scores(self, motifs):
+        size = self._profiles.shape[2]
+        len1 = np.array([len(m) for m in motifs], dtype=np.int64)
+        len2 = self.lengths
+        codes = encode_seq(RCDB)
+        x = _profile_matrix([_seqcor_profile(m, RCDB, codes)[0] for m in motifs], size)
+        x[np.arange(size) >= size - len1[:, None]] = 0
+        xsums = _prefix_sums(x)
+        longest = np.maximum(len1[:, None], len2[None, :])
+        max_shift1 = len1 - len1 // 3
+        max_shift2 = len2 - len2 // 3
+
+        # All shifted profiles of motif 1 are compared to the index at once,
+        # row d of shifted is x[k + d].
+        first = 1 - max_shift1.max(initial=0)
+        shifted = np.zeros((max_shift2.max(initial=0) - first, len(x), size))
+        for d in range(first, first + len(shifted)):
+            if d < 0:
+                shifted[d - first, :, -d:] = x[:, : size + d]
+            else:
+                shifted[d - first, :, : size - d] = x[:, d:]
+        shifted = shifted.reshape(-1, size).astype(np.float32)
+
+        # Sums of the first and last columns of the indexed profiles, all
+        # other sums follow from the totals
+        width = 2 * longest.max(initial=0) + 2
+        products, heads, tails = [], [], []
+        for profiles in self._profiles:
+            product = np.matmul(shifted, profiles.T)
+            products.append(product.reshape(-1, len(x), len(len2)))
+            heads.append(_prefix_sums(profiles[:, :width].astype(np.float64)))
+            tails.append(
+                _prefix_sums(profiles[:, : -width - 1 : -1].astype(np.float64))
+            )
+
+        def window_sums(strand, start, end):
+            # Sums of the indexed profile columns start to size - end
+            totals = self._sums[:, strand][:, None, :]
+            tail = np.take_along_axis(tails[strand], end.T[None], axis=2)
+            return totals - tail.transpose(0, 2, 1) - heads[strand][:, None, :, start]
+
+        best = np.full((len(x), len(len2)), -np.inf)
+        positions = np.zeros(best.shape, dtype=np.int64)
+        strands = np.zeros(best.shape, dtype=np.int64)
+
+        # Motif 2 is shifted relative to motif 1
+        for shift in range(max_shift1.max(initial=0)):
+            n = size - longest - shift
+            sx, sxx = np.take_along_axis(xsums, n[None], axis=2)
+            # Columns of motif 1 that are not part of the window, the last
+            # columns of the indexed profiles are 0
+            extra = size - len1[:, None] - shift + np.arange(shift)
+            xe = np.take_along_axis(x, extra, axis=1)
+            for strand, orient in enumerate([1, -1]):
+                ye = self._profiles[strand][:, np.minimum(extra + shift, size - 1)]
+                sxy = products[strand][-shift - first] - np.einsum("qs,nqs->qn", xe, ye)
+                sy, syy = window_sums(strand, shift, longest)
+                scores = _correlation(sxy, sx, sxx, sy, syy, n)
+                scores[shift >= max_shift1] = np.nan
+                _update_best(best, positions, strands, scores, shift, orient)
+
+        # Motif 1 is shifted relative to motif 2
+        for shift in range(max_shift2.max(initial=0)):
+            n = size - longest - shift
+            sx, sxx = (
+                np.take_along_axis(xsums, (size - longest)[None], axis=2)
+                - xsums[:, :, shift : shift + 1]
+            )
+            # Columns of motif 2 that are not part of the window, the last
+            # columns of x are 0
+            extra = size - len2[:, None] - shift + np.arange(shift)
+            xe = x[:, np.minimum(extra + shift, size - 1)]
+            for strand, orient in enumerate([1, -1]):
+                ye = np.take_along_axis(self._profiles[strand], extra, axis=1)
+                sxy = products[strand][shift - first] - np.einsum("qns,ns->qn", xe, ye)
+                sy, syy = window_sums(strand, 0, longest + shift)
+                scores = _correlation(sxy, sx, sxx, sy, syy, n)
+                scores[:, shift >= max_shift2] = np.nan
+                _update_best(best, positions, strands, scores, -shift, orient)
+
+        best[np.isinf(best)] = np.nan
+        return best, positions, strands
+
+    def best_matches(self, motifs, dbmotifs, nmatches=1):
+        """Return the best seqcor matches of motifs in the index.
+
+        Parameters
+        ----------
+        motifs : list
+            List of Motif instances.
+
+        dbmotifs : MotifDatabase or dict
+            The indexed motifs, by id.
+
+        nmatches : int, optional
+            Number of matches to return, default is 1.
+
+        Returns
+        -------
+        dict
+            For every motif id a list of matches [id, [score, position,
+            strand]], best match first. The scores are the same as those of
+            seqcor_scores().
+        """
+        approx = self.scores(motifs)[0]
+        approx = np.where(np.isnan(approx), -np.inf, approx)
+        matches = {}
+        for motif, row in zip(motifs, approx):
+            # Candidates are compared again in double precision
+            k = min(nmatches, len(row))
+            if k == 0:
+                matches[motif.id] = []
+                continue
+            cutoff = np.partition(row, len(row) - k)[len(row) - k]
+            candidates = np.nonzero(row >= cutoff - MATCH_INDEX_MARGIN)[0]
+            candidates = [dbmotifs[self.ids[i]] for i in candidates]
+            scores, positions, strands = seqcor_scores([motif], candidates)
+            result = [
+                [m.id, [float(score), int(pos), int(strand)]]
+                for m, score, pos, strand in zip(
+                    candidates, scores[0], positions[0], strands[0]
+                )
             ]
+            result = sorted(result, key=lambda x: x[1][0], reverse=True)
+            matches[motif.id] = result[:nmatches]
+        return matches
+
+
+# Indexes that are loaded in this process, by filename
+_match_indexes = MemoryCache(MAX_LOADED_DBS)
+
+
+def _match_profiles_file(fname, checksum):
+    """Return the filename of the profiles of the match index fname."""
+    return "{}.{}.npy".format(os.path.splitext(fname)[0], checksum)
+
+
+def load_match_index(infile=None):
+    """Load the match index of a motif file in pfm format.
+
+    The index is created when it doesn't exist, or when the motif database
+    has changed since it was created, see load_motif_db().
+
+    Parameters
+    ----------
+    infile : str, optional
+        Motif database name or filename of motif file. By default the
+        motif database in the config file is used.
+
+    Returns
+    -------
+    MatchIndex
+        Match index.
+    """
+    fname = pfmfile_location(infile)
+    db = load_motif_db(fname)
+
+    def create():
+        logger.info("creating match index of %s", fname)
+        return MatchIndex.from_motifs(db, db.checksum)
+
+    return load_cached(
+        _match_indexes,
+        os.path.abspath(fname),
+        db.checksum,
+        cached_file_locations(fname, ".match.npz", "match_index"),
+        MatchIndex.load,
+        create,
+    )
+
+
+def _pad_matrices(matrices):
+    """Return matrices as an array of shape (N, Lmax, 4) and their lengths."""
+    matrices = [m.pwm if isinstance(m, Motif) else m for m in matrices]
+    lengths = np.array([len(m) for m in matrices], dtype=np.int64)
+    padded = np.full((len(matrices), max(1, lengths.max(initial=0)), 4), 0.25)
+    for i, matrix in enumerate(matrices):
+        if len(matrix) > 0:
+            padded[i, : len(matrix)] = matrix
+    return padded, lengths
+
+
+def _rc_matrices(padded, lengths):
+    """Return the reverse complement of padded matrices."""
+    rc = np.full_like(padded, 0.25)
+    for i, length in enumerate(lengths):
+        rc[i, :length] = padded[i, :length][::-1, ::-1]
+    return rc
+
+
+def _column_sum(values):
+    # Sum of the last axis in the order of the C implementation
+    total = values[..., 0].copy()
+    for n in range(1, values.shape[-1]):
+        total += values[..., n]
+    return total
+
+
+def _float32_sum(values):
+    # Sum of the last axis with a float accumulator, as in the C pcc()
+    total = np.zeros(values.shape[:-1], dtype=np.float32)
+    for n in range(values.shape[-1]):
+        total = (total.astype(np.float64) + values[..., n]).astype(np.float32)
+    return total
+
+
+def _column_scores(metric, x, y):
+    """Return the score of every column of x with every column of y.
+
+    Parameters
+    ----------
+    metric : str
+        One of ARRAY_METRICS.
+
+    x, y : numpy.ndarray
+        Matrices of shape (N1, L1, 4) and (N2, L2, 4).
+
+    Returns
+    -------
+    numpy.ndarray
+        Scores of shape (N1, N2, L1, L2), calculated as by score() in
+        c_metrics.
+    """
+    x = x[:, None, :, None, :]
+    y = y[None, :, None, :, :]
+    if metric == "wic":
+        pseudo = 0.0000001
+        wx = (x + pseudo) / _column_sum(x + pseudo)[..., None]
+        wx = wx * np.log(wx / 0.25) / np.log(2.0)
+        wy = (y + pseudo) / _column_sum(y + pseudo)[..., None]
+        wy = wy * np.log(wy / 0.25) / np.log(2.0)
+        diff = _column_sum(np.abs(wx - wy))
+        return np.sqrt(_column_sum(wx) * _column_sum(wy)) - 2.5 * diff
+    if metric == "ed":
+        return -np.sqrt(_column_sum((x - y) ** 2))
+    if metric == "distance":
+        return -_column_sum((x - y) ** 2) / np.sqrt(2)
+    if metric == "pcc":
+        dx = x - (_column_sum(x) / 4)[..., None]
+        dy = y - (_column_sum(y) / 4)[..., None]
+        a = _float32_sum(dx * dy)
+        xy = _float32_sum(dx ** 2) * _float32_sum(dy ** 2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = a / np.sqrt(xy.astype(np.float64))
+        # A position without information has a score of 0
+        zero = (dx == 0).any(-1) | (dy == 0).any(-1)
+        return np.where(zero, 0.0, scores)
+    raise ValueError("Unknown metric '{}'".format(metric))
+
+
+def _diagonal_sums(cols):
+    """Return the sums of all diagonals of the last two axes.
+
+    Element pos + L2 - 1 of the result is the sum of the column scores of
+    column k of motif 1 with column k - pos of motif 2.
+    """
+    lmax1, lmax2 = cols.shape[-2:]
+    width = lmax1 + lmax2 - 1
+    skewed = np.zeros(cols.shape[:-1] + (width,))
+    skewed[..., :lmax2] = cols[..., ::-1]
+    # Row k of the view starts k elements earlier, the zeros at the end of
+    # the previous row are read instead of values before the start of a row
+    strides = skewed.strides[:-2] + (skewed.strides[-2] - skewed.strides[-1],)
+    strides += skewed.strides[-1:]
+    view = np.lib.stride_tricks.as_strided(
+        skewed, shape=skewed.shape, strides=strides, writeable=False
+    )
+    return view.sum(axis=-2)
+
+
+def _offset_scores(cols, bg1, bg2, len1, len2, match, combine):
+    """Return the score of every offset of every pair of motifs.
+
+    The score of motif 2 at position pos relative to motif 1 is calculated
+    as by MotifComparer.max_total(), max_partial() or max_subtotal().
+    Offsets that are not valid for a pair of motifs get a score of NaN.
+
+    Parameters
+    ----------
+    cols : numpy.ndarray
+        Column scores of shape (N1, N2, L1, L2), see _column_scores().
+
+    bg1, bg2 : numpy.ndarray
+        Scores of the columns of motif 1 with a background column, shape
+        (N1, L1), and of a background column with the columns of motif 2,
+        shape (N2, L2).
+
+    len1, len2 : numpy.ndarray
+        Motif lengths.
+
+    Returns
+    -------
+    offsets : numpy.ndarray
+        Offsets, from -(L2 - 1) to L1 - 1.
+
+    scores : numpy.ndarray
+        Scores of shape (N1, N2, number of offsets).
+    """
+    n1, n2, lmax1, lmax2 = cols.shape
+    offsets = np.arange(-(lmax2 - 1), lmax1)
+    pos = offsets[None, None, :]
+    l1 = len1[:, None, None]
+    l2 = len2[None, :, None]
+
+    # Columns beyond the motif length don't count
+    valid1 = np.arange(lmax1) < len1[:, None]
+    valid2 = np.arange(lmax2) < len2[:, None]
+    cols = cols * (valid1[:, None, :, None] & valid2[None, :, None, :])
+
+    # Sum of the aligned columns, column k of motif 1 with k - pos of 2
+    scores = _diagonal_sums(cols)
+    if match == "subtotal":
+        length = np.minimum(l1 - np.maximum(0, pos), l2 - np.maximum(0, -pos))
+        valid = (pos >= 4 - l2) & (pos <= l1 - 4)
+    else:
+        # Columns of motif 1 that are aligned to the background
+        prefix1 = np.zeros((n1, lmax1 + 1))
+        prefix1[:, 1:] = np.cumsum(bg1 * valid1, axis=1)
+        end1 = np.clip(np.minimum(l1, l2 + pos), 0, lmax1)
+        aligned1 = np.take_along_axis(prefix1, end1.reshape(n1, -1), axis=1)
+        aligned1 = (
+            aligned1.reshape(end1.shape)
+            - prefix1[:, np.maximum(0, offsets)][:, None, :]
         )
+        scores = scores + prefix1[:, -1, None, None] - aligned1
+        if match == "total":
+            # Columns of motif 2 that are aligned to the background
+            prefix2 = np.zeros((n2, lmax2 + 1))
+            prefix2[:, 1:] = np.cumsum(bg2 * valid2, axis=1)
+            end2 = np.clip(np.minimum(l2, l1 - pos), 0, lmax2).transpose(1, 0, 2)
+            aligned2 = np.take_along_axis(prefix2, end2.reshape(n2, -1), axis=1)
+            aligned2 = (
+                aligned2.reshape(end2.shape)
+                - prefix2[:, np.maximum(0, -offsets)][:, None, :]
+            )
+            scores = scores + (prefix2[:, -1, None, None] - aligned2).transpose(1, 0, 2)
+            length = np.maximum(np.maximum(0, -pos) + l1, np.maximum(0, pos) + l2)
+        else:
+            length = l1
+        valid = (pos >= 1 - l2) & (pos <= l1 - 1)
+    if combine == "mean":
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = scores / length
+    return offsets, np.where(valid, scores, np.nan)
+
+
+def _best_offsets(motifs1, motifs2, rc2, match, metric, combine):
+    """Return the best score, position and strand of a block of motif pairs."""
+    (x, len1), (y, len2) = motifs1, motifs2
+    bg = np.full((1, 1, 4), 0.25)
+
+    candidates = []
+    for matrices in [y, rc2]:
+        cols = _column_scores(metric, x, matrices)
+        bg1 = _column_scores(metric, x, bg)[:, 0, :, 0]
+        bg2 = _column_scores(metric, bg, matrices)[0, :, 0, :]
+        offsets, scores = _offset_scores(cols, bg1, bg2, len1, len2, match, combine)
+        if match == "subtotal":
+            # Motifs that are too short are compared by max_total()
+            short = (len1[:, None] < 4) | (len2[None, :] < 4)
+            if short.any():
+                _, total = _offset_scores(cols, bg1, bg2, len1, len2, "total", combine)
+                scores = np.where(short[:, :, None], total, scores)
+        candidates.append(scores)
+    scores = np.concatenate(candidates, axis=2)
+
+    # Scores of 0 are skipped. Of equal scores the last candidate is used,
+    # scores that differ only by rounding are considered equal.
+    scores[scores == 0] = np.nan
+    scores = np.where(np.isnan(scores), -np.inf, scores)
+    best = scores.max(axis=2)
+    tolerance = 1e-12 * np.maximum(1, np.abs(best))
+    ties = scores[:, :, ::-1] >= (best - tolerance)[:, :, None]
+    last = scores.shape[2] - 1 - np.argmax(ties, axis=2)
+    best = np.take_along_axis(scores, last[:, :, None], axis=2)[:, :, 0]
+    best[np.isinf(best)] = np.nan
+    positions = offsets[last % len(offsets)]
+    strands = np.where(last < len(offsets), 1, -1)
+    return best, positions, strands
+
+
+def all_pairs_scores(
+    motifs1,
+    motifs2,
+    match="total",
+    metric="wic",
+    combine="mean",
+    block_bytes=DEFAULT_BLOCK_BYTES,
+):
+    """Compare every motif of a list to every motif of another list.
+
+    All motifs are padded to arrays of the same length, and the scores of
+    all offsets and both strands are calculated with array operations. The
+    result is the same as MotifComparer.compare_motifs() for the pcc, ed,
+    distance and wic metrics, except for rounding.
+
+    Parameters
+    ----------
+    motifs1, motifs2 : list
+        Lists of Motif instances or of matrices of shape (length, 4). The pwm
+        of Motif instances is used.
+
+    match : str, optional
+        Match can be "partial", "subtotal" or "total".
+
+    metric : str, optional
+        Distance metric, one of ARRAY_METRICS.
+
+    combine : str, optional
+        Combine positional scores using "mean" or "sum".
+
+    block_bytes : int, optional
+        Maximum size in bytes of the column scores that are calculated at
+        once. Motif pairs are compared in blocks of this size.
+
+    Returns
+    -------
+    scores : numpy.ndarray
+        Array of shape (len(motifs1), len(motifs2)) with the best score of
+        every pair, or NaN if there is no score.
+
+    positions : numpy.ndarray
+        Position of motif 2 relative to motif 1 of the best score.
+
+    strands : numpy.ndarray
+        Strand of motif 2 of the best score, 1 or -1.
+    """
+    if metric not in ARRAY_METRICS:
+        raise ValueError("Unknown metric '{}'".format(metric))
+    if combine not in ARRAY_COMBINE:
+        raise ValueError("Unknown combine")
+    if match not in ["total", "partial", "subtotal"]:
+        raise ValueError("Unknown match")
+
+    x, len1 = _pad_matrices(motifs1)
+    y, len2 = _pad_matrices(motifs2)
+    rc = _rc_matrices(y, len2)
+
+    scores = np.full((len(x), len(y)), np.nan)
+    positions = np.zeros((len(x), len(y)), dtype=np.int64)
+    strands = np.zeros((len(x), len(y)), dtype=np.int64)
+
+    # Motifs are compared in blocks of motifs of similar length, sorted by
+    # length. Blocks are padded to their longest motif. The column score
+    # arrays take about 4 times the space.
+    order1 = np.argsort(len1, kind="stable")
+    order2 = np.argsort(len2, kind="stable")
+    step1 = 256
+    for i in range(0, len(x), step1):
+        rows = order1[i : i + step1]
+        lmax1 = max(1, len1[rows].max())
+        j = 0
+        while j < len(y):
+            step2 = len(y) - j
+            while step2 > 1:
+                lmax2 = max(1, len2[order2[j + step2 - 1]])
+                if len(rows) * step2 * lmax1 * lmax2 * 8 * 4 <= block_bytes:
+                    break
+                step2 //= 2
+            cols = order2[j : j + step2]
+            lmax2 = max(1, len2[cols].max())
+            best, pos, strand = _best_offsets(
+                (x[rows, :lmax1], len1[rows]),
+                (y[cols, :lmax2], len2[cols]),
+                rc[cols, :lmax2],
+                match,
+                metric,
+                combine,
+            )
+            block = np.ix_(rows, cols)
+            scores[block] = best
+            positions[block] = pos
+            strands[block] = strand
+            j += step2
+    return scores, positions, strands
+
+
+# Maximum and minimum number of motifs per row and column of a tile of a
+# SimilarityStore
+SIMILARITY_TILE = 1024
+SIMILARITY_MIN_TILE = 32
+
+
+class SimilarityStore(object):
+    """Scores of all pairs of a set of motifs, memory-mapped from disk.
+
+    The scores, positions and strands of the best match of every pair, as
+    returned by MotifComparer.get_all_score_arrays(), are stored in .npy
+    files in a directory. Scores are stored as float32, NaN if there is no
+    score. Positions and strands are stored as int8, or as int16 for motifs
+    of more than 128 positions. A store is filled with
+    MotifComparer.get_similarity_store().
+
+    Parameters
+    ----------
+    dirname : str
+        Directory of the store.
+
+    mode : str, optional
+        Mode to open the arrays with, "r" (default) or "r+".
+
+    Attributes
+    ----------
+    scores : numpy.memmap
+        float32 array of shape (n, n) with the scores.
+
+    positions, strands : numpy.memmap
+        Position and strand of the best match of every pair.
+    """
+
+    NAMES = ("scores", "positions", "strands")
+
+    def __init__(self, dirname, mode="r"):
+        self.dirname = dirname
+        self._temporary = False
+        self.scores, self.positions, self.strands = [
+            np.load(os.path.join(dirname, name + ".npy"), mmap_mode=mode)
+            for name in self.NAMES
+        ]
+
+    @classmethod
+    def create(cls, size, dirname=None, max_length=0):
+        """Create an empty store for size motifs.
+
+        Parameters
+        ----------
+        size : int
+            Number of motifs.
+
+        dirname : str, optional
+            Directory of the store, it is created if it doesn't exist. By
+            default a temporary directory is used, which is removed by
+            close().
+
+        max_length : int, optional
+            Length of the longest motif.
+
+        Returns
+        -------
+        SimilarityStore
+            Store, opened in "r+" mode, with all scores set to NaN.
+        """
+        temporary = dirname is None
+        if temporary:
+            dirname = tempfile.mkdtemp(prefix="gimme.similarity.")
+        elif not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        int_type = np.int8 if max_length <= 128 else np.int16
+        for name, dtype, value in zip(
+            cls.NAMES, [np.float32, int_type, int_type], [np.nan, 0, 0]
+        ):
+            array = np.lib.format.open_memmap(
+                os.path.join(dirname, name + ".npy"),
+                mode="w+",
+                dtype=dtype,
+                shape=(size, size),
+            )
+            array[:] = value
+            array.flush()
+            del array
+
+        store = cls(dirname, "r+")
+        store._temporary = temporary
+        return store
 
-    return sorted(c, key=lambda x: x[0])[-1]
+    def __len__(self):
+        return len(self.scores)
+
+    def __repr__(self):
+        return "<SimilarityStore of {} motifs in {}>".format(len(self), self.dirname)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, rows, cols, scores, positions, strands):
+        """Write the scores of a block of motif pairs.
+
+        Parameters
+        ----------
+        rows, cols : slice or numpy.ndarray
+            Rows and columns of the block.
+
+        scores, positions, strands : numpy.ndarray
+            Arrays as returned by MotifComparer.get_all_score_arrays().
+        """
+        if not isinstance(rows, slice) and not isinstance(cols, slice):
+            rows, cols = np.ix_(rows, cols)
+        self.scores[rows, cols] = scores
+        # Positions and strands of pairs without a score are undefined
+        for array, values in [(self.positions, positions), (self.strands, strands)]:
+            array[rows, cols] = np.where(np.isnan(scores), 0, values)
+
+    def flush(self):
+        """Write all changes to disk."""
+        for name in self.NAMES:
+            getattr(self, name).flush()
+
+    def close(self):
+        """Close the store. A temporary store is removed."""
+        if self.scores is None:
+            return
+        self.flush()
+        self.scores = self.positions = self.strands = None
+        if self._temporary:
+            shutil.rmtree(self.dirname, ignore_errors=True)
+
+
+def _similarity_tile(dirname, key, i, j, tile, match, metric, combine, pval):
+    """Fill one tile of a SimilarityStore, in a worker process."""
+    motifs = get_shared(key)
+    result = MotifComparer().get_all_score_arrays(
+        motifs[i : i + tile],
+        motifs[j : j + tile],
+        match,
+        metric,
+        combine,
+        pval,
+        parallel=False,
+    )
+    store = SimilarityStore(dirname, "r+")
+    store.write(slice(i, i + tile), slice(j, j + tile), *result)
+    store.close()
 
 
 class MotifComparer(object):
@@ -695,7 +1610,9 @@ class MotifComparer(object):
             Calculate p-vale of match.
 
         parallel : bool , optional
-            Use multiprocessing for parallel execution. True by default.
+            Use multiprocessing for parallel execution. True by default. The
+            seqcor, pcc, ed, distance and wic metrics are calculated with
+            array operations, see get_all_score_arrays().
 
         trim : float or None
             If a float value is specified, motifs are trimmed used this IC
@@ -716,17 +1633,28 @@ class MotifComparer(object):
             for m in dbmotifs:
                 m.trim(trim)
 
+        if metric == "seqcor" or (
+            isinstance(metric, str)
+            and metric in ARRAY_METRICS
+            and combine in ARRAY_COMBINE
+            and match in ["total", "partial", "subtotal"]
+        ):
+            return self._get_all_array_scores(
+                motifs, dbmotifs, match, metric, combine, pval, parallel, ncpus
+            )
+
         # hash of result scores
         scores = {}
 
+        pool = None
         if parallel:
-            # Divide the job into big chunks, to keep parallel overhead to minimum
-            # Number of chunks = number of processors available
             if ncpus is None:
                 ncpus = int(MotifConfig().get_default_params()["ncpus"])
+            pool = get_pool(ncpus)
 
-            pool = Pool(processes=ncpus, maxtasksperchild=1000)
-
+        if pool is not None:
+            # Divide the job into big chunks, to keep parallel overhead to minimum
+            # Number of chunks = number of processors available
             batch_len = len(dbmotifs) // ncpus
             if batch_len <= 0:
                 batch_len = 1
@@ -748,7 +1676,6 @@ class MotifComparer(object):
                 )
                 jobs.append(p)
 
-            pool.close()
             for job in jobs:
                 # Get the job result
                 result = job.get()
@@ -758,8 +1685,6 @@ class MotifComparer(object):
                         if m1 not in scores:
                             scores[m1] = {}
                         scores[m1][m2] = s
-
-            pool.join()
         else:
             # Do the whole thing at once if we don't want parallel
             scores = _get_all_scores(
@@ -768,6 +1693,292 @@ class MotifComparer(object):
 
         return scores
 
+    def get_all_score_arrays(
+        self,
+        motifs,
+        dbmotifs,
+        match,
+        metric,
+        combine,
+        pval=False,
+        parallel=True,
+        ncpus=None,
+    ):
+        """Pairwise comparison of a set of motifs, returned as arrays.
+
+        The seqcor metric and the metrics of all_pairs_scores() are
+        calculated with array operations, other metrics are calculated with
+        get_all_scores(). The scores are the same as those of
+        compare_motifs().
+
+        Parameters
+        ----------
+        motifs : list
+            List of Motif instances.
+
+        dbmotifs : list
+            List of Motif instances.
+
+        match : str
+            Match can be "partial", "subtotal" or "total".
+
+        metric : str
+            Distance metric.
+
+        combine : str
+            Combine positional scores using "mean" or "sum".
+
+        pval : bool , optional
+            Calculate p-vale of match.
+
+        parallel : bool , optional
+            Use the worker pool for large comparisons. True by default.
+
+        ncpus : int or None
+            Specifies the number of cores to use for parallel execution.
+
+        Returns
+        -------
+        scores : numpy.ndarray
+            Array of shape (len(motifs), len(dbmotifs)) with the score, or
+            the p-value, of every pair. NaN if there is no score.
+
+        positions, strands : numpy.ndarray
+            Position and strand of the best match of every pair.
+        """
+        if metric == "seqcor":
+            best, positions, strands = seqcor_scores(motifs, dbmotifs)
+            if pval:
+                # There are no p-values for seqcor
+                best = np.full(best.shape, np.nan)
+            return best, positions, strands
+
+        if not (
+            isinstance(metric, str)
+            and metric in ARRAY_METRICS
+            and combine in ARRAY_COMBINE
+            and match in ["total", "partial", "subtotal"]
+        ):
+            result = self.get_all_scores(
+                motifs, dbmotifs, match, metric, combine, pval, parallel, None, ncpus
+            )
+            best = np.full((len(motifs), len(dbmotifs)), np.nan)
+            positions = np.zeros(best.shape, dtype=np.int64)
+            strands = np.zeros(best.shape, dtype=np.int64)
+            for i, m1 in enumerate(motifs):
+                for j, m2 in enumerate(dbmotifs):
+                    score = result[m1.id][m2.id]
+                    if len(score) > 0 and not np.isnan(score[1]):
+                        best[i, j], positions[i, j], strands[i, j] = score
+            return best, positions, strands
+
+        if match == "total" and metric == "pcc" and not pval:
+            # Slightly randomize the weight matrix, as in compare_motifs()
+            matrices1 = [m.wiggle_pwm() for m in motifs]
+            matrices2 = [m.wiggle_pwm() for m in dbmotifs]
+        else:
+            matrices1 = [m.pwm for m in motifs]
+            matrices2 = [m.pwm for m in dbmotifs]
+
+        pool = None
+        if parallel and len(matrices1) * len(matrices2) >= PARALLEL_PAIRS:
+            if ncpus is None:
+                ncpus = int(MotifConfig().get_default_params()["ncpus"])
+            pool = get_pool(ncpus)
+
+        if pool is None:
+            best, positions, strands = all_pairs_scores(
+                matrices1, matrices2, match, metric, combine
+            )
+        else:
+            # Divide the longest list of motifs over the workers
+            transpose = len(matrices2) > len(matrices1)
+            if transpose:
+                matrices1, matrices2 = matrices2, matrices1
+            step = -(-len(matrices1) // ncpus)
+            jobs = []
+            for i in range(0, len(matrices1), step):
+                chunk = (matrices1[i : i + step], matrices2)
+                if transpose:
+                    chunk = chunk[::-1]
+                jobs.append(
+                    pool.apply_async(
+                        all_pairs_scores, args=chunk + (match, metric, combine)
+                    )
+                )
+            results = [job.get() for job in jobs]
+            best, positions, strands = [
+                np.concatenate(arrays, axis=1 if transpose else 0)
+                for arrays in zip(*results)
+            ]
+
+        if pval and match != "subtotal":
+            best = self._pvalues(
+                motifs,
+                dbmotifs,
+                "total" if match == "partial" else match,
+                metric,
+                combine,
+                best,
+            )
+        return best, positions, strands
+
+    def get_similarity_store(
+        self,
+        motifs,
+        match,
+        metric,
+        combine,
+        pval=False,
+        dirname=None,
+        ncpus=None,
+        tile=None,
+    ):
+        """Pairwise comparison of a set of motifs, stored on disk.
+
+        The motifs are compared with get_all_score_arrays() in tiles of
+        pairs, which are divided over the worker pool. The workers write
+        their results to the store directly.
+
+        Parameters
+        ----------
+        motifs : list
+            List of Motif instances.
+
+        match : str
+            Match can be "partial", "subtotal" or "total".
+
+        metric : str
+            Distance metric.
+
+        combine : str
+            Combine positional scores using "mean" or "sum".
+
+        pval : bool , optional
+            Calculate p-vale of match.
+
+        dirname : str, optional
+            Directory of the store. By default a temporary store is created.
+
+        ncpus : int or None
+            Specifies the number of cores to use for parallel execution.
+
+        tile : int, optional
+            Number of motifs per row and column of a tile. By default the
+            motifs are divided over ncpus rows of tiles, of at least
+            SIMILARITY_MIN_TILE and at most SIMILARITY_TILE motifs.
+
+        Returns
+        -------
+        SimilarityStore
+            Scores of all pairs of motifs. Close the store when it is no
+            longer needed.
+        """
+        motifs = list(motifs)
+        if ncpus is None:
+            ncpus = int(MotifConfig().get_default_params()["ncpus"])
+        if tile is None:
+            tile = -(-len(motifs) // max(ncpus, 1))
+            tile = min(max(tile, SIMILARITY_MIN_TILE), SIMILARITY_TILE)
+        tiles = [
+            (i, j)
+            for i in range(0, len(motifs), tile)
+            for j in range(0, len(motifs), tile)
+        ]
+
+        pool = None
+        if len(tiles) > 1:
+            pool = get_pool(ncpus)
+
+        store = SimilarityStore.create(
+            len(motifs), dirname, max([len(m) for m in motifs] + [0])
+        )
+        try:
+            self._fill_similarity_store(
+                store, motifs, tiles, tile, pool, match, metric, combine, pval
+            )
+        except Exception:
+            # A temporary store is removed
+            store.close()
+            raise
+        return store
+
+    def _fill_similarity_store(
+        self, store, motifs, tiles, tile, pool, match, metric, combine, pval
+    ):
+        if pool is None:
+            for i, j in tiles:
+                result = self.get_all_score_arrays(
+                    motifs[i : i + tile],
+                    motifs[j : j + tile],
+                    match,
+                    metric,
+                    combine,
+                    pval,
+                    parallel=False,
+                )
+                store.write(slice(i, i + tile), slice(j, j + tile), *result)
+        else:
+            h = xxhash.xxh64()
+            for motif in motifs:
+                h.update(motif.hash())
+                h.update(str(motif.id))
+            key = "similarity_" + h.hexdigest()
+            share(key, motifs)
+            jobs = [
+                pool.apply_async(
+                    _similarity_tile,
+                    (store.dirname, key, i, j, tile, match, metric, combine, pval),
+                )
+                for i, j in tiles
+            ]
+            # Wait for all tiles before an error can remove the store
+            for job in jobs:
+                job.wait()
+            for job in jobs:
+                job.get()
+
+    def _pvalues(self, motifs, dbmotifs, match, metric, combine, scores):
+        """Return the p-values of an array of scores, see pvalue()."""
+        dist = self.scoredist[metric]["%s_%s" % (match, combine)]
+        len1 = np.array([self._check_length(len(m.pwm)) for m in motifs])
+        len2 = np.array([self._check_length(len(m.pwm)) for m in dbmotifs])
+        means = np.empty(scores.shape)
+        sds = np.empty(scores.shape)
+        for l1 in np.unique(len1):
+            for l2 in np.unique(len2):
+                block = np.ix_(len1 == l1, len2 == l2)
+                means[block], sds[block] = dist[l1][l2]
+        return 1 - norm.cdf(scores, means, sds)
+
+    def _get_all_array_scores(
+        self, motifs, dbmotifs, match, metric, combine, pval, parallel, ncpus
+    ):
+        """Compare all motifs at once with get_all_score_arrays().
+
+        The result is the same as calling compare_motifs() for every pair.
+        """
+        best, positions, strands = self.get_all_score_arrays(
+            motifs, dbmotifs, match, metric, combine, pval, parallel, ncpus
+        )
+
+        scores = {}
+        for i, m1 in enumerate(motifs):
+            scores[m1.id] = {}
+            for j, m2 in enumerate(dbmotifs):
+                if metric != "seqcor" and np.isnan(best[i, j]):
+                    score = []
+                    if pval and match != "subtotal":
+                        score = [1, np.nan, np.nan]
+                else:
+                    score = [
+                        float(best[i, j]),
+                        int(positions[i, j]),
+                        int(strands[i, j]),
+                    ]
+                scores[m1.id][m2.id] = score
+        return scores
+
     def get_best_matches(
         self,
         motifs,
@@ -790,7 +2001,9 @@ class MotifComparer(object):
             Number of matches to return, default is 1.
 
         dbmotifs : list or str, optional
-            Database motifs, default will be used if not specified.
+            Database motifs, default will be used if not specified. For the
+            seqcor metric the match index of a motif file is used, see
+            load_match_index().
 
         match : str, optional
 
@@ -812,6 +2025,18 @@ class MotifComparer(object):
             dbmotifs = os.path.join(pwmdir, pwm)
 
         motifs = parse_motifs(motifs)
+        if (
+            metric == "seqcor"
+            and isinstance(dbmotifs, six.string_types)
+            and not dbmotifs.endswith("transfac")
+        ):
+            # Query the match index of the database, there are no p-values
+            index = load_match_index(dbmotifs)
+            matches = index.best_matches(motifs, load_motif_db(dbmotifs), nmatches)
+            return {
+                motif_id: [[m, score + [np.nan]] for m, score in result]
+                for motif_id, result in matches.items()
+            }
         dbmotifs = parse_motifs(dbmotifs)
 
         dbmotif_lookup = dict([(m.id, m) for m in dbmotifs])
@@ -993,11 +2218,3 @@ def select_nonredundant_motifs(
         f"selected {len(selected_features)} non-redundant motifs: ROC AUC {roc_auc:.3f}, PR AUC {pr_auc:.3f}"
     )
     return selected_features
-
-
-# import here is necessary as workaround
-# see: http://stackoverflow.com/questions/18947876/using-python-multiprocessing-pool-in-the-terminal-and-in-code-modules-for-django  # noqa: E501
-try:
-    from multiprocessing import Pool
-except ImportError:
-    pass
@@ -10,13 +10,77 @@ import random
 import re
 import numpy as np
 
+INVALID_SEQ = re.compile(r"[^abcdefghiklmnpqrstuvwyzxABCDEFGHIKLMNPQRSTUVWXYZ]")
+
+
+def _id_key(seq_id):
+    """Return a hashable key for a sequence id, ids can be lists."""
+    if isinstance(seq_id, list):
+        return tuple(seq_id)
+    return seq_id
+
+
+def iter_fasta(fname, chunksize=10000, split_whitespace=False):
+    """Read a FASTA file in chunks.
+
+    The file is read line by line, so only one chunk of sequences is kept
+    in memory at a time.
+
+    Parameters
+    ----------
+    fname : str
+        Name of FASTA file.
+    chunksize : int, optional
+        Maximum number of sequences per chunk.
+    split_whitespace : bool, optional
+        Split the sequence names on whitespace, as Fasta does.
+
+    Yields
+    ------
+    fa : Fasta instance
+        Fasta object with the sequences of the next chunk.
+    """
+    chunk = Fasta()
+    seq_name = None
+    lines = []
+
+    def add_seq():
+        sequence = "".join(lines)
+        if INVALID_SEQ.match(sequence):
+            raise IOError("Not a valid FASTA file")
+        name = seq_name.split(" ") if split_whitespace else seq_name
+        chunk.add(name, sequence)
+
+    with open(fname) as f:
+        for i, line in enumerate(f):
+            line = line.rstrip("\r\n")
+            if line.startswith(">"):
+                if seq_name is not None and (seq_name or lines):
+                    add_seq()
+                    if len(chunk) >= chunksize:
+                        yield chunk
+                        chunk = Fasta()
+                seq_name = line[1:]
+                lines = []
+            elif i == 0:
+                raise IOError("Not a valid FASTA file")
+            else:
+                lines.append(line)
+
+    if seq_name is not None and (seq_name or lines):
+        add_seq()
+    if len(chunk) > 0:
+        yield chunk
+
 
 class Fasta(object):
     def __init__(self, fname=None, split_whitespace=False):
         """ Instantiate fasta object. Optional Fasta-formatted file as argument"""
         self.ids = []
         self.seqs = []
-        p = re.compile(r"[^abcdefghiklmnpqrstuvwyzxABCDEFGHIKLMNPQRSTUVWXYZ]")
+        self._index = {}
+        self._index_len = 0
+        p = INVALID_SEQ
         if fname:
             f = open(fname, "r")
             c = f.read()
@@ -30,11 +94,10 @@ class Fasta(object):
                     seq_name = lines[0]
                     if split_whitespace:
                         seq_name = seq_name.split(" ")
-                    self.ids.append(seq_name)
                     sequence = "".join(lines[1:])
                     if p.match(sequence):
                         raise IOError("Not a valid FASTA file")
-                    self.seqs.append(sequence)
+                    self.add(seq_name, sequence)
 
     def hardmask(self):
         """ Mask all lowercase nucleotides with N's """
@@ -70,14 +133,30 @@ class Fasta(object):
                 random_f[choice[i]] = self[choice[i]]
         return random_f
 
+    def _id_index(self):
+        """Return a dictionary with the index of the first sequence per id.
+
+        The index is rebuilt if the ids were changed without using the
+        methods of this class, for instance on an unpickled object.
+        """
+        index = getattr(self, "_index", None)
+        if index is None or self._index_len != len(self.ids):
+            index = {}
+            for i, seq_id in enumerate(self.ids):
+                index.setdefault(_id_key(seq_id), i)
+            self._index = index
+            self._index_len = len(self.ids)
+        return index
+
     def __getitem__(self, idx):
         if isinstance(idx, slice):
             f = Fasta()
             f.ids = self.ids[idx][:]
             f.seqs = self.seqs[idx][:]
             return f
-        elif idx in self.ids:
-            return self.seqs[self.ids.index(idx)]
+        i = self._id_index().get(_id_key(idx))
+        if i is not None:
+            return self.seqs[i]
         else:
             return None
 
@@ -88,26 +167,33 @@ class Fasta(object):
         return len(self.ids)
 
     def __setitem__(self, key, value):
-        if key in self.ids:
-            self.seqs[self.ids.index(key)] = value
+        i = self._id_index().get(_id_key(key))
+        if i is not None:
+            self.seqs[i] = value
         else:
-            self.ids.append(key)
-            self.seqs.append(value)
+            self.add(key, value)
 
     def __delitem__(self, key):
-        i = self.ids.index(key)
+        i = self._id_index().get(_id_key(key))
+        if i is None:
+            raise ValueError("{} is not in Fasta".format(key))
         self.ids.pop(i)
         self.seqs.pop(i)
+        # Indices of all following sequences change
+        self._index = None
 
     def _format_seq(self, seq):
         return seq
 
     def add(self, seq_id, seq):
+        index = self._id_index()
+        index.setdefault(_id_key(seq_id), len(self.ids))
         self.ids.append(seq_id)
         self.seqs.append(seq)
+        self._index_len = len(self.ids)
 
     def has_key(self, key):
-        if key in self.ids:
+        if _id_key(key) in self._id_index():
             return True
         else:
             return False
@@ -34,13 +34,13 @@ import seaborn as sns
 sns.set_style("white")
 
 from gimmemotifs.config import MotifConfig, DIRECT_NAME, INDIRECT_NAME
-from gimmemotifs.moap import moap, Moap, scan_to_table
+from gimmemotifs.moap import moap, Moap, scan_to_table, scan_to_tables
 from gimmemotifs.rank import rankagg
 from gimmemotifs.motif import read_motifs
+from gimmemotifs.pool import get_pool
 from gimmemotifs.report import maelstrom_html_report
 from gimmemotifs.utils import join_max, pfmfile_location
 
-from multiprocessing import Pool
 
 BG_LENGTH = 200
 BG_NUMBER = 10000
@@ -192,11 +192,12 @@ def _rank_agg_column(exps, dfs, e):
 def df_rank_aggregation(df, dfs, exps):
     df_p = pd.DataFrame(index=list(dfs.values())[0].index)
     names = list(dfs.values())[0].columns
-    pool = Pool(16)
+    pool = get_pool()
     func = partial(_rank_agg_column, exps, dfs)
-    ret = pool.map(func, names)
-    pool.close()
-    pool.join()
+    if pool is None:
+        ret = list(map(func, names))
+    else:
+        ret = pool.map(func, names)
 
     for e, result in zip(names, ret):
         df_p[e] = result
@@ -296,6 +297,27 @@ def run_maelstrom(
         if os.path.exists(mapfile):
             shutil.copy2(mapfile, outdir)
 
+    # Create both tables with a single scan if neither of them exists
+    if (
+        count_table is None
+        and score_table is None
+        and not os.path.exists(os.path.join(outdir, "motif.count.txt.gz"))
+        and not os.path.exists(os.path.join(outdir, "motif.score.txt.gz"))
+    ):
+        logger.info("motif scanning (counts and scores)")
+        counts, scores = scan_to_tables(
+            infile, genome, pfmfile=pfmfile, ncpus=ncpus, zscore=zscore, gc=gc
+        )
+        counts.to_csv(
+            os.path.join(outdir, "motif.count.txt.gz"), sep="\t", compression="gzip"
+        )
+        scores.to_csv(
+            os.path.join(outdir, "motif.score.txt.gz"),
+            sep="\t",
+            float_format="%.3f",
+            compression="gzip",
+        )
+
     # Create a file with the number of motif matches
     if count_table is None:
         count_table = os.path.join(outdir, "motif.count.txt.gz")
@@ -57,6 +57,52 @@ logger = logging.getLogger("gimme.maelstrom")
 FPR = 0.01
 
 
+def _scan_setup(input_table, genome, pfmfile=None, ncpus=None, gc=True):
+    """Read the regions of an input table and set up a Scanner.
+
+    Returns the Scanner, the regions as a Fasta object and the index of
+    the input table.
+    """
+    config = MotifConfig()
+
+    if pfmfile is None:
+        pfmfile = config.get_default_params().get("motif_db", None)
+        if pfmfile is not None:
+            pfmfile = os.path.join(config.get_motif_dir(), pfmfile)
+
+    if pfmfile is None:
+        raise ValueError("no pfmfile given and no default database specified")
+
+    logger.info("reading table")
+    if input_table.endswith("feather"):
+        df = pd.read_feather(input_table)
+        idx = df.iloc[:, 0].values
+    else:
+        df = pd.read_table(input_table, index_col=0, comment="#")
+        idx = df.index
+
+    fa = as_fasta(list(idx), genome=genome)
+    size = int(np.median([len(seq) for seq in fa.seqs]))
+
+    s = Scanner(ncpus=ncpus)
+    s.set_motifs(pfmfile)
+    s.set_genome(genome)
+    s.set_background(genome=genome, gc=gc, size=size)
+    return s, fa, idx
+
+
+def _score_msg(zscore, gc):
+    msg = ""
+    if zscore:
+        msg += " (z-score"
+        if gc:
+            msg += ", GC%"
+        msg += ")"
+    else:
+        msg += " (logodds)"
+    return msg
+
+
 def scan_to_table(
     input_table, genome, scoring, pfmfile=None, ncpus=None, zscore=True, gc=True
 ):
@@ -87,64 +133,76 @@ def scan_to_table(
         DataFrame with motif ids as column names and regions as index. Values
         are either counts or scores depending on the 'scoring' parameter.s
     """
-    config = MotifConfig()
+    s, fa, idx = _scan_setup(input_table, genome, pfmfile=pfmfile, ncpus=ncpus, gc=gc)
 
-    if pfmfile is None:
-        pfmfile = config.get_default_params().get("motif_db", None)
-        if pfmfile is not None:
-            pfmfile = os.path.join(config.get_motif_dir(), pfmfile)
-
-    if pfmfile is None:
-        raise ValueError("no pfmfile given and no default database specified")
-
-    logger.info("reading table")
-    if input_table.endswith("feather"):
-        df = pd.read_feather(input_table)
-        idx = df.iloc[:, 0].values
-    else:
-        df = pd.read_table(input_table, index_col=0, comment="#")
-        idx = df.index
-
-    regions = list(idx)
-    if len(regions) >= 1000:
-        check_regions = np.random.choice(regions, size=1000, replace=False)
-    else:
-        check_regions = regions
-
-    size = int(
-        np.median([len(seq) for seq in as_fasta(check_regions, genome=genome).seqs])
-    )
-    s = Scanner(ncpus=ncpus)
-    s.set_motifs(pfmfile)
-    s.set_genome(genome)
-    s.set_background(genome=genome, gc=gc, size=size)
-
-    scores = []
     if scoring == "count":
         logger.info("setting threshold")
         s.set_threshold(fpr=FPR)
         logger.info("creating count table")
-        for row in s.count(regions):
-            scores.append(row)
+        scores = np.vstack(list(s.count_blocks(fa)))
         logger.info("done")
     else:
         s.set_threshold(threshold=0.0)
-        msg = "creating score table"
-        if zscore:
-            msg += " (z-score"
-            if gc:
-                msg += ", GC%"
-            msg += ")"
-        else:
-            msg += " (logodds)"
-        logger.info(msg)
-        for row in s.best_score(regions, zscore=zscore, gc=gc):
-            scores.append(row)
+        logger.info("creating score table" + _score_msg(zscore, gc))
+        scores = s.best_score_matrix(fa, zscore=zscore, gc=gc)
         logger.info("done")
 
-    motif_names = [m.id for m in read_motifs(pfmfile)]
     logger.info("creating dataframe")
-    return pd.DataFrame(scores, index=idx, columns=motif_names)
+    return pd.DataFrame(scores, index=idx, columns=s.motif_ids)
+
+
+def scan_to_tables(input_table, genome, pfmfile=None, ncpus=None, zscore=True, gc=True):
+    """Scan regions in input table with motifs, return counts and scores.
+
+    The count table and the score table are created with a single scan of
+    the regions. The counts are determined with the FPR threshold.
+
+    Parameters
+    ----------
+    input_table : str
+        Filename of input table. Can be either a text-separated tab file or a
+        feather file.
+
+    genome : str
+        Genome name. Can be either the name of a FASTA-formatted file or a
+        genomepy genome name.
+
+    pfmfile : str, optional
+        Specify a PFM file for scanning.
+
+    ncpus : int, optional
+        If defined this specifies the number of cores to use.
+
+    Returns
+    -------
+    counts : pandas.DataFrame
+        DataFrame with motif ids as column names and regions as index with
+        the number of motif matches.
+
+    scores : pandas.DataFrame
+        DataFrame with motif ids as column names and regions as index with
+        the score of the best motif match.
+    """
+    s, fa, idx = _scan_setup(input_table, genome, pfmfile=pfmfile, ncpus=ncpus, gc=gc)
+
+    logger.info("setting threshold")
+    s.set_threshold(fpr=FPR)
+    logger.info("creating count and score table" + _score_msg(zscore, gc))
+    counts = np.empty((len(fa), len(s.motif_ids)), dtype=np.int32)
+    scores = np.empty((len(fa), len(s.motif_ids)), dtype=np.float32)
+    start = 0
+    for count_block, score_block in s.count_score_blocks(fa, zscore=zscore, gc=gc):
+        end = start + len(count_block)
+        counts[start:end] = count_block
+        scores[start:end] = score_block
+        start = end
+    logger.info("done")
+
+    logger.info("creating dataframes")
+    return (
+        pd.DataFrame(counts, index=idx, columns=s.motif_ids),
+        pd.DataFrame(scores, index=idx, columns=s.motif_ids),
+    )
 
 
 class Moap(object):
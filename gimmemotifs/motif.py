@@ -5,6 +5,8 @@
 # distribution.
 """Module contain core motif functionality"""
 # Python imports
+import json
+import logging
 import os
 import re
 import sys
@@ -13,9 +15,17 @@ from math import log, sqrt
 from warnings import warn
 import six
 
+from gimmemotifs.cache import MemoryCache
 from gimmemotifs.config import MotifConfig, DIRECT_NAME, INDIRECT_NAME
-from gimmemotifs.c_metrics import pfmscan
-from gimmemotifs.utils import pfmfile_location
+from gimmemotifs.c_metrics import pfmscan_array
+from gimmemotifs.utils import (
+    pfmfile_location,
+    encode_seq,
+    HIT_DTYPE,
+    cached_file_locations,
+    load_cached,
+    save_atomic,
+)
 
 # External imports
 try:
@@ -27,12 +37,21 @@ import matplotlib.pyplot as plt
 import logomaker as lm
 import pandas as pd
 
+logger = logging.getLogger("gimme.motif")
+
+# Version of the binary motif database format, see MotifDatabase
+MOTIF_DB_VERSION = 1
+
 
 class Motif(object):
 
     """
     Representation of a transcription factor binding motif.
 
+    The position frequency and weight matrices are stored as arrays of shape
+    (motif length, 4). The pfm, pwm and logodds attributes are derived from
+    these arrays when they are accessed.
+
     Examples
     --------
 
@@ -47,88 +66,197 @@ class Motif(object):
 
     """
 
+    # Other attributes, such as align or metadata, are stored in __dict__
+    __slots__ = (
+        "_pwm",
+        "_pfm",
+        "_logodds",
+        "_hash",
+        "_factors",
+        "wiggled_pwm",
+        "seqs",
+        "consensus",
+        "min_score",
+        "max_score",
+        "id",
+        "__dict__",
+    )
+
     PSEUDO_PFM_COUNT = 1000  # Jaspar mean
     PSEUDO_PWM = 1e-6
     G = 0.25
     Z = 0.01
 
-    def __init__(self, pfm=None):
-        if pfm is None:
-            pfm = []
+    nucs = "ACGT"
+
+    iupac_rev = {
+        "CG": "S",
+        "AG": "R",
+        "AT": "W",
+        "CT": "Y",
+        "GT": "K",
+        "AC": "M",
+        "CGT": "B",
+        "ACT": "H",
+        "AGT": "D",
+        "ACG": "V",
+    }
+
+    iupac = {
+        "A": ["A"],
+        "C": ["C"],
+        "G": ["G"],
+        "T": ["T"],
+        "S": ["C", "G"],
+        "R": ["A", "G"],
+        "W": ["A", "T"],
+        "Y": ["C", "T"],
+        "K": ["G", "T"],
+        "M": ["A", "C"],
+        "B": ["C", "G", "T"],
+        "H": ["A", "C", "T"],
+        "D": ["A", "G", "T"],
+        "V": ["A", "C", "G"],
+        "N": ["A", "C", "G", "T"],
+    }
+
+    iupac_pwm = {
+        "A": [1, 0, 0, 0],
+        "C": [0, 1, 0, 0],
+        "G": [0, 0, 1, 0],
+        "T": [0, 0, 0, 1],
+        "S": [0, 0.5, 0.5, 0],
+        "R": [0.5, 0, 0.5, 0],
+        "W": [0.5, 0, 0, 0.5],
+        "Y": [0, 0.5, 0, 0.5],
+        "K": [0, 0, 0.5, 0.5],
+        "M": [0.5, 0.5, 0, 0],
+        "B": [0, 0.33, 0.33, 0.33],
+        "H": [0.33, 0.33, 0, 0.33],
+        "D": [0.33, 0, 0.33, 0.33],
+        "V": [0.33, 0.33, 0.33, 0],
+        "N": [0.25, 0.25, 0.25, 0.25],
+    }
+
+    # Shared by all motifs, see the config property
+    _config = None
 
-        if len(pfm) > 0:
-            if np.sum(pfm[0]) > 2:
-                self.pfm = [list(x) for x in pfm]
-                self.pwm = self.pfm_to_pwm(pfm)
-            else:
-                self.pwm = [list(x) for x in pfm]
-                self.pfm = [[n * self.PSEUDO_PFM_COUNT for n in col] for col in pfm]
-            self.logodds = [
-                [np.log(n / self.G + self.Z) for n in col] for col in self.pwm
-            ]
-        else:
-            self.pwm = []
-            self.pfm = []
+    def __init__(self, pfm=None):
+        self._pwm = None
+        self._pfm = None
+        self._logodds = None
+        self._hash = None
+        self._factors = None
 
         self.wiggled_pwm = None
-        self.factors = {DIRECT_NAME: [], INDIRECT_NAME: []}
         self.seqs = []
         self.consensus = ""
         self.min_score = None
         self.max_score = None
-
         self.id = ""
-        self.config = MotifConfig()
-
-        self.nucs = "ACGT"
-
-        self.iupac_rev = {
-            "CG": "S",
-            "AG": "R",
-            "AT": "W",
-            "CT": "Y",
-            "GT": "K",
-            "AC": "M",
-            "CGT": "B",
-            "ACT": "H",
-            "AGT": "D",
-            "ACG": "V",
-        }
 
-        self.iupac = {
-            "A": ["A"],
-            "C": ["C"],
-            "G": ["G"],
-            "T": ["T"],
-            "S": ["C", "G"],
-            "R": ["A", "G"],
-            "W": ["A", "T"],
-            "Y": ["C", "T"],
-            "K": ["G", "T"],
-            "M": ["A", "C"],
-            "B": ["C", "G", "T"],
-            "H": ["A", "C", "T"],
-            "D": ["A", "G", "T"],
-            "V": ["A", "C", "G"],
-            "N": ["A", "C", "G", "T"],
-        }
-        self.iupac_pwm = {
-            "A": [1, 0, 0, 0],
-            "C": [0, 1, 0, 0],
-            "G": [0, 0, 1, 0],
-            "T": [0, 0, 0, 1],
-            "S": [0, 0.5, 0.5, 0],
-            "R": [0.5, 0, 0.5, 0],
-            "W": [0.5, 0, 0, 0.5],
-            "Y": [0, 0.5, 0, 0.5],
-            "K": [0, 0, 0.5, 0.5],
-            "M": [0.5, 0.5, 0, 0],
-            "B": [0, 0.33, 0.33, 0.33],
-            "H": [0.33, 0.33, 0, 0.33],
-            "D": [0.33, 0, 0.33, 0.33],
-            "V": [0.33, 0.33, 0.33, 0],
-            "N": [0.25, 0.25, 0.25, 0.25],
-        }
+        if pfm is not None and len(pfm) > 0:
+            matrix = self._matrix(pfm)
+            if np.sum(matrix[0]) > 2:
+                self._pfm = matrix
+                self._pwm = self._pfm_to_pwm(matrix)
+            else:
+                self._pwm = matrix
+
+    @staticmethod
+    def _matrix(matrix):
+        """Return a matrix as an array of shape (motif length, 4).
+
+        Integer matrices are kept as integers, so that counts are formatted
+        as before.
+        """
+        matrix = np.array(matrix, order="C")
+        if matrix.dtype.kind not in "iuf":
+            matrix = matrix.astype(np.float64)
+        return matrix.reshape(-1, 4)
+
+    def _reset(self):
+        self._logodds = None
+        self._hash = None
+        self.min_score = None
+        self.max_score = None
+
+    @property
+    def pwm(self):
+        """Position weight matrix, as a list of lists with fractions."""
+        if self._pwm is None:
+            return []
+        return self._pwm.tolist()
+
+    @pwm.setter
+    def pwm(self, pwm):
+        if pwm is None or len(pwm) == 0:
+            self._pwm = None
+        else:
+            self._pwm = self._matrix(pwm)
+        self._reset()
+
+    @property
+    def pfm(self):
+        """Position frequency matrix, as a list of lists with counts.
+
+        If no counts are known, the pwm is scaled to PSEUDO_PFM_COUNT.
+        """
+        if self._pfm is not None:
+            return self._pfm.tolist()
+        if self._pwm is not None:
+            return (self._pwm * self.PSEUDO_PFM_COUNT).tolist()
+        return []
+
+    @pfm.setter
+    def pfm(self, pfm):
+        if pfm is None or len(pfm) == 0:
+            self._pfm = None
+        else:
+            self._pfm = self._matrix(pfm)
+
+    @property
+    def logodds(self):
+        """Log-odds matrix, as a read-only array of shape (motif length, 4)."""
+        if self._logodds is None:
+            if self._pwm is None:
+                logodds = np.empty((0, 4))
+            else:
+                logodds = np.log(self._pwm / self.G + self.Z)
+            logodds.flags.writeable = False
+            self._logodds = logodds
+        return self._logodds
+
+    @property
+    def factors(self):
+        """Dictionary with the direct and indirect factors of the motif."""
+        if self._factors is None:
+            self._factors = {DIRECT_NAME: [], INDIRECT_NAME: []}
+        return self._factors
+
+    @factors.setter
+    def factors(self, factors):
+        self._factors = factors
+
+    @property
+    def config(self):
+        """MotifConfig instance, shared by all motifs."""
+        if Motif._config is None:
+            Motif._config = MotifConfig()
+        return Motif._config
+
+    def __getstate__(self):
+        # The log-odds matrix is calculated again when needed
+        state = {name: getattr(self, name) for name in self.__slots__[:-1]}
+        state["_logodds"] = None
+        return state, getattr(self, "__dict__", None)
+
+    def __setstate__(self, state):
+        slots, attributes = state
+        for name, value in slots.items():
+            setattr(self, name, value)
+        if attributes:
+            self.__dict__.update(attributes)
 
     def __getitem__(self, x):
         """
@@ -140,10 +268,10 @@ class Motif(object):
             Slice of the motif.
         """
         m = Motif()
-        if self.pwm:
-            m.pwm = self.pwm[x]
-        if self.pfm:
-            m.pfm = self.pfm[x]
+        if self._pwm is not None:
+            m.pwm = self._pwm[x]
+        if self._pfm is not None:
+            m.pfm = self._pfm[x]
         if self.seqs:
             m.seqs = [seq[x] for seq in self.seqs]
         if self.consensus:
@@ -159,7 +287,9 @@ class Motif(object):
         len : int
             Motif length.
         """
-        return len(self.to_consensus())
+        if self._pwm is not None:
+            return len(self._pwm)
+        return len(self.consensus or "")
 
     def __repr__(self):
         return "{}_{}".format(self.id, self.to_consensus())
@@ -224,7 +354,7 @@ class Motif(object):
         score : float
             Log-odd score.
         """
-        if len(kmer) != len(self.pwm):
+        if len(kmer) != len(self):
             raise Exception("incorrect k-mer length")
 
         score = 0.0
@@ -249,10 +379,11 @@ class Motif(object):
         pwm : list
             2-dimensional list with fractions.
         """
-        return [
-            [(x + pseudo) / (float(np.sum(row)) + pseudo * 4) for x in row]
-            for row in pfm
-        ]
+        return self._pfm_to_pwm(np.array(pfm, dtype=np.float64), pseudo).tolist()
+
+    @staticmethod
+    def _pfm_to_pwm(pfm, pseudo=0.001):
+        return (pfm + pseudo) / (pfm.sum(1, keepdims=True) + pseudo * 4)
 
     def to_motevo(self):
         """Return motif formatted in MotEvo (TRANSFAC-like) format
@@ -355,8 +486,10 @@ class Motif(object):
             New Motif instance with the reverse complement of the input motif.
         """
         m = Motif()
-        m.pfm = [row[::-1] for row in self.pfm[::-1]]
-        m.pwm = [row[::-1] for row in self.pwm[::-1]]
+        if self._pfm is not None:
+            m.pfm = self._pfm[::-1, ::-1]
+        if self._pwm is not None:
+            m.pwm = self._pwm[::-1, ::-1]
         m.id = self.id + "_revcomp"
         return m
 
@@ -375,19 +508,19 @@ class Motif(object):
         -------
         m : Motif instance
         """
-        pwm = self.pwm[:]
-        while len(pwm) > 0 and self.ic_pos(pwm[0]) < edge_ic_cutoff:
-            pwm = pwm[1:]
-            self.pwm = self.pwm[1:]
-            self.pfm = self.pfm[1:]
-        while len(pwm) > 0 and self.ic_pos(pwm[-1]) < edge_ic_cutoff:
-            pwm = pwm[:-1]
-            self.pwm = self.pwm[:-1]
-            self.pfm = self.pfm[:-1]
+        pwm = self.pwm
+        start, end = 0, len(pwm)
+        while start < end and self.ic_pos(pwm[start]) < edge_ic_cutoff:
+            start += 1
+        while start < end and self.ic_pos(pwm[end - 1]) < edge_ic_cutoff:
+            end -= 1
+
+        if self._pwm is not None:
+            self.pwm = self._pwm[start:end]
+        if self._pfm is not None:
+            self.pfm = self._pfm[start:end]
 
         self.consensus = None
-        self.min_score = None
-        self.max_score = None
         self.wiggled_pwm = None
 
         return self
@@ -417,6 +550,17 @@ class Motif(object):
                 matches[name].append(middle)
         return matches
 
+    def _pfmscan(self, seq, pfm, cutoff, nreport, scan_rc):
+        """Scan a single sequence, return a list of (score, pos, strand)."""
+        codes = encode_seq(seq)
+        if nreport > 0:
+            size = nreport
+        else:
+            size = (1 + int(scan_rc)) * max(0, len(codes) - len(pfm) + 1)
+        hits = np.empty(size, dtype=HIT_DTYPE)
+        n = pfmscan_array(codes, pfm, cutoff, nreport, scan_rc, hits)
+        return hits[:n].tolist()
+
     def pwm_scan(self, fa, cutoff=0.9, nreport=50, scan_rc=True):
         """Scan sequences with this motif.
 
@@ -447,11 +591,11 @@ class Motif(object):
             self.pwm_min_score()
             + (self.pwm_max_score() - self.pwm_min_score()) * cutoff
         )
-        pwm = self.pwm
+        pwm = np.ascontiguousarray(self._pwm, dtype=np.float64)
         matches = {}
         for name, seq in fa.items():
             matches[name] = []
-            result = pfmscan(seq.upper(), pwm, c, nreport, scan_rc)
+            result = self._pfmscan(seq, pwm, c, nreport, scan_rc)
             for _, pos, _ in result:
                 matches[name].append(pos)
         return matches
@@ -486,11 +630,11 @@ class Motif(object):
             self.pwm_min_score()
             + (self.pwm_max_score() - self.pwm_min_score()) * cutoff
         )
-        pwm = self.pwm
+        pwm = np.ascontiguousarray(self._pwm, dtype=np.float64)
         matches = {}
         for name, seq in fa.items():
             matches[name] = []
-            result = pfmscan(seq.upper(), pwm, c, nreport, scan_rc)
+            result = self._pfmscan(seq, pwm, c, nreport, scan_rc)
             for score, pos, strand in result:
                 matches[name].append((pos, score, strand))
         return matches
@@ -730,11 +874,11 @@ class Motif(object):
             self.pwm_min_score()
             + (self.pwm_max_score() - self.pwm_min_score()) * cutoff
         )
-        pwm = self.pwm
+        pwm = np.ascontiguousarray(self._pwm, dtype=np.float64)
         matches = {}
         for name, seq in fa.items():
             matches[name] = []
-            result = pfmscan(seq.upper(), pwm, c, nreport, scan_rc)
+            result = self._pfmscan(seq, pwm, c, nreport, scan_rc)
             for score, _, _ in result:
                 matches[name].append(score)
         return matches
@@ -774,7 +918,7 @@ class Motif(object):
             self.pwm_min_score()
             + (self.pwm_max_score() - self.pwm_min_score()) * cutoff
         )
-        pwm = self.pwm
+        pwm = np.ascontiguousarray(self._pwm, dtype=np.float64)
 
         strandmap = {-1: "-", "-1": "-", "-": "-", "1": "+", 1: "+", "+": "+"}
         gff_line = (
@@ -782,7 +926,7 @@ class Motif(object):
             'motif_name "{}" ; motif_instance "{}"\n'
         )
         for name, seq in fa.items():
-            result = pfmscan(seq.upper(), pwm, c, nreport, scan_rc)
+            result = self._pfmscan(seq, pwm, c, nreport, scan_rc)
             for score, pos, strand in result:
                 out.write(
                     gff_line.format(
@@ -1179,17 +1323,10 @@ class Motif(object):
             return consensus
 
     def to_pfm(self):
-        if self.pfm:
-            return ">%s\n%s" % (
-                self.id,
-                "\n".join(["\t".join(["%s" % x for x in row]) for row in self.pfm]),
-            )
-        else:
-            pfm = [[n * self.PSEUDO_PFM_COUNT for n in col] for col in self.pwm]
-            return ">%s\n%s" % (
-                self.id,
-                "\n".join(["\t".join(["%s" % x for x in row]) for row in pfm]),
-            )
+        return ">%s\n%s" % (
+            self.id,
+            "\n".join(["\t".join(["%s" % x for x in row]) for row in self.pfm]),
+        )
 
     def _pwm_to_str(self, precision=4):
         """Return string representation of pwm.
@@ -1203,7 +1340,7 @@ class Motif(object):
         -------
         pwm_string : str
         """
-        if not self.pwm:
+        if self._pwm is None:
             return ""
 
         fmt = "{{:.{:d}f}}".format(precision)
@@ -1217,7 +1354,9 @@ class Motif(object):
         Returns:
         hash : str
         """
-        return xxhash.xxh64(self._pwm_to_str(3)).hexdigest()
+        if self._hash is None:
+            self._hash = xxhash.xxh64(self._pwm_to_str(3)).hexdigest()
+        return self._hash
 
     def to_pwm(self, precision=4, extra_str=""):
         """Return pwm as string.
@@ -1240,7 +1379,7 @@ class Motif(object):
         if extra_str:
             motif_id += "_%s" % extra_str
 
-        if not self.pwm:
+        if self._pwm is None:
             self.pwm = [self.iupac_pwm[char] for char in self.consensus.upper()]
 
         return ">%s\n%s" % (motif_id, self._pwm_to_str(precision))
@@ -1314,11 +1453,7 @@ def default_motifs():
     if not d or not m:
         raise ValueError("default motif database not configured")
 
-    fname = os.path.join(d, m)
-    with open(fname) as f:
-        motifs = read_motifs(f)
-
-    return motifs
+    return read_motifs(os.path.join(d, m))
 
 
 def motif_from_align(align):
@@ -1394,13 +1529,10 @@ def parse_motifs(motifs):
         List of Motif instances.
     """
     if isinstance(motifs, six.string_types):
-        with open(motifs) as f:
-            if motifs.endswith("pwm") or motifs.endswith("pfm"):
-                motifs = read_motifs(f, fmt="pwm")
-            elif motifs.endswith("transfac"):
-                motifs = read_motifs(f, fmt="transfac")
-            else:
-                motifs = read_motifs(f)
+        if motifs.endswith("transfac"):
+            motifs = read_motifs(motifs, fmt="transfac")
+        else:
+            motifs = read_motifs(motifs)
     elif isinstance(motifs, Motif):
         motifs = [motifs]
     else:
@@ -1491,10 +1623,202 @@ def _read_motifs_from_filehandle(handle, fmt):
     return motifs
 
 
-def read_motifs(infile=None, fmt="pfm", as_dict=False):
+class MotifDatabase(object):
+    """Motifs of a compiled, binary motif database.
+
+    The matrices of all motifs are stored in one array, with an index by
+    motif id. Motif instances are only created when they are accessed, as a
+    new instance every time. Use load_motif_db() to load the database of a
+    motif file.
+
+    Parameters
+    ----------
+    arrays : dict
+        Arrays of the database, see from_motifs().
+    """
+
+    def __init__(self, arrays):
+        self.ids = [str(motif_id) for motif_id in arrays["ids"]]
+        self.checksum = str(arrays["checksum"])
+        self._pwm = arrays["pwm"]
+        self._pfm = arrays["pfm"]
+        self._has_pfm = arrays["has_pfm"]
+        self._offsets = arrays["offsets"]
+        self._factors = json.loads(str(arrays["factors"]))
+        self._index = {}
+        for i, motif_id in enumerate(self.ids):
+            self._index.setdefault(motif_id, i)
+
+    @classmethod
+    def from_motifs(cls, motifs, checksum=""):
+        """Compile a list of motifs.
+
+        Parameters
+        ----------
+        motifs : list
+            List of Motif instances.
+
+        checksum : str, optional
+            Checksum of the motif file.
+
+        Returns
+        -------
+        MotifDatabase
+        """
+        empty = np.empty((0, 4))
+        pwms = [empty if m._pwm is None else m._pwm for m in motifs]
+        pfms = [pwm if m._pfm is None else m._pfm for m, pwm in zip(motifs, pwms)]
+        offsets = np.zeros(len(motifs) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(pwm) for pwm in pwms])
+        factors = {
+            m.id: [m.factors[DIRECT_NAME], m.factors[INDIRECT_NAME]]
+            for m in motifs
+            if m.factors[DIRECT_NAME] or m.factors[INDIRECT_NAME]
+        }
+        return cls(
+            {
+                "version": np.array(MOTIF_DB_VERSION),
+                "checksum": np.array(checksum),
+                "ids": np.array([m.id for m in motifs], dtype=str),
+                "pwm": np.vstack([empty] + pwms).astype(np.float64),
+                "pfm": np.vstack([empty] + pfms).astype(np.float64),
+                "has_pfm": np.array([m._pfm is not None for m in motifs], dtype=bool),
+                "offsets": offsets,
+                "factors": np.array(json.dumps(factors)),
+            }
+        )
+
+    @classmethod
+    def load(cls, fname):
+        """Load a database saved with save().
+
+        Raises ValueError if the file was saved by another version.
+        """
+        with np.load(fname, allow_pickle=False) as data:
+            if int(data["version"]) != MOTIF_DB_VERSION:
+                raise ValueError("unsupported motif database version")
+            return cls({name: data[name] for name in data.files})
+
+    def save(self, fname):
+        """Save the database to an (uncompressed) .npz file.
+
+        The file is replaced atomically, so that other processes never read
+        an incomplete database.
+        """
+
+        def write(f):
+            np.savez(
+                f,
+                version=np.array(MOTIF_DB_VERSION),
+                checksum=np.array(self.checksum),
+                ids=np.array(self.ids, dtype=str),
+                pwm=self._pwm,
+                pfm=self._pfm,
+                has_pfm=self._has_pfm,
+                offsets=self._offsets,
+                factors=np.array(json.dumps(self._factors)),
+            )
+
+        save_atomic(fname, write)
+
+    def _motif(self, i):
+        start, end = self._offsets[i], self._offsets[i + 1]
+        m = Motif()
+        m.pwm = self._pwm[start:end]
+        if self._has_pfm[i]:
+            m.pfm = self._pfm[start:end]
+        m.id = self.ids[i]
+        direct, indirect = self._factors.get(m.id, ([], []))
+        m.factors = {DIRECT_NAME: list(direct), INDIRECT_NAME: list(indirect)}
+        return m
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._motif(i)
+
+    def __getitem__(self, key):
+        """Return a motif by position or by id."""
+        if isinstance(key, six.string_types):
+            if key not in self._index:
+                raise KeyError("motif {} not in database".format(key))
+            key = self._index[key]
+        elif key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("motif index out of range")
+        return self._motif(key)
+
+    def __contains__(self, motif_id):
+        return motif_id in self._index
+
+    def __repr__(self):
+        return "<MotifDatabase with {} motifs>".format(len(self))
+
+
+# Maximum number of databases that are kept loaded in a process
+MAX_LOADED_DBS = 8
+
+# Databases that are loaded in this process, by filename
+_motif_dbs = MemoryCache(MAX_LOADED_DBS)
+
+
+def _motif_db_checksum(fname):
+    """Return the checksum of a motif file and its motif2factors file."""
+    h = xxhash.xxh64(str(MOTIF_DB_VERSION))
+    map_file = os.path.splitext(fname)[0] + ".motif2factors.txt"
+    for name in [fname, map_file]:
+        if os.path.exists(name):
+            with open(name, "rb") as f:
+                h.update(f.read())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def load_motif_db(infile=None):
+    """Load the binary database of a motif file in pfm format.
+
+    The database is created when it doesn't exist, or when the motif file or
+    the motif2factors file have changed since it was created.
+
+    Parameters
+    ----------
+    infile : str, optional
+        Motif database name or filename of motif file. By default the
+        motif database in the config file is used.
+
+    Returns
+    -------
+    MotifDatabase
+        Motif database.
+    """
+    fname = pfmfile_location(infile)
+
+    def create():
+        with open(fname) as f:
+            motifs = _read_motifs_from_filehandle(f, "pfm")
+        return MotifDatabase.from_motifs(motifs, checksum)
+
+    checksum = _motif_db_checksum(fname)
+    return load_cached(
+        _motif_dbs,
+        os.path.abspath(fname),
+        checksum,
+        cached_file_locations(fname, ".npz", "motif_db"),
+        MotifDatabase.load,
+        create,
+    )
+
+
+def read_motifs(infile=None, fmt="pfm", as_dict=False, lazy=False):
     """
     Read motifs from a file or stream or file-like object.
 
+    Motif files in pfm format are read from a binary database, which is
+    created the first time the file is read, see load_motif_db().
+
     Parameters
     ----------
     infile : string or file-like object, optional
@@ -1508,11 +1832,16 @@ def read_motifs(infile=None, fmt="pfm", as_dict=False):
     as_dict : boolean, optional
         Return motifs as a dictionary with motif_id, motif pairs.
 
+    lazy : boolean, optional
+        Return a MotifDatabase, which creates motifs when they are accessed
+        by position or by id. Only motif files in pfm format can be read
+        lazily.
+
     Returns
     -------
     motifs : list
         List of Motif instances. If as_dict is set to True, motifs is a
-        dictionary.
+        dictionary. If lazy is set to True, motifs is a MotifDatabase.
     """
     # Support old naming
     if fmt == "pwm":
@@ -1520,11 +1849,20 @@ def read_motifs(infile=None, fmt="pfm", as_dict=False):
 
     if infile is None or isinstance(infile, six.string_types):
         infile = pfmfile_location(infile)
-        with open(infile) as f:
-            motifs = _read_motifs_from_filehandle(f, fmt)
+        if fmt == "pfm":
+            motifs = load_motif_db(infile)
+            if lazy:
+                return motifs
+            motifs = list(motifs)
+        else:
+            with open(infile) as f:
+                motifs = _read_motifs_from_filehandle(f, fmt)
     else:
         motifs = _read_motifs_from_filehandle(infile, fmt)
 
+    if lazy:
+        raise ValueError("only motif files in pfm format can be read lazily")
+
     if as_dict:
         motifs = {m.id: m for m in motifs}
 
@@ -0,0 +1,183 @@
+"""Compiled, immutable sets of motifs.
+
+A MotifSet is created once from a motif file or a list of motifs and holds
+everything that is needed for scanning in contiguous arrays. It can be
+pickled and shared with worker processes, see gimmemotifs.pool.share().
+"""
+import logging
+
+import numpy as np
+import six
+import xxhash
+
+from gimmemotifs.motif import Motif, read_motifs
+
+logger = logging.getLogger("gimme.motifset")
+
+
+class MotifSet(object):
+    """Immutable set of motifs, compiled for scanning.
+
+    Parameters
+    ----------
+    motifs : str, list, Motif or MotifSet instance
+        Motif file or database name, list of Motif instances, a single Motif
+        instance or a MotifSet.
+
+    Attributes
+    ----------
+    ids : tuple
+        Motif ids.
+
+    hashes : tuple
+        Motif hashes, see Motif.hash().
+
+    logodds : numpy.ndarray
+        Contiguous float64 array of shape (sum of motif lengths, 4) with the
+        log-odds matrices of all motifs.
+
+    lengths : numpy.ndarray
+        int32 array with the motif lengths.
+
+    offsets : numpy.ndarray
+        int64 array with the start of every motif in logodds, with the total
+        length as last element.
+
+    min_scores, max_scores : numpy.ndarray
+        float64 arrays with the minimum and maximum motif scores.
+
+    digest : str
+        Digest of the exact log-odds matrices, in order. Independent of the
+        motif ids.
+    """
+
+    def __init__(self, motifs):
+        if isinstance(motifs, MotifSet):
+            motifs = motifs.motifs
+        elif isinstance(motifs, six.string_types):
+            motifs = read_motifs(motifs)
+        elif isinstance(motifs, Motif):
+            motifs = [motifs]
+        motifs = tuple(motifs)
+        if len(motifs) == 0:
+            raise ValueError("no motifs")
+
+        hashes = tuple(m.hash() for m in motifs)
+        logodds = np.ascontiguousarray(
+            np.vstack([m.logodds for m in motifs]), dtype=np.float64
+        )
+        lengths = np.array([len(m.logodds) for m in motifs], dtype=np.int32)
+        offsets = np.zeros(len(motifs) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths)
+
+        # Motif.hash() rounds the matrices, the digest uses the exact values
+        h = xxhash.xxh64(logodds.tobytes())
+        h.update(lengths.tobytes())
+
+        self._set_state(
+            {
+                "motifs": motifs,
+                "ids": tuple(m.id for m in motifs),
+                "hashes": hashes,
+                "logodds": logodds,
+                "lengths": lengths,
+                "offsets": offsets,
+                "min_scores": np.array([m.pwm_min_score() for m in motifs]),
+                "max_scores": np.array([m.pwm_max_score() for m in motifs]),
+                "digest": h.hexdigest(),
+            }
+        )
+
+    def _set_state(self, state):
+        index = {}
+        for i, motif_id in enumerate(state["ids"]):
+            index.setdefault(motif_id, i)
+        state["_index"] = index
+        for name, value in state.items():
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+            object.__setattr__(self, name, value)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_index"]
+        return state
+
+    def __setstate__(self, state):
+        self._set_state(state)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("MotifSet is immutable")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.motifs)
+
+    def __getitem__(self, key):
+        """Return a motif by position or by id."""
+        if isinstance(key, six.string_types):
+            key = self.index(key)
+        return self.motifs[key]
+
+    def __contains__(self, motif_id):
+        return motif_id in self._index
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, MotifSet)
+            and self.digest == other.digest
+            and self.ids == other.ids
+        )
+
+    def __hash__(self):
+        return hash((self.digest, self.ids))
+
+    def __repr__(self):
+        return "<MotifSet with {} motifs, {}>".format(len(self), self.digest)
+
+    def index(self, motif_id):
+        """Return the position of a motif (the first, if ids are not unique)."""
+        try:
+            return self._index[motif_id]
+        except KeyError:
+            raise KeyError("motif {} not in MotifSet".format(motif_id))
+
+    def cutoff_array(self, cutoffs):
+        """Return cutoffs as a float64 array in motif order.
+
+        Parameters
+        ----------
+        cutoffs : dict or list
+            Cutoff per motif id, or list of cutoffs in motif order. Motifs
+            with a cutoff of None are not scanned, their cutoff is NaN.
+
+        Returns
+        -------
+        numpy.ndarray
+            Cutoffs.
+        """
+        if isinstance(cutoffs, dict):
+            cutoffs = [cutoffs[motif_id] for motif_id in self.ids]
+        if len(cutoffs) != len(self):
+            raise ValueError("need one cutoff per motif")
+        return np.array([np.nan if c is None else c for c in cutoffs], dtype=np.float64)
+
+    def compile(self, cutoffs):
+        """Return the motifs and cutoffs in the format of compile_motifs().
+
+        Parameters
+        ----------
+        cutoffs : dict, list or numpy.ndarray
+            Cutoffs, see cutoff_array(). An array is used as is.
+
+        Returns
+        -------
+        compiled : tuple
+            Tuple of contiguous arrays: logodds, motif lengths, cutoffs and
+            minimum scores.
+        """
+        if not isinstance(cutoffs, np.ndarray):
+            cutoffs = self.cutoff_array(cutoffs)
+        return self.logodds, self.lengths, cutoffs, self.min_scores
@@ -0,0 +1,427 @@
+"""Process-wide pools of workers.
+
+All parallel code in GimmeMotifs draws its workers from a single pool that is
+started on first use and kept alive until the interpreter exits (or until
+:func:`close_pool` is called). This avoids starting and tearing down a new
+set of processes for every Scanner, MotifComparer or statistics run.
+
+Next to the pool of worker processes there is a pool of threads, for work
+that releases the GIL, such as the scanning functions in ``c_metrics``.
+Threads share the memory of the calling process, so motifs and sequences
+don't have to be pickled.
+
+Large read-only objects that all tasks need, such as a compiled MotifSet,
+can be registered with :func:`share`. While the process pool runs, every
+shared object is written to a file once, which a worker loads the first time
+it needs the object. Tasks look them up with :func:`get_shared` instead of
+receiving a copy with every task.
+
+Arrays that change from one run to the next, such as motif scores, can be
+placed in shared memory with :class:`SharedArray`. Only the name of the
+array is sent with a task.
+"""
+import atexit
+from collections import OrderedDict
+import itertools
+import logging
+import multiprocessing as mp
+from multiprocessing.pool import ThreadPool
+import os
+import pickle
+import tempfile
+import threading
+
+import numpy as np
+import xxhash
+
+from gimmemotifs.config import MotifConfig
+
+logger = logging.getLogger("gimme.pool")
+
+# Restart workers regularly to reclaim memory
+MAXTASKSPERCHILD = 1000
+
+BACKENDS = ("process", "thread")
+
+# Maximum number of shared objects
+MAX_SHARED = 8
+
+# Memory file system for shared arrays
+SHARED_MEMORY_DIR = "/dev/shm"
+
+# Guards the pools, held while a pool is started
+_lock = threading.Lock()
+# backend -> (pool, pid, size)
+_pools = {}
+_default_size = None
+# Guards the shared objects, needed by the tasks of the thread pool
+_shared_lock = threading.Lock()
+# key -> object, available in the workers of the process pool
+_shared = OrderedDict()
+# key -> file of an object shared with the running process pool
+_shared_files = {}
+# Start of the filenames of objects shared with the running process pool, or
+# in a worker process with the pool of the worker
+_shared_prefix = None
+_shared_pid = None
+# Numbers the process pools, every pool has its own shared files
+_pool_numbers = itertools.count()
+# key -> status of the file a worker loaded a shared object from
+_shared_stats = {}
+_is_worker = False
+
+
+def _init_worker(prefix):
+    global _lock, _shared_lock, _shared_prefix, _is_worker
+
+    # The pool is started while the lock is held, workers need a new one
+    _lock = threading.Lock()
+    _shared_lock = threading.Lock()
+    # Objects are loaded from the files of this pool
+    _shared.clear()
+    _shared_files.clear()
+    _shared_stats.clear()
+    _shared_prefix = prefix
+    _is_worker = True
+
+
+def _shared_dir():
+    """Return SHARED_MEMORY_DIR if it can be used, otherwise None."""
+    if os.path.isdir(SHARED_MEMORY_DIR) and os.access(SHARED_MEMORY_DIR, os.W_OK):
+        return SHARED_MEMORY_DIR
+    return None
+
+
+def _shared_file(prefix, key):
+    return prefix + xxhash.xxh64(key).hexdigest() + ".pkl"
+
+
+def _writes_shared_files():
+    """Return True if this process runs a process pool with shared files."""
+    return not _is_worker and _shared_pid == os.getpid()
+
+
+def _write_shared_file(key):
+    """Write a shared object to a file, called with _shared_lock held."""
+    fname = _shared_file(_shared_prefix, key)
+    fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(fname))
+    with os.fdopen(fd, "wb") as f:
+        pickle.dump(_shared[key], f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmpname, fname)
+    _shared_files[key] = fname
+
+
+def _remove_files(fnames):
+    for fname in fnames:
+        if os.path.exists(fname):
+            os.unlink(fname)
+
+
+def _start_shared_files():
+    """Write all shared objects for a new process pool, return the prefix."""
+    global _shared_prefix, _shared_pid, _shared_files
+
+    dirname = _shared_dir() or tempfile.gettempdir()
+    prefix = os.path.join(
+        dirname, "gimme.shared.{}.{}.".format(os.getpid(), next(_pool_numbers))
+    )
+    with _shared_lock:
+        _shared_prefix = prefix
+        _shared_pid = os.getpid()
+        _shared_files = {}
+        for key in _shared:
+            _write_shared_file(key)
+    return prefix
+
+
+def _stop_shared_files():
+    """Stop writing shared files, return the files of the closed pool."""
+    global _shared_prefix, _shared_pid, _shared_files
+
+    with _shared_lock:
+        fnames = list(_shared_files.values())
+        _shared_prefix = _shared_pid = None
+        _shared_files = {}
+    return fnames
+
+
+def _config_ncpus():
+    return int(MotifConfig().get_default_params()["ncpus"])
+
+
+def _check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(
+            "unknown backend {}, choose one of {}".format(backend, ", ".join(BACKENDS))
+        )
+
+
+def pool_size():
+    """Return the number of workers the shared pools use by default.
+
+    Returns
+    -------
+    int
+        Number of workers.
+    """
+    if _default_size is not None:
+        return _default_size
+    return _config_ncpus()
+
+
+def set_pool_size(ncpus=None):
+    """Set the number of workers of the shared pools.
+
+    Running pools of a different size are closed; the next call to
+    :func:`get_pool` starts a new pool of the requested size.
+
+    Parameters
+    ----------
+    ncpus : int, optional
+        Number of workers. If None, the ncpus value from the configuration
+        file is used.
+    """
+    global _default_size
+
+    if ncpus is not None:
+        ncpus = int(ncpus)
+        if ncpus < 1:
+            raise ValueError("number of processes should be at least 1")
+    _default_size = ncpus
+    for backend, (_, _, size) in list(_pools.items()):
+        if size != pool_size():
+            close_pool(backend)
+
+
+def get_pool(ncpus=None, backend="process"):
+    """Return a shared pool, starting it if necessary.
+
+    Both backends return a pool with the :class:`multiprocessing.pool.Pool`
+    interface.
+
+    Parameters
+    ----------
+    ncpus : int, optional
+        Number of workers the caller wants to use, the size of a new pool.
+        A running pool is returned whatever its size, as other callers may
+        still use it; its size can be changed with :func:`set_pool_size`. If
+        None, the default pool size is used.
+
+    backend : str, optional
+        "process" for a pool of worker processes (default) or "thread" for a
+        pool of threads.
+
+    Returns
+    -------
+    multiprocessing.pool.Pool or None
+        The shared pool, or None if the work should run in the calling
+        thread: when one worker is requested, or when a process pool is
+        requested from within a worker process (which is not allowed to start
+        child processes).
+    """
+    _check_backend(backend)
+    if ncpus is None:
+        ncpus = pool_size()
+    ncpus = int(ncpus)
+    if ncpus <= 1:
+        return None
+    if backend == "process" and mp.current_process().daemon:
+        return None
+
+    with _lock:
+        pool, pid, _size = _pools.get(backend, (None, None, None))
+        if pool is not None and pid != os.getpid():
+            # Inherited from the parent process after a fork, not usable here
+            del _pools[backend]
+            pool = None
+        if pool is None:
+            logger.debug("starting %s pool with %s workers", backend, ncpus)
+            if backend == "thread":
+                pool = ThreadPool(processes=ncpus)
+            else:
+                pool = mp.Pool(
+                    processes=ncpus,
+                    maxtasksperchild=MAXTASKSPERCHILD,
+                    initializer=_init_worker,
+                    initargs=(_start_shared_files(),),
+                )
+            _pools[backend] = (pool, os.getpid(), ncpus)
+        return pool
+
+
+def share(key, obj):
+    """Share an object with the workers of the process pool.
+
+    While the process pool runs, the object is written to a file in
+    SHARED_MEMORY_DIR (or the temporary directory), which a worker loads the
+    first time it asks for the object. A pool that is started later writes
+    the files of all shared objects. Running pools are not interrupted. Only
+    the last MAX_SHARED objects are kept, in the calling process as well as
+    in every worker.
+
+    Parameters
+    ----------
+    key : str
+        Key to retrieve the object with :func:`get_shared`, for instance a
+        digest of its contents.
+
+    obj : object
+        Picklable object. It should not be changed after it is shared. An
+        object that was shared earlier with the same key is replaced.
+    """
+    with _shared_lock:
+        if _shared.get(key) is not obj:
+            # A different object replaces the one shared with the same key
+            _shared[key] = obj
+            _shared_files.pop(key, None)
+        _shared.move_to_end(key)
+        while len(_shared) > MAX_SHARED:
+            old_key, _ = _shared.popitem(last=False)
+            _remove_files([_shared_files.pop(old_key, "")])
+
+        # Workers of the running pool load the object from a file, as long as
+        # it is shared by this process
+        if _writes_shared_files() and key not in _shared_files:
+            _write_shared_file(key)
+
+
+def get_shared(key):
+    """Return an object registered with :func:`share`.
+
+    This works in the worker processes and threads of the shared pools, as
+    well as in the calling process.
+
+    Parameters
+    ----------
+    key : str
+        Key of the object.
+
+    Returns
+    -------
+    object
+        The shared object.
+    """
+    with _shared_lock:
+        stat = None
+        if _is_worker:
+            # The file is replaced when another object is shared with the key
+            try:
+                stat = os.stat(_shared_file(_shared_prefix, key))
+                stat = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                pass
+
+        if key in _shared and (stat is None or _shared_stats.get(key) == stat):
+            _shared.move_to_end(key)
+            return _shared[key]
+        if stat is None:
+            raise KeyError("no shared object with key {}".format(key))
+
+        with open(_shared_file(_shared_prefix, key), "rb") as f:
+            _shared[key] = pickle.load(f)
+        _shared.move_to_end(key)
+        _shared_stats[key] = stat
+        while len(_shared) > MAX_SHARED:
+            old_key, _ = _shared.popitem(last=False)
+            _shared_stats.pop(old_key, None)
+        return _shared[key]
+
+
+class SharedArray(object):
+    """Read-only array in shared memory.
+
+    The array is saved to a file in SHARED_MEMORY_DIR, or in the temporary
+    directory if that is not available, and memory-mapped. A pickled
+    SharedArray only holds the filename, so it can be sent to the worker
+    processes with every task: they map the same memory instead of receiving
+    a copy. The file is removed by close(), in the process that created it.
+
+    Parameters
+    ----------
+    array : array_like
+        Array to share.
+    """
+
+    def __init__(self, array):
+        fd, self.fname = tempfile.mkstemp(
+            prefix="gimme.", suffix=".npy", dir=_shared_dir()
+        )
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, np.ascontiguousarray(array))
+        self._pid = os.getpid()
+        self._array = None
+
+    def __getstate__(self):
+        return {"fname": self.fname}
+
+    def __setstate__(self, state):
+        self.fname = state["fname"]
+        self._pid = None
+        self._array = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def array(self):
+        """numpy.ndarray: The memory-mapped array."""
+        if self._array is None:
+            self._array = np.load(self.fname, mmap_mode="r")
+        return self._array
+
+    def close(self):
+        """Unmap the array, the process that created it removes the file."""
+        self._array = None
+        if self._pid == os.getpid() and os.path.exists(self.fname):
+            os.unlink(self.fname)
+
+
+def _take_pool(backend):
+    """Remove a pool from the shared pools.
+
+    Called with _lock held. Returns the pool, if it can be closed by this
+    process, and the shared files of the pool.
+    """
+    pool, pid, _size = _pools.pop(backend, (None, None, None))
+    if pool is None or pid != os.getpid():
+        return None, []
+    if backend == "process":
+        return pool, _stop_shared_files()
+    return pool, []
+
+
+def _finish_pool(pool, fnames):
+    """Close a pool returned by _take_pool(), without holding _lock."""
+    if pool is None:
+        return
+    # Wait for all submitted jobs to finish
+    pool.close()
+    pool.join()
+    _remove_files(fnames)
+
+
+def close_pool(backend=None):
+    """Close a shared pool and wait for its workers to finish.
+
+    A new pool is started by the next call to :func:`get_pool`.
+
+    Parameters
+    ----------
+    backend : str, optional
+        Backend of the pool to close. By default all pools are closed.
+    """
+    if backend is not None:
+        _check_backend(backend)
+    with _lock:
+        pools = [
+            _take_pool(name) for name in BACKENDS if backend is None or name == backend
+        ]
+    # Tasks that are still running may need the locks
+    for pool, fnames in pools:
+        _finish_pool(pool, fnames)
+
+
+atexit.register(close_pool)
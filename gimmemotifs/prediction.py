@@ -22,6 +22,7 @@ from gimmemotifs import tools as tool_classes
 from gimmemotifs.config import MotifConfig, parse_denovo_params
 from gimmemotifs.fasta import Fasta
 from gimmemotifs import mytmpdir
+from gimmemotifs.pool import get_pool
 from gimmemotifs.stats import calc_stats
 
 logger = logging.getLogger("gimme.prediction")
@@ -97,7 +98,7 @@ class PredictionResult(object):
         if job_server:
             self.job_server = job_server
         else:
-            self.job_server = Pool(2)
+            self.job_server = get_pool(2)
         self.counter = 0
         self.do_counter = do_counter
 
@@ -249,7 +250,10 @@ def pp_predict_motifs(
 
     if not job_server:
         n_cpus = int(config.get_default_params()["ncpus"])
-        job_server = Pool(processes=n_cpus, maxtasksperchild=1000)
+        job_server = get_pool(n_cpus)
+        if job_server is None:
+            # Tools always run asynchronously, use a single worker process
+            job_server = Pool(processes=1, maxtasksperchild=1000)
 
     jobs = {}
 
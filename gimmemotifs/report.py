@@ -7,7 +7,6 @@
 import os
 import sys
 from datetime import datetime
-from multiprocessing import Pool
 import re
 import shutil
 import logging
@@ -22,6 +21,7 @@ from gimmemotifs.fasta import Fasta
 from gimmemotifs.motif import read_motifs
 from gimmemotifs.config import MotifConfig, DIRECT_NAME, INDIRECT_NAME
 from gimmemotifs.plot import roc_plot
+from gimmemotifs.pool import get_pool
 from gimmemotifs.stats import calc_stats, add_star, write_stats
 from gimmemotifs import __version__
 from gimmemotifs.utils import motif_localization
@@ -53,15 +53,17 @@ def create_roc_plots(pfmfile, fgfa, background, outdir, genome):
     """Make ROC plots for all motifs."""
     motifs = read_motifs(pfmfile, fmt="pwm", as_dict=True)
     ncpus = int(MotifConfig().get_default_params()["ncpus"])
-    pool = Pool(processes=ncpus)
+    pool = get_pool(ncpus)
     jobs = {}
     for bg, fname in background.items():
         for m_id, m in motifs.items():
 
             k = "{}_{}".format(str(m), bg)
-            jobs[k] = pool.apply_async(
-                get_roc_values, (motifs[m_id], fgfa, fname, genome)
-            )
+            args = (motifs[m_id], fgfa, fname, genome)
+            if pool is None:
+                jobs[k] = get_roc_values(*args)
+            else:
+                jobs[k] = pool.apply_async(get_roc_values, args)
     imgdir = os.path.join(outdir, "images")
     if not os.path.exists(imgdir):
         os.mkdir(imgdir)
@@ -71,7 +73,10 @@ def create_roc_plots(pfmfile, fgfa, background, outdir, genome):
     for motif in motifs.values():
         for bg in background:
             k = "{}_{}".format(str(motif), bg)
-            error, x, y = jobs[k].get()
+            if pool is None:
+                error, x, y = jobs[k]
+            else:
+                error, x, y = jobs[k].get()
             if error:
                 logger.error("Error in thread: %s", error)
                 logger.error("Motif: %s", motif)
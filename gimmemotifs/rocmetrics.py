@@ -10,7 +10,7 @@ on the basis of motif scanning results.
 """
 
 # External imports
-from scipy.stats import stats, scoreatpercentile, kstest, fisher_exact
+from scipy.stats import stats, scoreatpercentile, kstest, fisher_exact, hypergeom
 from sklearn.metrics import (
     precision_recall_curve,
     roc_auc_score,
@@ -581,3 +581,269 @@ def ks_significance(fg_pos, bg_pos=None):
         return -np.log10(p)
     else:
         return np.inf
+
+
+# Metrics of score_metrics_matrix()
+MATRIX_METRICS = (
+    "recall_at_fdr",
+    "fraction_fpr",
+    "score_at_fpr",
+    "enr_at_fpr",
+    "max_enrichment",
+    "phyper_at_fpr",
+    "matches_at_fpr",
+    "mncp",
+    "roc_auc",
+    "roc_auc_xlim",
+    "pr_auc",
+    "max_fmeasure",
+)
+
+# Maximum size of one of the arrays of a block of motifs
+MATRIX_BLOCK_BYTES = 2 ** 25
+
+
+def _matrix_block_metrics(fg, bg, metrics):
+    """Return the metrics of a block of columns, see score_metrics_matrix()."""
+    n_fg, n_bg = len(fg), len(bg)
+    n = n_fg + n_bg
+    scores = np.vstack((fg, bg))
+    y_true = np.hstack((np.ones(n_fg), np.zeros(n_bg)))
+    rows = np.arange(n)[:, None]
+
+    # Descending, ties in the reverse order of an ascending sort, as
+    # max_enrichment()
+    order = np.argsort(scores, axis=0)[::-1]
+    values = np.take_along_axis(scores, order, axis=0)
+    labels = y_true[order]
+    tps = np.cumsum(labels, axis=0)
+    fps = rows + 1 - tps
+
+    # First and last row of every group of equal scores
+    changes = values[1:] != values[:-1]
+    is_start = np.vstack((np.ones((1, values.shape[1]), dtype=bool), changes))
+    is_end = np.vstack((changes, np.ones((1, values.shape[1]), dtype=bool)))
+    starts = np.maximum.accumulate(np.where(is_start, rows, 0), axis=0)
+    ends = np.minimum.accumulate(np.where(is_end, rows, n)[::-1], axis=0)[::-1]
+
+    result = {}
+    if "roc_auc" in metrics or "mncp" in metrics:
+        # Average rank of every score, ascending
+        total_rank = n - (starts + ends) / 2.0
+
+    if "roc_auc" in metrics:
+        rank_sum = (labels * total_rank).sum(axis=0)
+        result["roc_auc"] = (rank_sum - n_fg * (n_fg + 1) / 2.0) / (n_fg * n_bg)
+
+    if "mncp" in metrics:
+        # Rank in the positive set
+        fg_before = np.take_along_axis(tps - labels, starts, axis=0)
+        fg_equal = np.take_along_axis(tps, ends, axis=0) - fg_before
+        fg_rank = n_fg - fg_before - (fg_equal - 1) / 2.0
+        slopes = ((n_fg - fg_rank + 1) / n_fg) / ((n - total_rank + 1) / n)
+        result["mncp"] = (labels * slopes).sum(axis=0) / n_fg
+
+    if "pr_auc" in metrics or "recall_at_fdr" in metrics:
+        precision = tps / (rows + 1)
+
+    if "pr_auc" in metrics:
+        # Every positive adds to the recall at the end of its group
+        result["pr_auc"] = (labels * np.take_along_axis(precision, ends, axis=0)).sum(
+            axis=0
+        ) / n_fg
+
+    if "recall_at_fdr" in metrics:
+        # The lowest threshold with a FDR below the cutoff
+        keep = is_end & (1 - precision <= 0.1)
+        last = n - 1 - np.argmax(keep[::-1], axis=0)
+        recall = np.take_along_axis(tps, last[None], axis=0)[0] / n_fg
+        result["recall_at_fdr"] = np.where(keep.any(axis=0), recall, 0.0)
+
+    if "max_enrichment" in metrics:
+        # The top i scores, i < number of scores
+        fg_count = tps - labels
+        bg_count = rows - fg_count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            enr = (fg_count / n_fg) / (bg_count / n_bg)
+        enr = np.where(bg_count >= 2, enr, 0)
+        result["max_enrichment"] = np.maximum(0, enr.max(axis=0))
+
+    if "max_fmeasure" in metrics:
+        x = fps / n_bg
+        y = tps / n_fg
+        p = y / (y + x)
+        with np.errstate(invalid="ignore"):
+            f = (2 * p * y) / (p + y)
+        f = np.where(is_end & (p * y > 0) & (p + y > 0), f, -np.inf).max(axis=0)
+        f[np.isinf(f)] = np.nan
+        result["max_fmeasure"] = f
+
+    if "roc_auc_xlim" in metrics:
+        xlim = 0.1
+        # Points at every distinct score, without the origin, as
+        # roc_auc_xlim()
+        x = 1 - (n_bg - fps) / float(n_bg)
+        y = 1 - (n_fg - tps) / float(n_fg)
+        prev = np.maximum.accumulate(np.where(is_end, rows, -1), axis=0)
+        prev = np.vstack((np.full((1, values.shape[1]), -1), prev[:-1]))
+        has_prev = is_end & (prev >= 0)
+        prev = np.maximum(prev, 0)
+        prev_x = np.take_along_axis(x, prev, axis=0)
+        prev_y = np.take_along_axis(y, prev, axis=0)
+        dx = x - prev_x
+        area = y * dx - (dx * (y - prev_y) / 2.0)
+        auc = np.where(has_prev & (x <= xlim), area, 0).sum(axis=0)
+
+        # The first point beyond xlim
+        beyond = has_prev & (x > xlim)
+        first = np.argmax(beyond, axis=0)[None]
+        x1, y1, x0, y0 = [
+            np.take_along_axis(a, first, axis=0)[0] for a in [x, y, prev_x, prev_y]
+        ]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            partial = y0 * (xlim - x0) + (
+                (y1 - y0) / (x1 - x0) * (xlim - x0) * (xlim - x0) / 2
+            )
+        result["roc_auc_xlim"] = auc + np.where(beyond.any(axis=0), partial, 0)
+
+    fpr_metrics = [
+        "fraction_fpr",
+        "score_at_fpr",
+        "enr_at_fpr",
+        "phyper_at_fpr",
+        "matches_at_fpr",
+    ]
+    if any(m in metrics for m in fpr_metrics):
+        s = np.percentile(bg, 100 - 0.01 * 100, axis=0)
+        fg_matches = (fg >= s).sum(axis=0)
+        bg_matches = (bg >= s).sum(axis=0)
+        result["score_at_fpr"] = s
+        result["fraction_fpr"] = fg_matches / float(n_fg)
+        with np.errstate(divide="ignore"):
+            result["enr_at_fpr"] = np.where(
+                bg_matches == 0,
+                np.inf,
+                fg_matches / bg_matches.astype(float) * n_bg / float(n_fg),
+            )
+        result["phyper_at_fpr"] = hypergeom.sf(
+            fg_matches - 1, n, fg_matches + bg_matches, n_fg
+        )
+        result["matches_at_fpr"] = np.stack((fg_matches, bg_matches), axis=1)
+
+    return dict((m, result[m]) for m in metrics)
+
+
+def score_metrics_matrix(fg_scores, bg_scores, metrics=None):
+    """
+    Computes score-based metrics of many motifs at once.
+
+    The scores of every motif are ranked once, column-wise. The ROC AUC is
+    calculated from the rank sum of the positive set, the PR AUC from
+    cumulative counts. The results are the same as those of the individual
+    metric functions, with their default arguments, up to floating point
+    precision.
+
+    Parameters
+    ----------
+    fg_scores : array_like
+        Best motif scores of the positive set, array or DataFrame of shape
+        (number of sequences, number of motifs).
+
+    bg_scores : array_like
+        Best motif scores of the negative set, with the same number of
+        columns.
+
+    metrics : list, optional
+        Names of the metrics, see MATRIX_METRICS. By default all metrics in
+        __all__ that require scores.
+
+    Returns
+    -------
+    result : dict
+        For every metric an array with the value per motif. The values of
+        matches_at_fpr are an array of shape (number of motifs, 2), with the
+        number of matches in the positive and the negative set. A value of
+        max_fmeasure is NaN where max_fmeasure() returns None.
+    """
+    if metrics is None:
+        metrics = [m for m in __all__ if globals()[m].input_type == "score"]
+    for metric in metrics:
+        if metric not in MATRIX_METRICS:
+            raise ValueError("{} is not available for a score matrix".format(metric))
+
+    fg = np.asarray(fg_scores, dtype=float)
+    bg = np.asarray(bg_scores, dtype=float)
+    if fg.ndim != 2 or bg.ndim != 2 or fg.shape[1] != bg.shape[1]:
+        raise ValueError("need two score matrices with the same number of columns")
+
+    if len(fg) == 0 or len(bg) == 0:
+        # Not all metrics are defined, leave it to the metric functions
+        result = {}
+        for metric in metrics:
+            func = globals()[metric]
+            values = [func(list(fg[:, i]), list(bg[:, i])) for i in range(fg.shape[1])]
+            values = [np.nan if v is None else v for v in values]
+            result[metric] = np.array(values, dtype=float)
+        return result
+
+    step = max(1, MATRIX_BLOCK_BYTES // ((len(fg) + len(bg)) * 8))
+    blocks = [
+        _matrix_block_metrics(fg[:, i : i + step], bg[:, i : i + step], metrics)
+        for i in range(0, fg.shape[1], step)
+    ]
+    return dict((m, np.concatenate([block[m] for block in blocks])) for m in metrics)
+
+
+def score_metrics(fg_vals, bg_vals, metrics=None):
+    """
+    Computes several score-based metrics at once.
+
+    The values are sorted once and all metrics in MATRIX_METRICS are
+    derived from the same sort, as a score matrix with a single column, see
+    score_metrics_matrix(). The results are the same as those of the
+    individual metric functions, with their default arguments, up to
+    floating point precision.
+
+    Parameters
+    ----------
+    fg_vals : array_like
+        The list of values for the positive set.
+
+    bg_vals : array_like
+        The list of values for the negative set.
+
+    metrics : list, optional
+        Names of the metrics, by default all metrics in __all__ that require
+        scores.
+
+    Returns
+    -------
+    result : dict
+        Metric values by name.
+    """
+    if metrics is None:
+        metrics = [m for m in __all__ if globals()[m].input_type == "score"]
+    for metric in metrics:
+        if globals()[metric].input_type != "score":
+            raise ValueError("{} does not use scores".format(metric))
+
+    if len(fg_vals) == 0 or len(bg_vals) == 0:
+        # Not all metrics are defined, leave it to the metric functions
+        return dict((m, globals()[m](fg_vals, bg_vals)) for m in metrics)
+
+    fg = np.asarray(fg_vals, dtype=float)[:, None]
+    bg = np.asarray(bg_vals, dtype=float)[:, None]
+    column = _matrix_block_metrics(fg, bg, [m for m in metrics if m in MATRIX_METRICS])
+    result = {}
+    for metric in metrics:
+        if metric not in column:
+            result[metric] = globals()[metric](fg_vals, bg_vals)
+            continue
+        value = column[metric][0]
+        if metric == "matches_at_fpr":
+            result[metric] = [int(v) for v in value]
+        elif metric == "max_fmeasure" and np.isnan(value):
+            result[metric] = None
+        else:
+            result[metric] = float(value)
+    return result
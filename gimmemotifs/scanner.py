@@ -2,6 +2,7 @@ import os
 import re
 import sys
 from functools import partial
+from itertools import chain
 from tempfile import mkdtemp, NamedTemporaryFile
 import logging
 import multiprocessing as mp
@@ -18,15 +19,38 @@ except ImportError:
 from genomepy import Genome
 from diskcache import Cache
 import numpy as np
-from scipy.stats import scoreatpercentile
+import xxhash
 
 from gimmemotifs import __version__
 from gimmemotifs.background import RandomGenomicFasta, gc_bin_bedfile
+from gimmemotifs.cache import make_cache, seq_digest
 from gimmemotifs.config import MotifConfig, CACHE_DIR
 from gimmemotifs.fasta import Fasta
-from gimmemotifs.c_metrics import pwmscan
+from gimmemotifs.c_metrics import (
+    pwmscan_multi,
+    pwmscan_multi_array,
+    pwmscan_best,
+    pwmscan_count,
+    pwmscan_count_best,
+)
 from gimmemotifs.motif import read_motifs
-from gimmemotifs.utils import parse_cutoff, as_fasta, file_checksum, rc
+from gimmemotifs.motifset import MotifSet
+from gimmemotifs.pool import get_pool, get_shared, share, BACKENDS
+from gimmemotifs.score_distribution import (
+    background_model,
+    fpr_threshold,
+    pvalue_threshold,
+    ScoreCDF,
+)
+from gimmemotifs.utils import (
+    parse_cutoff,
+    as_fasta,
+    as_fasta_chunks,
+    file_checksum,
+    rc,
+    encode_seq,
+    HIT_DTYPE,
+)
 
 
 try:
@@ -43,14 +67,6 @@ try:
 except Exception:
     pass
 
-# only used when using cache, should not be a requirement
-try:
-    from dogpile.cache import make_region
-    from dogpile.cache.api import NO_VALUE
-    import xxhash
-except ImportError:
-    pass
-
 logger = logging.getLogger("gimme.scanner")
 config = MotifConfig()
 
@@ -58,7 +74,16 @@ lock = mp.Lock()
 
 
 def _format_line(
-    seq, seq_id, motif, score, pos, strand, bed=False, seq_p=None, strandmap=None
+    seq,
+    seq_id,
+    motif,
+    score,
+    pos,
+    strand,
+    bed=False,
+    seq_p=None,
+    strandmap=None,
+    hit_pvalue=None,
 ):
     if seq_p is None:
         seq_p = re.compile(r"([^\s:]+):(\d+)-(\d+)")
@@ -69,7 +94,7 @@ def _format_line(
         if m:
             chrom = m.group(1)
             start = int(m.group(2))
-            return "{}\t{}\t{}\t{}\t{}\t{}".format(
+            line = "{}\t{}\t{}\t{}\t{}\t{}".format(
                 chrom,
                 start + pos,
                 start + pos + len(motif),
@@ -78,11 +103,14 @@ def _format_line(
                 strandmap[strand],
             )
         else:
-            return "{}\t{}\t{}\t{}\t{}\t{}".format(
+            line = "{}\t{}\t{}\t{}\t{}\t{}".format(
                 seq_id, pos, pos + len(motif), motif.id, score, strandmap[strand]
             )
+        if hit_pvalue is not None:
+            line += "\t{:.4g}".format(hit_pvalue)
+        return line
     else:
-        return '{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\tmotif_name "{}" ; motif_instance "{}"'.format(
+        line = '{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\tmotif_name "{}" ; motif_instance "{}"'.format(
             seq_id,
             "pfmscan",
             "misc_feature",
@@ -94,10 +122,13 @@ def _format_line(
             motif.id,
             seq[pos : pos + len(motif)],
         )
+        if hit_pvalue is not None:
+            line += ' ; pvalue "{:.4g}"'.format(hit_pvalue)
+        return line
 
 
 def scan_table(
-    s, inputfile, fa, motifs, cutoff, bgfile, nreport, scan_rc, pvalue, moods
+    s, inputfile, chunks, motifs, cutoff, bgfile, nreport, scan_rc, pvalue, moods
 ):
     # header
     yield "\t{}".format("\t".join([m.id for m in motifs]))
@@ -109,29 +140,30 @@ def scan_table(
         for seq_id, counts in result_it:
             yield "{}\t{}".format(seq_id, "\t".join([str(x) for x in counts]))
     else:
-        # get iterator
-        result_it = s.count(fa, nreport, scan_rc)
-        # counts table
-        for i, counts in enumerate(result_it):
-            yield "{}\t{}".format(fa.ids[i], "\t".join([str(x) for x in counts]))
+        for fa in chunks:
+            # counts table
+            for i, counts in enumerate(s.count(fa, nreport, scan_rc)):
+                yield "{}\t{}".format(fa.ids[i], "\t".join([str(x) for x in counts]))
 
 
-def scan_score_table(s, fa, motifs, scan_rc, zscore=False, gcnorm=False):
+def scan_score_table(s, chunks, motifs, scan_rc, zscore=False, gcnorm=False):
 
     s.set_threshold(threshold=0.0, gc=gcnorm)
-    # get iterator
-    result_it = s.best_score(fa, scan_rc, zscore=zscore, gc=gcnorm)
     # header
     yield "\t{}".format("\t".join([m.id for m in motifs]))
     # score table
-    for i, scores in enumerate(result_it):
-        yield "{}\t{}".format(fa.ids[i], "\t".join(["{:4f}".format(x) for x in scores]))
+    for fa in chunks:
+        result_it = s.best_score(fa, scan_rc, zscore=zscore, gc=gcnorm)
+        for i, scores in enumerate(result_it):
+            yield "{}\t{}".format(
+                fa.ids[i], "\t".join(["{:4f}".format(x) for x in scores])
+            )
 
 
 def scan_normal(
     s,
     inputfile,
-    fa,
+    chunks,
     motifs,
     cutoff,
     bgfile,
@@ -142,10 +174,13 @@ def scan_normal(
     bed,
     zscore,
     gcnorm,
+    hit_pvalue=False,
 ):
 
     table = False
     if moods:
+        # MOODS scans the complete input file, chunks contains all sequences
+        fa = chunks[0]
         result_it = scan_it_moods(
             inputfile, motifs, cutoff, bgfile, nreport, scan_rc, pvalue, table
         )
@@ -156,13 +191,26 @@ def scan_normal(
                         fa[seq_id], seq_id, motif, score, pos, strand, bed=bed
                     )
     else:
-        result_it = s.scan(fa, nreport, scan_rc, zscore, gc=gcnorm)
-        for i, result in enumerate(result_it):
-            seq_id = fa.ids[i]
-            seq = fa[seq_id]
-            for motif, matches in zip(motifs, result):
-                for (score, pos, strand) in matches:
-                    yield _format_line(seq, seq_id, motif, score, pos, strand, bed=bed)
+        for fa in chunks:
+            result_it = s.scan(fa, nreport, scan_rc, zscore, gc=gcnorm)
+            for seq_id, seq, result in zip(fa.ids, fa.seqs, result_it):
+                for motif, matches in zip(motifs, result):
+                    pvalues = [None] * len(matches)
+                    if hit_pvalue and len(matches) > 0:
+                        pvalues = s.hit_pvalues(
+                            motif.id, [m[0] for m in matches], seq=seq
+                        )
+                    for (score, pos, strand), p in zip(matches, pvalues):
+                        yield _format_line(
+                            seq,
+                            seq_id,
+                            motif,
+                            score,
+                            pos,
+                            strand,
+                            bed=bed,
+                            hit_pvalue=p,
+                        )
 
 
 def command_scan(
@@ -182,39 +230,64 @@ def command_scan(
     ncpus=None,
     zscore=False,
     gcnorm=False,
+    chunksize=10000,
+    hit_pvalue=False,
 ):
-    motifs = read_motifs(pfmfile)
+    if hit_pvalue and (zscore or moods):
+        raise ValueError("p-values of matches are based on the logodds score")
 
-    fa = as_fasta(inputfile, genome)
+    # The input is read in chunks of sequences, the background size is
+    # based on the first chunk.
+    if moods:
+        chunks = [as_fasta(inputfile, genome)]
+    else:
+        chunks = as_fasta_chunks(inputfile, genome, chunksize=chunksize)
+    first = next(iter(chunks), None)
+    if first is None:
+        return
+    if not moods:
+        chunks = chain([first], chunks)
 
     # initialize scanner
     s = Scanner(ncpus=ncpus)
     s.set_motifs(pfmfile)
+    motifs = list(s.motifs)
 
     if genome:
         s.set_genome(genome=genome)
 
     if genome:
         s.set_background(
-            genome=genome, fname=bgfile, size=fa.median_length(), gc=gcnorm
+            genome=genome, fname=bgfile, size=first.median_length(), gc=gcnorm
         )
     if bgfile:
-        s.set_background(genome=genome, fname=bgfile, size=fa.median_length())
+        s.set_background(genome=genome, fname=bgfile, size=first.median_length())
 
     if not score_table:
         s.set_threshold(fpr=fpr, threshold=cutoff)
+        if hit_pvalue and not (table or s.score_cdf):
+            s.set_score_cdf(gc=gcnorm)
 
     if table:
         it = scan_table(
-            s, inputfile, fa, motifs, cutoff, bgfile, nreport, scan_rc, pvalue, moods
+            s,
+            inputfile,
+            chunks,
+            motifs,
+            cutoff,
+            bgfile,
+            nreport,
+            scan_rc,
+            pvalue,
+            moods,
         )
     elif score_table:
-        it = scan_score_table(s, fa, motifs, scan_rc, zscore=zscore, gcnorm=gcnorm)
+        it = scan_score_table(s, chunks, motifs, scan_rc, zscore=zscore, gcnorm=gcnorm)
     else:
         it = scan_normal(
             s,
             inputfile,
-            fa,
+            chunks,
             motifs,
             cutoff,
             bgfile,
@@ -225,6 +298,7 @@ def command_scan(
             bed,
             zscore=zscore,
             gcnorm=gcnorm,
+            hit_pvalue=hit_pvalue,
         )
 
     for row in it:
@@ -249,6 +323,7 @@ def scan_to_file(
     ncpus=None,
     zscore=True,
     gcnorm=True,
+    hit_pvalue=False,
 ):
     """Scan an inputfile with motifs.
     """
@@ -286,6 +361,8 @@ def scan_to_file(
             print("# Scoring: normalized z-score", file=fo)
     else:
         print("# Scoring: logodds score", file=fo)
+    if hit_pvalue:
+        print("# p-value: fraction of background sequences with a match", file=fo)
 
     for line in command_scan(
         inputfile,
@@ -304,6 +381,7 @@ def scan_to_file(
         ncpus=ncpus,
         zscore=zscore,
         gcnorm=gcnorm,
+        hit_pvalue=hit_pvalue,
     ):
         print(line, file=fo)
 
@@ -341,8 +419,7 @@ def scan_to_best_match(
     if genome:
         s.set_genome(genome)
 
-    if isinstance(motifs, six.string_types):
-        motifs = read_motifs(motifs)
+    motifs = list(s.motifs)
 
     logger.debug("scanning %s...", fname)
     result = dict([(m.id, []) for m in motifs])
@@ -354,15 +431,15 @@ def scan_to_best_match(
         for motif, score in zip(motifs, scores):
             result[motif.id].append(score)
 
-    # Close the pool and reclaim memory
-    del s
-
     return result
 
 
-def parse_threshold_values(motif_file, cutoff):
-    motifs = read_motifs(motif_file)
-    d = parse_cutoff(motifs, cutoff)
+def parse_threshold_values(motif_file, cutoff, fpr=None):
+    if isinstance(motif_file, six.string_types):
+        motifs = read_motifs(motif_file)
+    else:
+        motifs = list(motif_file)
+    d = parse_cutoff(motifs, cutoff, fpr=fpr)
     threshold = {}
     for m in motifs:
         c = m.pwm_min_score() + (m.pwm_max_score() - m.pwm_min_score()) * d[m.id]
@@ -370,21 +447,178 @@ def parse_threshold_values(motif_file, cutoff):
     return threshold
 
 
+def _threshold_value(motif, threshold):
+    """Return the scanning cutoff of a motif score threshold."""
+    if np.isclose(threshold, motif.pwm_max_score()):
+        return None
+    elif np.isclose(threshold, motif.pwm_min_score()):
+        return 0.0
+    return threshold
+
+
+def compile_motifs(motifs):
+    """Compile motifs and their cutoffs for scanning with pwmscan_multi.
+
+    Parameters
+    ----------
+    motifs : list
+        List of (Motif instance, cutoff) tuples. Motifs with a cutoff of
+        None are not scanned.
+
+    Returns
+    -------
+    compiled : tuple
+        Tuple of contiguous arrays: logodds (sum of motif lengths x 4),
+        motif lengths, cutoffs and minimum scores.
+    """
+    pwms = np.ascontiguousarray(
+        np.vstack([m.logodds for m, _ in motifs]), dtype=np.float64
+    )
+    lengths = np.array([len(m.logodds) for m, _ in motifs], dtype=np.int32)
+    cutoffs = np.array(
+        [np.nan if c is None else c for _, c in motifs], dtype=np.float64
+    )
+    min_scores = np.array([m.pwm_min_score() for m, _ in motifs], dtype=np.float64)
+    return pwms, lengths, cutoffs, min_scores
+
+
+def _scan_shared(seqs, scan_func, key, cutoffs, **kwargs):
+    """Run scan_func with the motifs of a MotifSet shared with the workers."""
+    motifs = get_shared(key).compile(cutoffs)
+    return scan_func(seqs, motifs=motifs, **kwargs)
+
+
+def scan_sequence_array(seq, motifs, nreport, scan_rc):
+    """Scan a sequence and return the matches as arrays.
+
+    Parameters
+    ----------
+    seq : str or numpy.ndarray
+        Sequence, or sequence encoded with encode_seq().
+    motifs : tuple
+        Motifs compiled by compile_motifs().
+    nreport : int
+        Maximum number of matches to report per motif, should be >= 1.
+    scan_rc : bool
+        Scan the reverse complement.
+
+    Returns
+    -------
+    hits : numpy.ndarray
+        Array of shape (number of motifs, nreport) with HIT_DTYPE records.
+    counts : numpy.ndarray
+        Number of matches of every motif.
+    """
+    if isinstance(seq, str):
+        seq = encode_seq(seq)
+    n_motifs = len(motifs[1])
+    hits = np.zeros((n_motifs, nreport), dtype=HIT_DTYPE)
+    counts = np.zeros(n_motifs, dtype=np.int32)
+    pwmscan_multi_array(seq, *motifs, nreport, scan_rc, hits, counts)
+    return hits, counts
+
+
 def scan_sequence(seq, motifs, nreport, scan_rc):
+    """Scan a sequence with a set of motifs compiled by compile_motifs()."""
+    if nreport == 0:
+        return pwmscan_multi(seq, *motifs, nreport, scan_rc)
+    hits, counts = scan_sequence_array(seq, motifs, nreport, scan_rc)
+    return [row[:n].tolist() for row, n in zip(hits, counts)]
+
+
+def _encode_block(seqs):
+    """Encode and concatenate sequences, return the codes and the offsets."""
+    codes = encode_seq("".join(seqs))
+    offsets = np.zeros(len(seqs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(seq) for seq in seqs])
+    return codes, offsets
+
+
+def _gc_fraction(seqs):
+    """Return the GC fraction of every sequence, rounded to two decimals."""
+    codes, offsets = _encode_block(seqs)
+    gc_cumsum = np.zeros(len(codes) + 1, dtype=np.int64)
+    np.cumsum((codes == 1) | (codes == 2), out=gc_cumsum[1:])
+    gc_counts = gc_cumsum[offsets[1:]] - gc_cumsum[offsets[:-1]]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gc = gc_counts / np.diff(offsets)
+    # There are few distinct fractions. Python's round() is used instead of
+    # np.round(), which rounds differently halfway between two decimals.
+    values, idx = np.unique(gc, return_inverse=True)
+    return np.array([round(x, 2) for x in values.tolist()])[idx]
+
+
+def scan_seq_best(seqs, motifs, scan_rc):
+    """Return the best score of every motif in every sequence.
 
-    ret = []
-    # scan for motifs
-    for motif, cutoff in motifs:
-        if cutoff is None:
-            ret.append([])
-        else:
-            result = pwmscan(seq, motif.logodds, cutoff, nreport, scan_rc)
-            if cutoff <= motif.pwm_min_score() and len(result) == 0:
-                result = [[motif.pwm_min_score(), 0, 1]] * nreport
-            ret.append(result)
+    Parameters
+    ----------
+    seqs : list
+        List of sequences.
+    motifs : tuple
+        Motifs compiled by compile_motifs().
+    scan_rc : bool
+        Scan the reverse complement.
 
-    # return results
-    return ret
+    Returns
+    -------
+    scores : numpy.ndarray
+        float32 array of shape (number of sequences, number of motifs).
+    """
+    scores = np.empty((len(seqs), len(motifs[1])), dtype=np.float32)
+    pwmscan_best(*_encode_block(seqs), *motifs, scan_rc, scores)
+    return scores
+
+
+def scan_seq_count(seqs, motifs, nreport, scan_rc):
+    """Return the number of matches of every motif in every sequence.
+
+    Parameters
+    ----------
+    seqs : list
+        List of sequences.
+    motifs : tuple
+        Motifs compiled by compile_motifs().
+    nreport : int
+        Maximum number of matches to count per motif, 0 to count all matches.
+    scan_rc : bool
+        Scan the reverse complement.
+
+    Returns
+    -------
+    counts : numpy.ndarray
+        int32 array of shape (number of sequences, number of motifs).
+    """
+    counts = np.empty((len(seqs), len(motifs[1])), dtype=np.int32)
+    pwmscan_count(*_encode_block(seqs), *motifs, nreport, scan_rc, counts)
+    return counts
+
+
+def scan_seq_count_best(seqs, motifs, nreport, scan_rc):
+    """Return the number of matches and the best score in a single pass.
+
+    Parameters
+    ----------
+    seqs : list
+        List of sequences.
+    motifs : tuple
+        Motifs compiled by compile_motifs().
+    nreport : int
+        Maximum number of matches to count per motif, 0 to count all matches.
+    scan_rc : bool
+        Scan the reverse complement.
+
+    Returns
+    -------
+    counts : numpy.ndarray
+        int32 array of shape (number of sequences, number of motifs).
+    scores : numpy.ndarray
+        float32 array of shape (number of sequences, number of motifs).
+    """
+    counts = np.empty((len(seqs), len(motifs[1])), dtype=np.int32)
+    scores = np.empty((len(seqs), len(motifs[1])), dtype=np.float32)
+    pwmscan_count_best(*_encode_block(seqs), *motifs, nreport, scan_rc, counts, scores)
+    return counts, scores
 
 
 def scan_region(region, genome, motifs, nreport, scan_rc):
@@ -404,6 +638,39 @@ def scan_seq_mult(seqs, motifs, nreport, scan_rc):
     return ret
 
 
+def scan_seq_mult_array(seqs, motifs, nreport, scan_rc):
+    """Scan sequences and return the matches of all sequences as arrays.
+
+    Parameters
+    ----------
+    seqs : list
+        List of sequences.
+    motifs : tuple
+        Motifs compiled by compile_motifs().
+    nreport : int
+        Maximum number of matches to report per motif, should be >= 1.
+    scan_rc : bool
+        Scan the reverse complement.
+
+    Returns
+    -------
+    hits : numpy.ndarray
+        Array of shape (number of sequences, number of motifs, nreport) with
+        HIT_DTYPE records.
+    counts : numpy.ndarray
+        int32 array of shape (number of sequences, number of motifs) with the
+        number of matches.
+    """
+    n_motifs = len(motifs[1])
+    hits = np.zeros((len(seqs), n_motifs, nreport), dtype=HIT_DTYPE)
+    counts = np.zeros((len(seqs), n_motifs), dtype=np.int32)
+    for i, seq in enumerate(seqs):
+        pwmscan_multi_array(
+            encode_seq(seq), *motifs, nreport, scan_rc, hits[i], counts[i]
+        )
+    return hits, counts
+
+
 def scan_region_mult(regions, genome, motifs, nreport, scan_rc):
     ret = []
     for region in regions:
@@ -467,8 +734,23 @@ def calc_threshold_moods(m, c):
 
 
 def scan_it_moods(
-    infile, motifs, cutoff, bgfile, nreport=1, scan_rc=True, pvalue=None, count=False
+    infile,
+    motifs,
+    cutoff,
+    bgfile,
+    nreport=1,
+    scan_rc=True,
+    pvalue=None,
+    count=False,
+    method="moods",
 ):
+    """Scan sequences with MOODS.
+
+    P-value thresholds are calculated by MOODS, or from the exact score
+    distribution of gimmemotifs.score_distribution with method="analytical".
+    """
+    if method not in ("moods", "analytical"):
+        raise ValueError("method should be moods or analytical")
     tmpdir = mkdtemp()
     matrices = []
     pseudocount = 1e-3
@@ -485,7 +767,12 @@ def scan_it_moods(
         matrices.append(MOODS.parsers.pfm_log_odds(pfmname, bg, pseudocount))
 
     thresholds = []
-    if pvalue is not None:
+    if pvalue is not None and method == "analytical":
+        thresholds = [
+            pvalue_threshold(np.array(m).transpose(), float(pvalue), bg=bg)
+            for m in matrices
+        ]
+    elif pvalue is not None:
         thresholds = [
             MOODS.tools.threshold_from_p(m, bg, float(pvalue)) for m in matrices
         ]
@@ -508,31 +795,57 @@ def scan_it_moods(
     if count:
         func = scan_fa_with_motif_moods_count
 
-    pool = mp.Pool()
+    pool = get_pool(ncpus)
     for i in range(0, len(fa), chunk):
-        jobs.append(
-            pool.apply_async(
-                func,
-                (fa[i : i + chunk], motifs, matrices, bg, thresholds, nreport, scan_rc),
-            )
-        )
+        args = (fa[i : i + chunk], motifs, matrices, bg, thresholds, nreport, scan_rc)
+        if pool is None:
+            jobs.append(func(*args))
+        else:
+            jobs.append(pool.apply_async(func, args))
 
     for job in jobs:
-        for ret in job.get():
+        if pool is not None:
+            job = job.get()
+        for ret in job:
             yield ret
 
 
 class Scanner(object):
     """
     scan sequences with motifs
+
+    Parameters
+    ----------
+    ncpus : int, optional
+        Number of workers. Default is the ncpus value from the configuration.
+
+    backend : str, optional
+        Run the scanning jobs in a pool of worker processes ("process",
+        default) or of threads ("thread"). The scanning functions release the
+        GIL, so threads scan in parallel without copying the motifs and
+        sequences to other processes.
+
+    cache : gimmemotifs.cache.ResultCache, optional
+        Cache for the results of scan(). By default a cache is created with
+        make_cache() if use_cache is set in the configuration.
     """
 
-    def __init__(self, ncpus=None):
+    def __init__(self, ncpus=None, backend="process", cache=None):
+        if backend not in BACKENDS:
+            raise ValueError(
+                "unknown backend {}, choose one of {}".format(
+                    backend, ", ".join(BACKENDS)
+                )
+            )
+        self.backend = backend
         self.config = MotifConfig()
         self.threshold = None
         self.genome = None
         self.background = None
+        self.motifs = None
+        self.motif_ids = []
         self.meanstd = {}
+        self.score_cdf = {}
         self.gc_bins = [(0, 1)]
 
         if ncpus is None:
@@ -540,57 +853,37 @@ class Scanner(object):
         else:
             self.ncpus = ncpus
 
-        if self.ncpus > 1:
-            # try:
-            #    ctx = mp.get_context('spawn')
-            #    self.pool = ctx.Pool(processes=self.ncpus)
-            # except AttributeError:
-            self.pool = mp.Pool(processes=self.ncpus)
+        self.cache = cache
+        if cache is None and self.config.get_default_params().get("use_cache", False):
+            self.cache = make_cache()
 
-        self.use_cache = False
-        if self.config.get_default_params().get("use_cache", False):
-            self._init_cache()
+    def set_motifs(self, motifs):
+        """Set the motifs to scan with.
 
-    def __del__(self):
-        # Close the pool because of memory leak
-        if hasattr(self, "pool"):
-            self.pool.close()
+        Parameters
+        ----------
+        motifs : str, list or MotifSet instance
+            Motif file or database name, list of Motif instances or a
+            MotifSet. The motifs are read and compiled once.
+        """
+        self.motifs = MotifSet(motifs)
+        self.motif_ids = list(self.motifs.ids)
 
-    def _init_cache(self):
-        try:
-            self.cache = make_region().configure(
-                "dogpile.cache.pylibmc",
-                expiration_time=3600,
-                arguments={"url": ["127.0.0.1"], "binary": True}
-                #    'dogpile.cache.dbm',
-                #    expiration_time = 3600,
-                #    arguments = {
-                #        'filename': 'cache.dbm'
-                #    }
-            )
-            self.use_cache = True
-        except Exception as e:
-            sys.stderr.write("failed to initialize cache\n")
-            sys.stderr.write("{}\n".format(e))
+    def _motif_scan_func(self, scan_func, **kwargs):
+        """Return scan_func with the motifs and the current thresholds.
 
-    def set_motifs(self, motifs):
-        try:
-            # Check if motifs is a list of Motif instances
-            motifs[0].to_pwm()
-            tmp = NamedTemporaryFile(mode="w", delete=False)
-            for m in motifs:
-                tmp.write("{}\n".format(m.to_pwm()))
-            tmp.close()
-            motif_file = tmp.name
-        except AttributeError:
-            motif_file = motifs
-
-        self.motifs = motif_file
-        self.motif_ids = [m.id for m in read_motifs(motif_file)]
-        self.checksum = {}
-        if self.use_cache:
-            chksum = xxhash.xxh64("\n".join(sorted(self.motif_ids))).digest()
-            self.checksum[self.motifs] = chksum
+        The compiled motifs are shared with the worker processes once, tasks
+        only contain the thresholds. Also returns a digest of the motifs and
+        thresholds, for the result cache.
+        """
+        key = self.motifs.digest
+        share(key, self.motifs)
+        cutoffs = self.motifs.cutoff_array(self.threshold)
+        func = partial(
+            _scan_shared, scan_func=scan_func, key=key, cutoffs=cutoffs, **kwargs
+        )
+        digest = xxhash.xxh64(key.encode() + cutoffs.tobytes()).hexdigest()
+        return func, digest
 
     def _meanstd_from_seqs(self, motifs, seqs):
         scan_motifs = [(m, m.pwm_min_score()) for m in motifs]
@@ -602,21 +895,96 @@ class Scanner(object):
         for (motif, _), scores in zip(scan_motifs, np.array(table).transpose()):
             yield motif, np.mean(scores), np.std(scores)  # cutoff
 
-    def _threshold_from_seqs(self, motifs, seqs, fpr):
-        scan_motifs = [(m, m.pwm_min_score()) for m in motifs]
+    def _best_scores_from_seqs(self, motifs, seqs):
+        """Return the best score of motifs in seqs as a float64 array of shape
+        (number of sequences, number of motifs)."""
+        compiled = compile_motifs([(m, m.pwm_min_score()) for m in motifs])
+        scan_func = partial(scan_seq_best, motifs=compiled, scan_rc=True)
+        blocks = [scores for _, scores in self._scan_blocks(scan_func, seqs, 1000)]
+        return np.vstack(blocks).astype(np.float64)
 
-        table = []
-        for x in self._scan_sequences_with_motif(scan_motifs, seqs, 1, True):
-            table.append([row[0][0] for row in x])
+    def set_score_cdf(self, gc=False):
+        """Determine the distribution of motif scores in the background.
 
-        for (motif, _), scores in zip(scan_motifs, np.array(table).transpose()):
-            if len(scores) > 0:
-                opt_score = scoreatpercentile(scores, 100 - (100 * fpr))
-                yield motif, opt_score  # cutoff
-            else:
-                raise ValueError(
-                    "Could not determine threshold for motif {}".format(motif)
-                )
+        The best score of every motif in every background sequence is stored
+        as a ScoreCDF, for all sequences and, if the background is GC%
+        matched, per GC% bin. The distributions are cached on disk, per
+        motif and background, so that thresholds for any FPR and the p-values
+        of matches can be determined without scanning the background again.
+
+        Parameters
+        ----------
+        gc : bool, optional
+            Use a GC%-matched genomic background and also store the score
+            distribution per GC% bin.
+        """
+        if not self.background:
+            self.set_background(gc=gc)
+
+        seqs = self.background.seqs
+        seq_bins = None
+        if gc:
+            seq_bins = np.array([s.split(" ")[-1] for s in self.background.ids])
+
+        motifs = list(self.motifs)
+        self.score_cdf = {}
+        lock.acquire()
+        with Cache(CACHE_DIR) as cache:
+            scan_motifs = []
+            for motif in motifs:
+                k = "c{}|{}|{}".format(motif.hash(), self.background_hash, gc)
+                cdfs = cache.get(k)
+                if cdfs is None:
+                    scan_motifs.append(motif)
+                else:
+                    self.score_cdf[motif.id] = cdfs
+
+            if len(scan_motifs) > 0:
+                logger.info("determining background score distribution")
+                table = self._best_scores_from_seqs(scan_motifs, seqs)
+                for motif, scores in zip(scan_motifs, table.T):
+                    # None is the distribution over all sequences
+                    cdfs = {None: ScoreCDF(scores)}
+                    if seq_bins is not None:
+                        for gc_bin in np.unique(seq_bins):
+                            cdfs[gc_bin] = ScoreCDF(scores[seq_bins == gc_bin])
+                    k = "c{}|{}|{}".format(motif.hash(), self.background_hash, gc)
+                    cache.set(k, cdfs)
+                    self.score_cdf[motif.id] = cdfs
+        lock.release()
+
+    def hit_pvalues(self, motif_id, scores, seq=None):
+        """Return the empirical p-value of motif scores.
+
+        The p-value of a score is the fraction of background sequences in
+        which the best match of the motif scores at least as high. Run
+        set_score_cdf() (or set_threshold() with an FPR) first.
+
+        Parameters
+        ----------
+        motif_id : str
+            Motif id.
+
+        scores : float or array_like
+            Motif scores (not z-score normalized).
+
+        seq : str, optional
+            The sequence with the matches. If the score distribution was
+            determined per GC% bin, the distribution of the GC% bin of the
+            sequence is used.
+
+        Returns
+        -------
+        numpy.ndarray
+            p-values.
+        """
+        if motif_id not in self.score_cdf:
+            raise ValueError("please run set_score_cdf() first")
+        cdfs = self.score_cdf[motif_id]
+        cdf = cdfs[None]
+        if seq is not None and len(cdfs) > 1:
+            cdf = cdfs.get(self.get_seq_bin(seq), cdf)
+        return cdf.pvalues(scores)
 
     def set_meanstd(self, gc=False):
         if not self.background:
@@ -633,7 +1001,7 @@ class Scanner(object):
         else:
             bins = ["0.00-1.00"]
 
-        motifs = read_motifs(self.motifs)
+        motifs = list(self.motifs)
         lock.acquire()
         with Cache(CACHE_DIR) as cache:
             scan_motifs = []
@@ -677,6 +1045,15 @@ class Scanner(object):
 
         lock.release()
 
+    def _check_meanstd(self, gc=False):
+        """Determine the motif score mean and std if needed."""
+        if gc:
+            if len(self.meanstd) <= 1:
+                self.set_meanstd(gc=gc)
+        else:
+            if len(self.meanstd) != 1:
+                self.set_meanstd(gc=gc)
+
     def set_background(
         self, fname=None, genome=None, size=200, nseq=10000, gc=False, gc_bins=None
     ):
@@ -757,7 +1134,9 @@ class Scanner(object):
         if gc_bins:
             self.gc_bins = gc_bins
 
-    def set_threshold(self, fpr=None, threshold=None, gc=False):
+    def set_threshold(
+        self, fpr=None, threshold=None, gc=False, pvalue=None, method="empirical"
+    ):
         """Set motif scanning threshold based on background sequences.
 
         Parameters
@@ -769,25 +1148,50 @@ class Scanner(object):
             Desired motif threshold, expressed as the fraction of the
             difference between minimum and maximum score of the PWM.
             Should either be a float between 0.0 and 1.0 or a filename
-            with thresholds as created by 'gimme threshold'.
-
+            with thresholds as created by 'gimme threshold'. If the file
+            has thresholds for several FPRs, fpr selects the column.
+
+        gc : bool, optional
+            Use a GC%-matched genomic background (empirical method only).
+
+        pvalue : float, optional
+            Desired p-value of a match at a single position. The threshold is
+            calculated from the exact score distribution.
+
+        method : str, optional
+            "empirical" (default) to determine FPR-based thresholds by
+            scanning background sequences, or "analytical" to calculate them
+            from the exact score distribution, see
+            gimmemotifs.score_distribution. The analytical method uses the
+            nucleotide frequencies of the background, if set.
         """
-        if threshold and fpr:
-            raise ValueError("Need either fpr or threshold.")
+        threshold_table = threshold is not None and os.path.isfile(str(threshold))
+        if threshold_table:
+            # fpr selects the column of a threshold file
+            if pvalue:
+                raise ValueError("Need either fpr, pvalue or threshold.")
+        elif len([x for x in (fpr, threshold, pvalue) if x]) > 1:
+            raise ValueError("Need either fpr, pvalue or threshold.")
+        if method not in ("empirical", "analytical"):
+            raise ValueError("method should be empirical or analytical")
 
         if fpr:
             fpr = float(fpr)
             if not (0.0 < fpr < 1.0):
                 raise ValueError("Parameter fpr should be between 0 and 1")
 
-        if not self.motifs:
+        if self.motifs is None:
             raise ValueError("please run set_motifs() first")
 
         thresholds = {}
-        motifs = read_motifs(self.motifs)
+        motifs = list(self.motifs)
 
         if threshold is not None:
-            self.threshold = parse_threshold_values(self.motifs, threshold)
+            self.threshold = parse_threshold_values(self.motifs, threshold, fpr=fpr)
+            return
+
+        if pvalue is not None or method == "analytical":
+            self.threshold = self._analytical_threshold(motifs, fpr, pvalue)
             return
 
         if not self.background:
@@ -796,41 +1200,37 @@ class Scanner(object):
             except Exception:
                 raise ValueError("please run set_background() first")
 
-        seqs = self.background.seqs
+        self.set_score_cdf(gc=gc)
+        for motif in motifs:
+            threshold = self.score_cdf[motif.id][None].threshold(fpr)
+            thresholds[motif.id] = _threshold_value(motif, threshold)
+        self.threshold = thresholds
 
-        lock.acquire()
-        with Cache(CACHE_DIR) as cache:
-            scan_motifs = []
-            for motif in motifs:
-                k = "{}|{}|{:.4f}".format(motif.hash(), self.background_hash, fpr)
+    def _analytical_threshold(self, motifs, fpr=None, pvalue=None):
+        """Calculate thresholds from the exact score distribution.
 
-                threshold = cache.get(k)
-                if threshold is None:
-                    scan_motifs.append(motif)
-                else:
-                    if np.isclose(threshold, motif.pwm_max_score()):
-                        thresholds[motif.id] = None
-                    elif np.isclose(threshold, motif.pwm_min_score()):
-                        thresholds[motif.id] = 0.0
-                    else:
-                        thresholds[motif.id] = threshold
+        The background model and the sequence length for the FPR are based on
+        the background sequences, if these are set. Otherwise all nucleotides
+        have the same frequency and the sequence length is 200.
+        """
+        if fpr is None and pvalue is None:
+            raise ValueError("Need either fpr or pvalue.")
 
-            if len(scan_motifs) > 0:
-                logger.info("determining FPR-based threshold")
-                for motif, threshold in self._threshold_from_seqs(
-                    scan_motifs, seqs, fpr
-                ):
-                    k = "{}|{}|{:.4f}".format(motif.hash(), self.background_hash, fpr)
-                    cache.set(k, threshold)
-                    if np.isclose(threshold, motif.pwm_max_score()):
-                        thresholds[motif.id] = None
-                    elif np.isclose(threshold, motif.pwm_min_score()):
-                        thresholds[motif.id] = 0.0
-                    else:
-                        thresholds[motif.id] = threshold
-        lock.release()
-        self.threshold_str = "{}_{}_{}".format(fpr, threshold, self.background_hash)
-        self.threshold = thresholds
+        bg = None
+        length = 200
+        if self.background:
+            bg = background_model(self.background.seqs)
+            length = int(self.background.median_length())
+
+        logger.info("calculating thresholds from score distribution")
+        thresholds = {}
+        for motif in motifs:
+            if pvalue is not None:
+                threshold = pvalue_threshold(motif, float(pvalue), bg=bg)
+            else:
+                threshold = fpr_threshold(motif, fpr, length=length, bg=bg)
+            thresholds[motif.id] = _threshold_value(motif, threshold)
+        return thresholds
 
     def set_genome(self, genome):
         """
@@ -849,33 +1249,196 @@ class Scanner(object):
     def count(self, seqs, nreport=100, scan_rc=True):
         """
         count the number of matches above the cutoff
-        returns an iterator of lists containing integer counts
+        returns an iterator of arrays containing integer counts
         """
-        for matches in self.scan(seqs, nreport, scan_rc):
-            counts = [len(m) for m in matches]
+        for counts in self.count_blocks(seqs, nreport, scan_rc):
+            for row in counts:
+                yield row
+
+    def count_blocks(self, seqs, nreport=100, scan_rc=True, blocksize=1000):
+        """Count the number of matches above the cutoff.
+
+        The matches are counted in blocks of sequences, which are scanned
+        with all motifs at once.
+
+        Parameters
+        ----------
+        seqs : list, str or Fasta instance
+            Sequences, regions or a filename.
+        nreport : int, optional
+            Maximum number of matches to count per motif and sequence, 0 to
+            count all matches.
+        scan_rc : bool, optional
+            Scan the reverse complement. True by default.
+        blocksize : int, optional
+            Maximum number of sequences per block.
+
+        Yields
+        ------
+        counts : numpy.ndarray
+            int32 array of shape (number of sequences in block, number of
+            motifs).
+        """
+        if not self.threshold:
+            logger.info(
+                "Using default threshold of 0.95. " "This is likely not optimal!"
+            )
+            self.set_threshold(threshold=0.95)
+
+        seqs = as_fasta(seqs, genome=self.genome).seqs
+        scan_func, _ = self._motif_scan_func(
+            scan_seq_count, nreport=nreport, scan_rc=scan_rc
+        )
+
+        for _, counts in self._scan_blocks(scan_func, seqs, blocksize):
             yield counts
 
     def total_count(self, seqs, nreport=100, scan_rc=True):
         """
         count the number of matches above the cutoff
-        returns an iterator of lists containing integer counts
+        returns an array containing the total count of every motif
         """
-
-        count_table = [counts for counts in self.count(seqs, nreport, scan_rc)]
-        return np.sum(np.array(count_table), 0)
+        total = np.zeros(len(self.motif_ids), dtype=np.int64)
+        for counts in self.count_blocks(seqs, nreport, scan_rc):
+            total += counts.sum(0)
+        return total
 
     def best_score(self, seqs, scan_rc=True, zscore=False, gc=False):
         """
         give the score of the best match of each motif in each sequence
-        returns an iterator of lists containing floats
+        returns an iterator of arrays containing floats
+        """
+        for scores in self.best_score_blocks(seqs, scan_rc, zscore=zscore, gc=gc):
+            for row in scores:
+                yield row
+
+    def best_score_blocks(
+        self, seqs, scan_rc=True, zscore=False, gc=False, blocksize=1000
+    ):
+        """Give the score of the best match of each motif in each sequence.
+
+        The scores are calculated in blocks of sequences, which are scanned
+        with all motifs at once.
+
+        Parameters
+        ----------
+        seqs : list, str or Fasta instance
+            Sequences, regions or a filename.
+        scan_rc : bool, optional
+            Scan the reverse complement. True by default.
+        zscore : bool, optional
+            Return z-score normalized scores.
+        gc : bool, optional
+            Normalize the z-score per GC% bin.
+        blocksize : int, optional
+            Maximum number of sequences per block.
+
+        Yields
+        ------
+        scores : numpy.ndarray
+            float32 array of shape (number of sequences in block, number of
+            motifs).
         """
         self.set_threshold(threshold=0.0, gc=gc)
-        for matches in self.scan(seqs, 1, scan_rc, zscore=zscore, gc=gc):
-            scores = np.array(
-                [sorted(m, key=lambda x: x[0])[0][0] for m in matches if len(m) > 0]
-            )
+        seqs = as_fasta(seqs, genome=self.genome).seqs
+
+        if zscore:
+            self._check_meanstd(gc)
+
+        scan_func, _ = self._motif_scan_func(scan_seq_best, scan_rc=scan_rc)
+
+        for block_seqs, scores in self._scan_blocks(scan_func, seqs, blocksize):
+            if zscore:
+                self._zscore_block(scores, block_seqs)
             yield scores
 
+    def count_score_blocks(
+        self, seqs, nreport=100, scan_rc=True, zscore=False, gc=False, blocksize=1000
+    ):
+        """Count the matches and give the best score in a single pass.
+
+        The matches are counted with the current threshold, the best score
+        does not depend on the threshold.
+
+        Parameters
+        ----------
+        seqs : list, str or Fasta instance
+            Sequences, regions or a filename.
+        nreport : int, optional
+            Maximum number of matches to count per motif and sequence, 0 to
+            count all matches.
+        scan_rc : bool, optional
+            Scan the reverse complement. True by default.
+        zscore : bool, optional
+            Return z-score normalized scores.
+        gc : bool, optional
+            Normalize the z-score per GC% bin.
+        blocksize : int, optional
+            Maximum number of sequences per block.
+
+        Yields
+        ------
+        counts : numpy.ndarray
+            int32 array of shape (number of sequences in block, number of
+            motifs).
+        scores : numpy.ndarray
+            float32 array of shape (number of sequences in block, number of
+            motifs).
+        """
+        if not self.threshold:
+            logger.info(
+                "Using default threshold of 0.95. " "This is likely not optimal!"
+            )
+            self.set_threshold(threshold=0.95)
+
+        seqs = as_fasta(seqs, genome=self.genome).seqs
+
+        if zscore:
+            self._check_meanstd(gc)
+
+        scan_func, _ = self._motif_scan_func(
+            scan_seq_count_best, nreport=nreport, scan_rc=scan_rc
+        )
+
+        for block_seqs, (counts, scores) in self._scan_blocks(
+            scan_func, seqs, blocksize
+        ):
+            if zscore:
+                self._zscore_block(scores, block_seqs)
+            yield counts, scores
+
+    def _zscore_block(self, scores, seqs):
+        """Normalize a block of best scores in place."""
+        mean, std = self._meanstd_arrays(self._seq_bin_index(seqs))
+        scores[:] = (scores - mean) / std
+
+    def best_score_matrix(self, seqs, scan_rc=True, zscore=False, gc=False):
+        """Give the score of the best match of each motif in each sequence.
+
+        Parameters
+        ----------
+        seqs : list, str or Fasta instance
+            Sequences, regions or a filename.
+        scan_rc : bool, optional
+            Scan the reverse complement. True by default.
+        zscore : bool, optional
+            Return z-score normalized scores.
+        gc : bool, optional
+            Normalize the z-score per GC% bin.
+
+        Returns
+        -------
+        scores : numpy.ndarray
+            float32 array of shape (number of sequences, number of motifs).
+        """
+        seqs = as_fasta(seqs, genome=self.genome)
+        scores = np.empty((len(seqs), len(self.motif_ids)), dtype=np.float32)
+        start = 0
+        for block in self.best_score_blocks(seqs, scan_rc, zscore=zscore, gc=gc):
+            scores[start : start + len(block)] = block
+            start += len(block)
+        return scores
+
     def best_match(self, seqs, scan_rc=True, zscore=False, gc=False):
         """
         give the best match of each motif in each sequence
@@ -886,19 +1449,60 @@ class Scanner(object):
         for matches in self.scan(seqs, 1, scan_rc, zscore=zscore, gc=gc):
             yield [m[0] for m in matches]
 
+    def _seq_bin_index(self, seqs):
+        """Return the index of the GC% bin of every sequence in self.gc_bins.
+
+        Bins include the upper bound, sequences without G or C are assigned
+        to the lowest bin.
+        """
+        gc = _gc_fraction(seqs)
+        gc[gc == 0] = 0.01
+
+        starts = np.round([b[0] for b in self.gc_bins], 2)
+        ends = np.round([b[1] for b in self.gc_bins], 2)
+        order = np.argsort(ends, kind="stable")
+        pos = np.searchsorted(ends[order], gc, side="left")
+        idx = order[np.minimum(pos, len(order) - 1)]
+
+        valid = (pos < len(order)) & (gc > starts[idx])
+        if not np.all(valid):
+            seq = seqs[np.flatnonzero(~valid)[0]]
+            logger.error(
+                "Error determining seq: {}, bins: {}".format(seq, str(self.gc_bins))
+            )
+            raise ValueError()
+        return idx
+
+    def _bin_name(self, i):
+        return "{:.2f}-{:.2f}".format(*self.gc_bins[i])
+
     def get_seq_bin(self, seq):
-        useq = seq.upper()
-        gc = round((useq.count("G") + useq.count("C")) / len(useq), 2)
-        if gc == 0:
-            gc = 0.01
-        for b_start, b_end in self.gc_bins:
-            if gc > round(b_start, 2) and gc <= round(b_end, 2):
-                return "{:.2f}-{:.2f}".format(b_start, b_end)
-
-        logger.error(
-            "Error determining seq: {}, bins: {}".format(seq, str(self.gc_bins))
-        )
-        raise ValueError()
+        return self._bin_name(self._seq_bin_index([seq])[0])
+
+    def _meanstd_arrays(self, seq_bins):
+        """Return the motif score mean and std of sequences.
+
+        Parameters
+        ----------
+        seq_bins : numpy.ndarray
+            Index of the GC% bin of every sequence, see _seq_bin_index().
+
+        Returns
+        -------
+        mean, std : numpy.ndarray
+            Arrays of shape (number of sequences, number of motifs).
+        """
+        mean = np.zeros((len(self.gc_bins), len(self.motif_ids)))
+        std = np.ones((len(self.gc_bins), len(self.motif_ids)))
+        for i in np.unique(seq_bins):
+            gc_bin = self._bin_name(i)
+            mean[i], std[i] = np.array(
+                [
+                    self.get_motif_mean_std(gc_bin, motif_id)
+                    for motif_id in self.motif_ids
+                ]
+            ).T
+        return mean[seq_bins], std[seq_bins]
 
     def get_motif_mean_std(self, gc_bin, motif):
         if gc_bin in self.meanstd:
@@ -940,101 +1544,55 @@ class Scanner(object):
 
         seqs = as_fasta(seqs, genome=self.genome)
 
-        it = self._scan_sequences(seqs.seqs, nreport, scan_rc)
+        logger.debug("Scanning")
+        if zscore and nreport > 0:
+            # The scores of a block of sequences are normalized at once
+            self._check_meanstd(gc)
+            scan_func, _ = self._motif_scan_func(
+                scan_seq_mult_array, nreport=nreport, scan_rc=scan_rc
+            )
+            for block_seqs, (hits, counts) in self._scan_blocks(
+                scan_func, seqs.seqs, 1000
+            ):
+                mean, std = self._meanstd_arrays(self._seq_bin_index(block_seqs))
+                hits["score"] = (hits["score"] - mean[:, :, None]) / std[:, :, None]
+                for seq_hits, seq_counts in zip(hits, counts):
+                    yield [row[:n].tolist() for row, n in zip(seq_hits, seq_counts)]
+            return
 
+        it = self._scan_sequences(seqs.seqs, nreport, scan_rc)
         if zscore:
-            if gc:
-                if len(self.meanstd) <= 1:
-                    self.set_meanstd(gc=gc)
-            else:
-                if len(self.meanstd) != 1:
-                    self.set_meanstd(gc=gc)
+            # All matches are reported, their number differs per motif
+            self._check_meanstd(gc)
+            mean, std = self._meanstd_arrays(self._seq_bin_index(seqs.seqs))
 
-        gc_seqs = [self.get_seq_bin(seq) for seq in seqs.seqs]
-
-        logger.debug("Scanning")
-        for result, gc_seq in zip(it, gc_seqs):
+        for k, result in enumerate(it):
             if zscore:
                 zresult = []
-                for i, mrow in enumerate(result):
-                    try:
-                        m_mean, m_std = self.get_motif_mean_std(
-                            gc_seq, self.motif_ids[i]
-                        )
-                    except Exception:
-                        print(self.meanstd)
-                        print(gc_seq, self.motif_ids[i])
-                        raise
-                    mrow = [((x[0] - m_mean) / m_std, x[1], x[2]) for x in mrow]
-                    zresult.append(mrow)
+                for mrow, m_mean, m_std in zip(result, mean[k], std[k]):
+                    zresult.append(
+                        [((x[0] - m_mean) / m_std, x[1], x[2]) for x in mrow]
+                    )
                 yield zresult
             else:
                 yield result
 
     def _scan_regions(self, regions, nreport, scan_rc):
         genome = self.genome
-        motif_file = self.motifs
-        motif_digest = self.checksum.get(motif_file, None)
-
-        # determine which regions are not in the cache
-        scan_regions = regions
-        if self.use_cache:
-            scan_regions = []
-            for region in regions:
-                key = str((region, genome, motif_digest, nreport, scan_rc))
-                ret = self.cache.get(key)
-                if ret == NO_VALUE:
-                    scan_regions.append(region)
-
-        # scan the regions that are not in the cache
-        if len(scan_regions) > 0:
-
-            g = Genome(genome)
-
-            motifs = [(m, self.threshold[m.id]) for m in read_motifs(self.motifs)]
-            scan_func = partial(
-                scan_region_mult,
-                genome=g,
-                motifs=motifs,
-                nreport=nreport,
-                scan_rc=scan_rc,
-            )
+        scan_func, digest = self._motif_scan_func(
+            scan_region_mult, genome=Genome(genome), nreport=nreport, scan_rc=scan_rc
+        )
 
-            for region, ret in self._scan_jobs(scan_func, scan_regions):
-                # return values or store values in cache
-                if self.use_cache:
-                    # store values in cache
-                    key = str(
-                        (
-                            region,
-                            genome,
-                            motif_digest,
-                            nreport,
-                            scan_rc,
-                            self.threshold_str,
-                        )
-                    )
-                    self.cache.set(key, ret)
-                else:
-                    # return values
-                    yield ret
-
-        if self.use_cache:
-            # return results from cache
-            for region in regions:
-                key = str(
-                    (region, genome, motif_digest, nreport, scan_rc, self.threshold_str)
-                )
-                ret = self.cache.get(key)
-                if ret == NO_VALUE or ret is None:
-                    raise Exception(
-                        "cache is not big enough to hold all "
-                        "results, try increasing the cache size "
-                        "or disable cache"
-                    )
+        if self.cache is None:
+            for _, ret in self._scan_jobs(scan_func, regions):
+                yield ret
+        else:
+            keys = [(region, genome, digest, nreport, scan_rc) for region in regions]
+            for ret in self._cached_scan(scan_func, regions, keys):
                 yield ret
 
     def _scan_sequences_with_motif(self, motifs, seqs, nreport, scan_rc):
+        motifs = compile_motifs(motifs)
         scan_func = partial(
             scan_seq_mult, motifs=motifs, nreport=nreport, scan_rc=scan_rc
         )
@@ -1043,81 +1601,79 @@ class Scanner(object):
             yield ret[1]
 
     def _scan_sequences(self, seqs, nreport, scan_rc):
+        scan_func, digest = self._motif_scan_func(
+            scan_seq_mult, nreport=nreport, scan_rc=scan_rc
+        )
+
+        if self.cache is None:
+            for _, ret in self._scan_jobs(scan_func, seqs):
+                yield ret
+        else:
+            keys = [(seq_digest(seq), digest, nreport, scan_rc) for seq in seqs]
+            for ret in self._cached_scan(scan_func, seqs, keys):
+                yield ret
 
-        motif_file = self.motifs
-        motif_digest = self.checksum.get(motif_file, None)
+    def _cached_scan(self, scan_func, items, keys):
+        """Scan the items that are not in the cache.
 
-        scan_seqs = seqs
-        if self.use_cache:
-            # determine which sequences are not in the cache
-            hashes = dict([(s.upper(), xxhash.xxh64(s.upper()).digest()) for s in seqs])
-            scan_seqs = []
+        Yields the result of every item in input order. New results are
+        stored in the cache.
+        """
+        results = {}
+        scan_items = []
+        for item, key in zip(items, keys):
+            if key not in results:
+                results[key] = self.cache.get(key)
+                if results[key] is None:
+                    scan_items.append(item)
+        logger.debug(
+            "%s of %s results in cache", len(results) - len(scan_items), len(results)
+        )
 
-            for seq, seq_hash in hashes.items():
-                key = str(
-                    (seq_hash, motif_digest, nreport, scan_rc, self.threshold_str)
-                )
-                ret = self.cache.get(key)
-                if ret == NO_VALUE or ret is None:
-                    scan_seqs.append(seq.upper())
-
-        # scan the sequences that are not in the cache
-        if len(scan_seqs) > 0:
-            motifs = [(m, self.threshold[m.id]) for m in read_motifs(self.motifs)]
-            scan_func = partial(
-                scan_seq_mult, motifs=motifs, nreport=nreport, scan_rc=scan_rc
-            )
+        # scan_items is ordered by the first occurrence of every missing key
+        scanned = self._scan_jobs(scan_func, scan_items)
+        for key in keys:
+            ret = results[key]
+            if ret is None:
+                _, ret = next(scanned)
+                self.cache.set(key, ret)
+                results[key] = ret
+            yield ret
 
-            for seq, ret in self._scan_jobs(scan_func, scan_seqs):
-                if self.use_cache:
-                    h = hashes[seq]
-                    key = str((h, motif_digest, nreport, scan_rc, self.threshold_str))
-                    self.cache.set(key, ret)
-                else:
-                    yield ret
-
-        if self.use_cache:
-            # return results from cache
-            for seq in seqs:
-                key = str(
-                    (
-                        hashes[seq.upper()],
-                        motif_digest,
-                        nreport,
-                        scan_rc,
-                        self.threshold_str,
-                    )
-                )
-                ret = self.cache.get(key)
-                if ret == NO_VALUE or ret is None:
-                    raise Exception(
-                        "cache is not big enough to hold all "
-                        "results, try increasing the cache size "
-                        "or disable cache"
-                    )
+    def _scan_blocks(self, scan_func, seqs, blocksize):
+        """Run scan_func on blocks of sequences.
 
-                yield ret
+        Yields every block of sequences together with the result, in the
+        order of the input sequences.
+        """
+        # Use at least one block per process
+        blocksize = max(1, min(blocksize, (len(seqs) - 1) // self.ncpus + 1))
+        blocks = [seqs[i : i + blocksize] for i in range(0, len(seqs), blocksize)]
+        pool = get_pool(self.ncpus, backend=self.backend)
+        if pool is not None:
+            it = pool.imap(scan_func, blocks)
+        else:
+            it = map(scan_func, blocks)
+
+        for block, result in zip(blocks, it):
+            yield block, result
 
     def _scan_jobs(self, scan_func, scan_seqs):
         batchsize = 1000
-        if self.ncpus > 1:
-            for i in range((len(scan_seqs) - 1) // batchsize + 1):
-                batch = scan_seqs[i * batchsize : (i + 1) * batchsize]
-                chunksize = len(batch) // self.ncpus + 1
-                jobs = []
-                for j in range((len(batch) - 1) // chunksize + 1):
-                    job = self.pool.apply_async(
-                        scan_func, (batch[j * chunksize : (j + 1) * chunksize],)
-                    )
-                    jobs.append(job)
-
-                for k, job in enumerate(jobs):
-                    for ret in job.get():
-                        region = batch[k]
-                        yield region, ret
-        else:
-            for i in range((len(scan_seqs) - 1) // batchsize + 1):
-                for _j, ret in enumerate(
-                    scan_func(scan_seqs[i * batchsize : (i + 1) * batchsize])
-                ):
-                    yield scan_seqs[i], ret
+        pool = get_pool(self.ncpus, backend=self.backend)
+        for i in range((len(scan_seqs) - 1) // batchsize + 1):
+            batch = scan_seqs[i * batchsize : (i + 1) * batchsize]
+            if pool is None:
+                for seq, ret in zip(batch, scan_func(batch)):
+                    yield seq, ret
+                continue
+
+            chunksize = len(batch) // self.ncpus + 1
+            jobs = []
+            for j in range((len(batch) - 1) // chunksize + 1):
+                chunk = batch[j * chunksize : (j + 1) * chunksize]
+                jobs.append((chunk, pool.apply_async(scan_func, (chunk,))))
+
+            for chunk, job in jobs:
+                for seq, ret in zip(chunk, job.get()):
+                    yield seq, ret
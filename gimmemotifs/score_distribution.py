@@ -0,0 +1,338 @@
+"""Exact motif score distributions.
+
+The distribution of motif scores in random sequence is calculated by dynamic
+programming over discretised log-odds scores, for a background model of
+independent nucleotides (0th order) or a first order Markov chain. This gives
+p-value and FPR based motif score thresholds without scanning background
+sequences.
+
+ScoreCDF stores the empirical distribution of scores in background sequences,
+so that FPR thresholds and p-values can be looked up after a single scan.
+"""
+import logging
+
+import numpy as np
+
+from gimmemotifs.motif import Motif
+from gimmemotifs.utils import encode_seq
+
+logger = logging.getLogger("gimme.score_distribution")
+
+# Resolution of the discretised scores
+DEFAULT_STEP = 0.001
+
+
+def background_model(seqs, order=0):
+    """Estimate a background model from sequences.
+
+    Parameters
+    ----------
+    seqs : list
+        List of sequences.
+
+    order : int, optional
+        0 for nucleotide frequencies, 1 for dinucleotide frequencies.
+
+    Returns
+    -------
+    numpy.ndarray
+        Nucleotide frequencies (A, C, G, T) for order 0, or an array of shape
+        (4, 4) with the frequency of every dinucleotide for order 1.
+        Positions with an N or another character are skipped.
+    """
+    if order not in (0, 1):
+        raise ValueError("order should be 0 or 1")
+
+    counts = np.zeros(4 ** (order + 1))
+    for seq in seqs:
+        codes = encode_seq(seq).astype(np.int64)
+        if order == 0:
+            codes = codes[codes < 4]
+        else:
+            valid = (codes[:-1] < 4) & (codes[1:] < 4)
+            codes = (codes[:-1] * 4 + codes[1:])[valid]
+        counts += np.bincount(codes, minlength=len(counts))
+
+    if counts.sum() == 0:
+        raise ValueError("no valid nucleotides in sequences")
+    # Pseudocount, so that every (di)nucleotide can occur
+    counts += 1
+    freqs = counts / counts.sum()
+    if order == 1:
+        freqs = freqs.reshape(4, 4)
+    return freqs
+
+
+def _logodds(matrix):
+    if isinstance(matrix, Motif):
+        matrix = matrix.logodds
+    matrix = np.asarray(matrix, dtype=np.float64)
+    if matrix.ndim != 2 or matrix.shape[1] != 4:
+        raise ValueError("matrix should have shape (motif length, 4)")
+    return matrix
+
+
+def _background(bg):
+    """Return initial nucleotide and transition probabilities of bg."""
+    if bg is None:
+        bg = np.full(4, 0.25)
+    bg = np.asarray(bg, dtype=np.float64)
+    if bg.shape == (4,):
+        start = bg / bg.sum()
+        return start, np.tile(start, (4, 1))
+    if bg.shape == (4, 4):
+        start = bg.sum(1) / bg.sum()
+        return start, bg / bg.sum(1, keepdims=True)
+    raise ValueError("background should have shape (4,) or (4, 4)")
+
+
+def score_distribution(matrix, bg=None, step=DEFAULT_STEP):
+    """Calculate the distribution of motif scores in random sequence.
+
+    Parameters
+    ----------
+    matrix : Motif instance or array_like
+        Motif or log-odds matrix of shape (motif length, 4).
+
+    bg : array_like, optional
+        Background model, see background_model(). By default all nucleotides
+        have the same frequency.
+
+    step : float, optional
+        Resolution of the scores.
+
+    Returns
+    -------
+    scores : numpy.ndarray
+        Scores, in increasing order with a distance of step.
+
+    probs : numpy.ndarray
+        Probability of every score.
+    """
+    logodds = _logodds(matrix)
+    start, transition = _background(bg)
+
+    # Scores are discretised per position, relative to the minimum score
+    ints = np.round(logodds / step).astype(np.int64)
+    offset = ints.min(1)
+    ints = ints - offset[:, None]
+
+    if bg is None or np.ndim(bg) == 1:
+        # Independent nucleotides
+        probs = np.zeros(ints[0].max() + 1)
+        np.add.at(probs, ints[0], start)
+        for row in ints[1:]:
+            new = np.zeros(len(probs) + row.max())
+            for b in range(4):
+                new[row[b] : row[b] + len(probs)] += start[b] * probs
+            probs = new
+    else:
+        # dist[a] is the distribution of partial scores ending with nucleotide a
+        dist = np.zeros((4, ints[0].max() + 1))
+        dist[np.arange(4), ints[0]] = start
+        for row in ints[1:]:
+            new = np.zeros((4, dist.shape[1] + row.max()))
+            for b in range(4):
+                incoming = transition[0, b] * dist[0]
+                for a in range(1, 4):
+                    incoming += transition[a, b] * dist[a]
+                new[b, row[b] : row[b] + dist.shape[1]] = incoming
+            dist = new
+        probs = dist.sum(0)
+
+    scores = (np.arange(len(probs)) + offset.sum()) * step
+    return scores, probs
+
+
+def score_pvalues(matrix, scores, bg=None, step=DEFAULT_STEP):
+    """Return the p-value of motif scores.
+
+    The p-value is the probability that a random sequence of the length of
+    the motif scores at least as high.
+
+    Parameters
+    ----------
+    matrix : Motif instance or array_like
+        Motif or log-odds matrix of shape (motif length, 4).
+
+    scores : array_like
+        Motif scores.
+
+    bg : array_like, optional
+        Background model, see background_model().
+
+    step : float, optional
+        Resolution of the scores.
+
+    Returns
+    -------
+    numpy.ndarray
+        p-values.
+    """
+    grid, probs = score_distribution(matrix, bg=bg, step=step)
+    sf = np.cumsum(probs[::-1])[::-1]
+    idx = np.searchsorted(grid, np.asarray(scores) - step / 2)
+    pvalues = np.zeros(idx.shape)
+    valid = idx < len(sf)
+    pvalues[valid] = np.minimum(sf[idx[valid]], 1.0)
+    return pvalues
+
+
+def pvalue_threshold(matrix, pvalue, bg=None, step=DEFAULT_STEP):
+    """Return the lowest motif score with a p-value of at most pvalue.
+
+    Parameters
+    ----------
+    matrix : Motif instance or array_like
+        Motif or log-odds matrix of shape (motif length, 4).
+
+    pvalue : float
+        p-value of a single motif position, between 0 and 1.
+
+    bg : array_like, optional
+        Background model, see background_model().
+
+    step : float, optional
+        Resolution of the scores.
+
+    Returns
+    -------
+    float
+        Score threshold. If no score has a p-value of at most pvalue, the
+        maximum score is returned.
+    """
+    if not (0.0 < pvalue <= 1.0):
+        raise ValueError("p-value should be between 0 and 1")
+    scores, probs = score_distribution(matrix, bg=bg, step=step)
+    sf = np.cumsum(probs[::-1])[::-1]
+    idx = np.searchsorted(-sf, -pvalue)
+    if idx == len(sf):
+        return scores[-1]
+    return scores[idx]
+
+
+def fpr_threshold(matrix, fpr, length=200, scan_rc=True, bg=None, step=DEFAULT_STEP):
+    """Return the motif score threshold for a false positive rate.
+
+    The FPR is the fraction of random sequences of the specified length with
+    at least one match. It is converted to a p-value per motif position,
+    assuming that motif positions are independent.
+
+    Parameters
+    ----------
+    matrix : Motif instance or array_like
+        Motif or log-odds matrix of shape (motif length, 4).
+
+    fpr : float
+        False positive rate, between 0 and 1.
+
+    length : int, optional
+        Sequence length.
+
+    scan_rc : bool, optional
+        Count matches on both strands.
+
+    bg : array_like, optional
+        Background model, see background_model().
+
+    step : float, optional
+        Resolution of the scores.
+
+    Returns
+    -------
+    float
+        Score threshold.
+    """
+    if not (0.0 < fpr < 1.0):
+        raise ValueError("Parameter fpr should be between 0 and 1")
+    logodds = _logodds(matrix)
+    npos = max(1, length - len(logodds) + 1)
+    if scan_rc:
+        npos *= 2
+    pvalue = -np.expm1(np.log1p(-fpr) / npos)
+    return pvalue_threshold(logodds, pvalue, bg=bg, step=step)
+
+
+class ScoreCDF(object):
+    """Empirical distribution of motif scores.
+
+    The scores, for instance the best score of a motif in every background
+    sequence, are quantised to step and stored as unique values with their
+    cumulative counts. Score thresholds for any FPR and the p-values of
+    scores are looked up without scanning the background again.
+
+    Parameters
+    ----------
+    scores : array_like
+        Motif scores.
+
+    step : float, optional
+        Resolution of the scores.
+    """
+
+    def __init__(self, scores, step=DEFAULT_STEP):
+        scores = np.asarray(scores, dtype=np.float64).ravel()
+        if len(scores) == 0:
+            raise ValueError("no scores")
+        self.step = step
+        self.values, counts = np.unique(
+            np.round(scores / step).astype(np.int32), return_counts=True
+        )
+        self.cumcounts = np.cumsum(counts).astype(np.int32)
+
+    def __len__(self):
+        return int(self.cumcounts[-1])
+
+    def __repr__(self):
+        return "<ScoreCDF n={} min={:.3f} max={:.3f}>".format(
+            len(self), self.values[0] * self.step, self.values[-1] * self.step
+        )
+
+    def _value(self, rank):
+        # Score at rank (0-based) in the sorted scores
+        return self.values[np.searchsorted(self.cumcounts, rank, side="right")]
+
+    def threshold(self, fpr):
+        """Return the score threshold for a false positive rate.
+
+        The threshold is the (1 - fpr) percentile of the scores, with linear
+        interpolation as in scipy.stats.scoreatpercentile().
+
+        Parameters
+        ----------
+        fpr : float
+            False positive rate, between 0 and 1.
+
+        Returns
+        -------
+        float
+            Score threshold.
+        """
+        if not (0.0 <= fpr <= 1.0):
+            raise ValueError("Parameter fpr should be between 0 and 1")
+        rank = (1 - fpr) * (len(self) - 1)
+        low = int(np.floor(rank))
+        high = min(low + 1, len(self) - 1)
+        low_value, high_value = self._value(low), self._value(high)
+        return (low_value + (high_value - low_value) * (rank - low)) * self.step
+
+    def pvalues(self, scores):
+        """Return the empirical p-value of scores.
+
+        The p-value is the fraction of scores in the distribution that is at
+        least as high, with a pseudocount of 1 so that it is never 0.
+
+        Parameters
+        ----------
+        scores : array_like
+            Motif scores.
+
+        Returns
+        -------
+        numpy.ndarray
+            p-values.
+        """
+        q = np.round(np.asarray(scores, dtype=np.float64) / self.step)
+        idx = np.searchsorted(self.values, q, side="left")
+        lower = np.where(idx > 0, self.cumcounts[np.maximum(idx - 1, 0)], 0)
+        return (len(self) - lower + 1) / (len(self) + 1)
@@ -1,5 +1,4 @@
 """Calculate motif enrichment statistics."""
-from multiprocessing import Pool
 import logging
 
 import numpy as np
@@ -10,6 +9,7 @@ from gimmemotifs import rocmetrics
 from gimmemotifs.scanner import scan_to_best_match, Scanner
 from gimmemotifs.motif import read_motifs, Motif
 from gimmemotifs.config import MotifConfig
+from gimmemotifs.pool import get_pool, SharedArray
 from gimmemotifs.utils import pfmfile_location
 
 logger = logging.getLogger("gimme.stats")
@@ -128,39 +128,34 @@ def calc_stats_iterator(
         )
         motifs = all_motifs[i : i + chunksize]
 
-        if fg_table is None:
-            fg_total = scan_to_best_match(
-                fg_file, motifs, ncpus=ncpus, genome=genome, zscore=zscore, gc=gc
-            )
-        else:
-            fg_total = pd.read_csv(
-                fg_table, sep="\t", usecols=[m.id for m in motifs], comment="#"
-            ).to_dict(orient="list")
-            for m in fg_total:
-                fg_total[m] = [(x, None) for x in fg_total[m]]
-
-        if bg_table is None:
-            bg_total = scan_to_best_match(
-                bg_file, motifs, ncpus=ncpus, genome=genome, zscore=zscore, gc=gc
-            )
-        else:
-            bg_total = pd.read_csv(
-                bg_table, sep="\t", usecols=[m.id for m in motifs], comment="#"
-            ).to_dict(orient="list")
-            for m in bg_total:
-                bg_total[m] = [(x, None) for x in bg_total[m]]
+        motif_ids = [m.id for m in motifs]
+        arrays = []
+        for fname, table in [(fg_file, fg_table), (bg_file, bg_table)]:
+            positions = None
+            if table is None:
+                total = scan_to_best_match(
+                    fname, motifs, ncpus=ncpus, genome=genome, zscore=zscore, gc=gc
+                )
+                scores = np.array([[x[0] for x in total[m]] for m in motif_ids]).T
+                positions = np.array([[x[1] for x in total[m]] for m in motif_ids]).T
+                scores = scores.reshape(-1, len(motifs))
+                positions = positions.reshape(-1, len(motifs))
+            else:
+                df = pd.read_csv(table, sep="\t", usecols=motif_ids, comment="#")
+                scores = df[motif_ids].values
+            arrays += [scores, positions]
 
         logger.debug("calculating statistics")
 
-        if ncpus == 1:
-            it = _single_stats(motifs, stats, fg_total, bg_total)
+        if get_pool(ncpus) is None:
+            values = _column_stats(stats, *arrays)
         else:
-            it = _mp_stats(motifs, stats, fg_total, bg_total, ncpus)
+            values = _mp_stats(stats, arrays, ncpus)
 
-        for motif_id, s, ret in it:
-            if motif_id not in result:
-                result[motif_id] = {}
-            result[motif_id][s] = ret
+        for j, motif in enumerate(motifs):
+            result[str(motif)] = {}
+            for s in stats:
+                result[str(motif)][s] = _stat_value(s, values[s][j])
         yield result
 
 
@@ -233,56 +228,92 @@ def calc_stats(
     return result
 
 
-def _single_stats(motifs, stats, fg_total, bg_total):
-    # Initialize multiprocessing pool
+def _stat_value(stat, value):
+    """Return a value of _column_stats() as a Python type."""
+    if stat not in rocmetrics.MATRIX_METRICS:
+        return value
+    if stat == "max_fmeasure" and np.isnan(value):
+        # As rocmetrics.max_fmeasure()
+        return None
+    return value.tolist()
 
-    for motif in motifs:
-        motif_id = motif.id
-        fg_vals = fg_total[motif_id]
-        bg_vals = bg_total[motif_id]
-        for s in stats:
-            func = getattr(rocmetrics, s)
-            if func.input_type == "score":
-                fg = [x[0] for x in fg_vals]
-                bg = [x[0] for x in bg_vals]
-            elif func.input_type == "pos":
-                fg = [x[1] for x in fg_vals]
-                bg = [x[1] for x in bg_vals]
-            else:
-                raise ValueError("Unknown input_type for stats")
 
-            ret = func(fg, bg)
-            yield str(motif), s, ret
+def _column_stats(stats, fg_scores, fg_pos, bg_scores, bg_pos):
+    """Calculate statistics for every column of motif scan results.
 
+    Parameters
+    ----------
+    stats : list
+        Names of metrics, see gimmemotifs.rocmetrics.
 
-def _mp_stats(motifs, stats, fg_total, bg_total, ncpus):
-    # Initialize multiprocessing pool
-    pool = Pool(ncpus, maxtasksperchild=1000)
+    fg_scores, fg_pos, bg_scores, bg_pos : numpy.ndarray
+        Best scores and their positions of the positive and negative set,
+        arrays of shape (number of sequences, number of motifs). The
+        positions are only used for metrics that require them.
+
+    Returns
+    -------
+    result : dict
+        For every metric an array with a value per motif, or a list for the
+        metrics that are not in rocmetrics.MATRIX_METRICS.
+    """
+    # Metrics that use scores are calculated for all motifs at once
+    matrix_stats = [s for s in stats if s in rocmetrics.MATRIX_METRICS]
+    result = {}
+    if len(matrix_stats) > 0:
+        result = rocmetrics.score_metrics_matrix(fg_scores, bg_scores, matrix_stats)
+
+    for s in stats:
+        if s in result:
+            continue
+        func = getattr(rocmetrics, s)
+        if func.input_type == "score":
+            fg, bg = fg_scores, bg_scores
+        elif func.input_type == "pos":
+            fg, bg = fg_pos, bg_pos
+        else:
+            raise ValueError("Unknown input_type for stats")
+        result[s] = [
+            func(fg[:, j].tolist(), bg[:, j].tolist()) for j in range(fg.shape[1])
+        ]
+    return result
+
+
+def _shared_column_stats(stats, arrays, start, end):
+    """Calculate statistics of a range of columns of shared arrays."""
+    arrays = [None if a is None else a.array[:, start:end] for a in arrays]
+    return _column_stats(stats, *arrays)
 
-    jobs = []
-    for motif in motifs:
-        motif_id = motif.id
-        fg_vals = fg_total[motif_id]
-        bg_vals = bg_total[motif_id]
-        for s in stats:
-            func = getattr(rocmetrics, s)
-            if func.input_type == "score":
-                fg = [x[0] for x in fg_vals]
-                bg = [x[0] for x in bg_vals]
-            elif func.input_type == "pos":
-                fg = [x[1] for x in fg_vals]
-                bg = [x[1] for x in bg_vals]
-            else:
-                raise ValueError("Unknown input_type for stats")
 
-            j = pool.apply_async(func, (fg, bg))
-            jobs.append([str(motif), s, j])
-    pool.close()
-    pool.join()
+def _mp_stats(stats, arrays, ncpus):
+    """Calculate statistics with the worker pool, see _column_stats().
 
-    for motif_id, s, job in jobs:
-        ret = job.get()
-        yield motif_id, s, ret
+    The arrays are placed in shared memory once and every worker calculates
+    the statistics of a contiguous range of motifs.
+    """
+    pool = get_pool(ncpus)
+    shared = [None if a is None else SharedArray(a) for a in arrays]
+    try:
+        ncols = arrays[0].shape[1]
+        bounds = np.linspace(0, ncols, min(ncpus, ncols) + 1).astype(int)
+        jobs = [
+            pool.apply_async(_shared_column_stats, (stats, shared, start, end))
+            for start, end in zip(bounds[:-1], bounds[1:])
+        ]
+        results = [job.get() for job in jobs]
+    finally:
+        for a in shared:
+            if a is not None:
+                a.close()
+
+    values = {}
+    for s in stats:
+        parts = [r[s] for r in results]
+        if s in rocmetrics.MATRIX_METRICS:
+            values[s] = np.concatenate(parts)
+        else:
+            values[s] = [x for part in parts for x in part]
+    return values
 
 
 def star(stat, categories):
@@ -18,6 +18,7 @@ import random
 import six
 import tempfile
 import requests
+import xxhash
 from subprocess import Popen
 from tempfile import NamedTemporaryFile
 from shutil import copyfile
@@ -30,10 +31,10 @@ from genomepy import Genome
 
 
 # gimme imports
-from gimmemotifs.fasta import Fasta
+from gimmemotifs.fasta import Fasta, iter_fasta
 from gimmemotifs.plot import plot_histogram
 from gimmemotifs.rocmetrics import ks_pvalue
-from gimmemotifs.config import MotifConfig
+from gimmemotifs.config import MotifConfig, CACHE_DIR
 
 
 logger = logging.getLogger("gimme.utils")
@@ -41,6 +42,15 @@ logger = logging.getLogger("gimme.utils")
 # pylint: disable=no-member
 lgam = special.gammaln
 
+# Record type of motif matches written by the c_metrics *scan_array functions
+HIT_DTYPE = np.dtype([("score", np.float64), ("pos", np.int32), ("strand", np.int32)])
+
+# Nucleotide codes used by the c_metrics buffer interface
+_NUC_CODES = np.full(256, 5, dtype=np.uint8)
+for _i, _nucs in enumerate(["Aa", "Cc", "Gg", "Tt", "Nn"]):
+    for _nuc in _nucs:
+        _NUC_CODES[ord(_nuc)] = _i
+
 
 def rc(seq):
     """ Return reverse complement of sequence """
@@ -48,6 +58,27 @@ def rc(seq):
     return seq[::-1].translate(d)
 
 
+def encode_seq(seq):
+    """Encode a sequence as an array of nucleotide codes.
+
+    A, C, G and T (and lowercase) are encoded as 0, 1, 2 and 3, N as 4 and
+    all other characters as 5.
+
+    Parameters
+    ----------
+    seq : str or bytes
+        DNA sequence.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of uint8 nucleotide codes.
+    """
+    if isinstance(seq, str):
+        seq = seq.encode("latin-1", errors="replace")
+    return _NUC_CODES[np.frombuffer(seq, dtype=np.uint8)]
+
+
 def narrowpeak_to_bed(inputfile, bedfile, size=0):
     """Convert narrowPeak file to BED file.
     """
@@ -292,24 +323,48 @@ def motif_localization(fastafile, motif, size, outfile, cutoff=0.9):
         return motif.id, 1.0
 
 
-def parse_cutoff(motifs, cutoff, default=0.9):
+def _cutoff_column(header, fpr=None):
+    """Return the index of the cutoff column in a threshold file header."""
+    columns = header.rstrip("\n").split("\t")
+    idx = [i for i, col in enumerate(columns) if col.split("_")[0] == "Cutoff"]
+    if len(idx) == 1:
+        return idx[0]
+    fprs = [float(columns[i].split("_")[1]) for i in idx]
+    if fpr is not None:
+        for i, col_fpr in zip(idx, fprs):
+            if np.isclose(col_fpr, float(fpr)):
+                return i
+    sys.stderr.write(
+        "Please select the FPR of the cutoff file, one of {}\n".format(
+            ", ".join(str(x) for x in fprs)
+        )
+    )
+    sys.exit(1)
+
+
+def parse_cutoff(motifs, cutoff, default=0.9, fpr=None):
     """ Provide either a file with one cutoff per motif or a single cutoff
         returns a hash with motif id as key and cutoff as value
+
+        A file created by 'gimme threshold' with cutoffs for several FPRs
+        has one Cutoff_<FPR> column per FPR, fpr selects the column.
     """
 
     cutoffs = {}
     if os.path.isfile(str(cutoff)):
+        col = 2
         for i, line in enumerate(open(cutoff)):
-            if line != "Motif\tScore\tCutoff\n":
-                try:
-                    motif, _, c = line.strip().split("\t")
-                    c = float(c)
-                    cutoffs[motif] = c
-                except Exception as e:
-                    sys.stderr.write(
-                        "Error parsing cutoff file, line {0}: {1}\n".format(e, i + 1)
-                    )
-                    sys.exit(1)
+            if line.startswith("Motif\t"):
+                col = _cutoff_column(line, fpr)
+                continue
+            try:
+                vals = line.strip().split("\t")
+                cutoffs[vals[0]] = float(vals[col])
+            except Exception as e:
+                sys.stderr.write(
+                    "Error parsing cutoff file, line {0}: {1}\n".format(e, i + 1)
+                )
+                sys.exit(1)
     else:
         for motif in motifs:
             cutoffs[motif.id] = float(cutoff)
@@ -428,7 +483,8 @@ def determine_file_type(fname):
         return "narrowpeak"
 
     try:
-        Fasta(fname)
+        # Only check the first sequence, the file may be large
+        next(iter_fasta(fname, chunksize=1))
         return "fasta"
     except Exception:
         pass
@@ -519,6 +575,57 @@ def as_fasta(seqs, genome=None):
         return Fasta(tmpfa.name)
 
 
+def as_fasta_chunks(seqs, genome=None, chunksize=10000):
+    """Iterate over sequences in chunks.
+
+    Like as_fasta(), but FASTA, BED and region files are read in chunks, so
+    only one chunk of sequences is kept in memory at a time.
+
+    Parameters
+    ----------
+    seqs : Fasta instance, list or str
+        Fasta object, list of regions or name of FASTA, BED or region file.
+    genome : str or Genome instance, optional
+        Genome, required to retrieve the sequences of regions.
+    chunksize : int, optional
+        Maximum number of sequences per chunk.
+
+    Yields
+    ------
+    fa : Fasta instance
+        Fasta object with the sequences of the next chunk.
+    """
+    ftype = get_seqs_type(seqs)
+    if ftype == "fastafile":
+        for fa in iter_fasta(seqs, chunksize=chunksize):
+            yield fa
+    elif ftype in ["bedfile", "regionfile"]:
+        if isinstance(genome, str):
+            genome = Genome(genome)
+        p = re.compile(r"^(#|track|browser)")
+        with open(seqs) as f:
+            while True:
+                lines = []
+                for line in f:
+                    if line.strip() and not p.search(line):
+                        lines.append(line)
+                        if len(lines) >= chunksize:
+                            break
+                if len(lines) == 0:
+                    break
+                if ftype == "regionfile":
+                    yield as_fasta([line.strip() for line in lines], genome=genome)
+                else:
+                    with NamedTemporaryFile(mode="w", suffix=".bed") as tmp:
+                        tmp.writelines(lines)
+                        tmp.flush()
+                        yield as_fasta(tmp.name, genome=genome)
+    else:
+        fa = as_fasta(seqs, genome=genome)
+        for i in range(0, len(fa), chunksize):
+            yield fa[i : i + chunksize]
+
+
 def file_checksum(fname):
     """Return md5 checksum of file.
 
@@ -539,6 +646,114 @@ def file_checksum(fname):
     return checksum
 
 
+def _read_umask():
+    # Reading the umask changes it, this is only done once at import
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# The umask of the process, for files created by save_atomic()
+_UMASK = _read_umask()
+
+
+def save_atomic(fname, write):
+    """Write a file and replace fname with it atomically.
+
+    Other processes never read an incomplete file. The file gets the
+    permissions of a new file, according to the umask.
+
+    Parameters
+    ----------
+    fname : str
+        Filename, the directory is created if it doesn't exist.
+
+    write : function
+        Function that writes the contents to a binary file object.
+    """
+    directory = os.path.dirname(os.path.abspath(fname))
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    fd, tmp = tempfile.mkstemp(suffix=os.path.splitext(fname)[1], dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        # mkstemp() creates files that only the owner can read
+        os.chmod(tmp, 0o666 & ~_UMASK)
+        os.replace(tmp, fname)
+    except Exception:
+        os.unlink(tmp)
+        raise
+
+
+def cached_file_locations(fname, suffix, name):
+    """Return the locations of a binary file derived from fname.
+
+    The file is stored next to fname, or in the directory name of the cache
+    directory if this is not possible.
+    """
+    digest = xxhash.xxh64(os.path.abspath(fname)).hexdigest()
+    return [fname + suffix, os.path.join(CACHE_DIR, name, digest + suffix)]
+
+
+def load_cached(cache, key, checksum, locations, load, create):
+    """Load a binary file derived from a motif file, or create it.
+
+    Parameters
+    ----------
+    cache : MemoryCache
+        Objects loaded in this process, by key.
+
+    key : str
+        Key of the object in cache.
+
+    checksum : str
+        Checksum of the source, the checksum attribute of a valid object.
+
+    locations : list
+        Filenames to load the object from, see cached_file_locations(). A
+        new object is saved to the first location that can be written.
+
+    load : function
+        Function that loads the object from a filename.
+
+    create : function
+        Function that creates the object, which has a save() method.
+
+    Returns
+    -------
+    object
+        The loaded or created object.
+    """
+    obj = cache.get(key)
+    if obj is not None and obj.checksum == checksum:
+        return obj
+
+    obj = None
+    for location in locations:
+        if os.path.exists(location):
+            try:
+                obj = load(location)
+            except Exception:
+                logger.debug("could not load %s", location)
+                continue
+            if obj.checksum == checksum:
+                break
+            obj = None
+
+    if obj is None:
+        obj = create()
+        for location in locations:
+            try:
+                obj.save(location)
+                break
+            except OSError:
+                logger.debug("could not save %s", location)
+
+    cache.set(key, obj)
+    return obj
+
+
 def join_max(a, l, sep="", suffix=""):
     lengths = [len(x) for x in a]
     total = 0
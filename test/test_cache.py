@@ -0,0 +1,49 @@
+from gimmemotifs.cache import (
+    MemoryCache,
+    DiskCache,
+    TieredCache,
+    make_cache,
+    seq_digest,
+)
+import pytest
+
+
+def test1_memory_cache():
+    c = MemoryCache(2)
+    assert c.get("a") is None
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1
+    # b is the least recently used result
+    c.set("c", 3)
+    assert c.get("b") is None
+    assert c.get("a") == 1
+    assert c.get("c") == 3
+    assert c.stats() == {"hits": 3, "misses": 2, "size": 2}
+
+    with pytest.raises(ValueError):
+        MemoryCache(0)
+
+
+def test2_tiered_cache(tmpdir):
+    disk = DiskCache(str(tmpdir), size_limit=1)
+    c = TieredCache([MemoryCache(1), disk])
+    c.set(("seq", 1), [[(1.0, 2, 1)]])
+    c.set(("seq", 2), [[(2.0, 3, -1)]])
+    assert len(disk) == 2
+    assert c.get(("seq", 1)) == [[(1.0, 2, 1)]]
+    assert c.caches[0].get(("seq", 1)) == [[(1.0, 2, 1)]]
+    assert c.get(("seq", 3)) is None
+    assert (c.hits, c.misses) == (1, 1)
+
+
+def test3_make_cache(tmpdir):
+    assert isinstance(make_cache("memory", size=10), MemoryCache)
+    assert isinstance(make_cache("disk", directory=str(tmpdir)), DiskCache)
+    assert isinstance(make_cache("tiered", directory=str(tmpdir)), TieredCache)
+    with pytest.raises(ValueError):
+        make_cache("memcached")
+
+
+def test4_digest():
+    assert seq_digest("ACGT") == seq_digest("acgt")
@@ -1,7 +1,18 @@
 import unittest
 import tempfile
 import os
-from gimmemotifs.comparison import MotifComparer
+import shutil
+import numpy as np
+from gimmemotifs.comparison import (
+    MatchIndex,
+    MotifComparer,
+    SimilarityStore,
+    all_pairs_scores,
+    load_match_index,
+    seqcor,
+    seqcor_scores,
+)
+from gimmemotifs.motif import Motif, read_motifs
 from time import sleep
 
 
@@ -29,6 +40,143 @@ class TestComparison(unittest.TestCase):
         self.assertEqual(1, scores[2])
         self.assertAlmostEqual(3.1666e-8, scores[3])
 
+    def test2_all_pairs_scores(self):
+        """ All pairs scores as compare_motifs() """
+        mc = MotifComparer()
+
+        motifs = read_motifs("test/data/pwms/motifs.pwm", fmt="pwm")
+        motifs.append(Motif([[0.25, 0.25, 0.25, 0.25]] * 3))
+        for match in ["total", "partial", "subtotal"]:
+            for metric in ["wic", "ed", "distance"]:
+                for combine in ["mean", "sum"]:
+                    scores, positions, strands = all_pairs_scores(
+                        motifs, motifs, match, metric, combine, block_bytes=1024
+                    )
+                    for i, m1 in enumerate(motifs):
+                        for j, m2 in enumerate(motifs):
+                            expected = mc.compare_motifs(m1, m2, match, metric, combine)
+                            if not expected:
+                                self.assertTrue(np.isnan(scores[i, j]))
+                                continue
+                            self.assertAlmostEqual(expected[0], scores[i, j])
+                            if max(i, j) == len(motifs) - 1:
+                                # Positions of the uniform motif are tied
+                                continue
+                            self.assertEqual(expected[1], positions[i, j])
+                            self.assertEqual(expected[2], strands[i, j])
+
+        scores = mc.get_all_scores(motifs, motifs, "partial", "wic", "mean")
+        self.assertEqual(len(motifs), len(scores))
+        self.assertEqual([0, 1], scores[motifs[0].id][motifs[0].id][1:])
+
+        # Score arrays with p-values, as get_all_scores()
+        motifs = motifs[:-1]
+        expected = mc.get_all_scores(motifs, motifs, "total", "wic", "mean", pval=True)
+        scores, positions, strands = mc.get_all_score_arrays(
+            motifs, motifs, "total", "wic", "mean", pval=True
+        )
+        for i, m1 in enumerate(motifs):
+            for j, m2 in enumerate(motifs):
+                self.assertAlmostEqual(expected[m1.id][m2.id][0], scores[i, j])
+                self.assertEqual(expected[m1.id][m2.id][1], positions[i, j])
+                self.assertEqual(expected[m1.id][m2.id][2], strands[i, j])
+
+        with self.assertRaises(ValueError):
+            all_pairs_scores(motifs, motifs, metric="seqcor")
+
+    def test3_seqcor_scores(self):
+        """ seqcor of all pairs """
+        mc = MotifComparer()
+
+        motifs = read_motifs("test/data/pwms/motifs.pwm", fmt="pwm")
+        scores, positions, strands = seqcor_scores(motifs, motifs[:3])
+        self.assertEqual((5, 3), scores.shape)
+        for i in range(3):
+            self.assertAlmostEqual(1, scores[i, i])
+            self.assertEqual(0, positions[i, i])
+        for i, m1 in enumerate(motifs):
+            for j, m2 in enumerate(motifs[:3]):
+                score = seqcor(m1, m2)
+                self.assertAlmostEqual(score[0], scores[i, j])
+                self.assertEqual(score[1:], [positions[i, j], strands[i, j]])
+
+        all_scores = mc.get_all_scores(motifs, motifs, "partial", "seqcor", "mean")
+        score = all_scores[motifs[3].id][motifs[1].id]
+        self.assertAlmostEqual(scores[3, 1], score[0])
+        self.assertEqual([positions[3, 1], strands[3, 1]], score[1:])
+
+    def test4_match_index(self):
+        """ seqcor matches from the match index """
+        mc = MotifComparer()
+
+        tmpdir = tempfile.mkdtemp()
+        pfmfile = os.path.join(tmpdir, "db.pfm")
+        shutil.copyfile("test/data/pwms/motifs.pwm", pfmfile)
+        index = load_match_index(pfmfile)
+        self.assertTrue(os.path.exists(pfmfile + ".match.npz"))
+        self.assertEqual(5, len(index))
+        # Profiles are memory-mapped from the saved index
+        index = MatchIndex.load(pfmfile + ".match.npz")
+        self.assertIsInstance(index._profiles, np.memmap)
+        profiles = [f for f in os.listdir(tmpdir) if f.endswith(".npy")]
+        self.assertEqual(["db.pfm.match.{}.npy".format(index.checksum)], profiles)
+
+        motifs = read_motifs("test/data/pwms/motifs.pwm", fmt="pwm")[:3]
+        expected = mc.get_best_matches(motifs, 2, read_motifs(pfmfile), metric="seqcor")
+        matches = mc.get_best_matches(motifs, 2, pfmfile, metric="seqcor")
+        self.assertEqual(expected.keys(), matches.keys())
+        for motif_id, result in matches.items():
+            self.assertEqual(motif_id, result[0][0])
+            for match, expected_match in zip(result, expected[motif_id]):
+                self.assertEqual(expected_match[0], match[0])
+                self.assertAlmostEqual(expected_match[1][0], match[1][0])
+                self.assertEqual(expected_match[1][1:3], match[1][1:3])
+                self.assertTrue(np.isnan(match[1][3]))
+
+        shutil.rmtree(tmpdir)
+
+    def test5_similarity_store(self):
+        """ Scores of all pairs on disk """
+        mc = MotifComparer()
+
+        motifs = read_motifs("test/data/pwms/motifs.pwm", fmt="pwm")
+        expected = mc.get_all_score_arrays(motifs, motifs, "total", "wic", "mean")
+        for ncpus in [1, 2]:
+            store = mc.get_similarity_store(
+                motifs, "total", "wic", "mean", ncpus=ncpus, tile=2
+            )
+            self.assertEqual(5, len(store))
+            self.assertEqual(np.float32, store.scores.dtype)
+            self.assertEqual(np.int8, store.strands.dtype)
+            np.testing.assert_allclose(expected[0], store.scores, rtol=1e-6)
+            np.testing.assert_equal(expected[1], store.positions)
+            np.testing.assert_equal(expected[2], store.strands)
+            store.close()
+            self.assertFalse(os.path.exists(store.dirname))
+
+        # Default tile size
+        store = mc.get_similarity_store(motifs, "total", "wic", "mean", ncpus=2)
+        np.testing.assert_allclose(expected[0], store.scores, rtol=1e-6)
+        store.close()
+
+        # A store is removed if a tile fails
+        tmpdirs = set(os.listdir(tempfile.gettempdir()))
+        with self.assertRaises(Exception):
+            mc.get_similarity_store(motifs, "total", "unknown", "mean", ncpus=2, tile=2)
+        new_dirs = set(os.listdir(tempfile.gettempdir())) - tmpdirs
+        self.assertFalse([d for d in new_dirs if d.startswith("gimme.similarity.")])
+
+        tmpdir = tempfile.mkdtemp()
+        with mc.get_similarity_store(
+            motifs, "total", "wic", "mean", pval=True, dirname=tmpdir
+        ) as store:
+            scores = np.array(store.scores)
+        self.assertTrue(os.path.exists(os.path.join(tmpdir, "scores.npy")))
+        store = SimilarityStore(tmpdir)
+        np.testing.assert_equal(scores, store.scores)
+        store.close()
+        shutil.rmtree(tmpdir)
+
     def tearDown(self):
         pass
 
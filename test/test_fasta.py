@@ -48,3 +48,36 @@ def test4_gt_in_id(id_fa_files):
         print(seqs)
         for i in range(3):
             assert seqs[i] == "ACTG" * (i + 1)
+
+
+@pytest.mark.parametrize("chunksize", [1, 2, 10])
+def test5_iter_fasta(fasta_file, id_fa_files, chunksize):
+    """ Read FASTA file in chunks """
+    for fname in [fasta_file] + id_fa_files:
+        fa = Fasta(fname)
+        chunks = list(iter_fasta(fname, chunksize=chunksize))
+        assert all(len(chunk) <= chunksize for chunk in chunks)
+        assert sum([chunk.ids for chunk in chunks], []) == fa.ids
+        assert sum([chunk.seqs for chunk in chunks], []) == fa.seqs
+
+
+def test6_duplicate_ids():
+    """ Lookup of sequences with duplicate ids """
+    f = Fasta()
+    f.add("seq1", "AAAA")
+    f.add("seq2", "CCCC")
+    f.add("seq1", "GGGG")
+    assert f["seq1"] == "AAAA"
+    assert f.has_key("seq2")
+    assert f["seq3"] is None
+
+    f["seq1"] = "TTTT"
+    assert f.seqs == ["TTTT", "CCCC", "GGGG"]
+
+    del f["seq1"]
+    assert f.ids == ["seq2", "seq1"]
+    assert f["seq1"] == "GGGG"
+
+    f = f[1:]
+    assert f["seq1"] == "GGGG"
+    assert f["seq2"] is None
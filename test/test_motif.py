@@ -2,7 +2,11 @@ from __future__ import print_function
 from io import StringIO
 import unittest
 import os
+import pickle
+import shutil
+import tempfile
 import numpy as np
+from gimmemotifs.config import DIRECT_NAME, INDIRECT_NAME
 from gimmemotifs.motif import Motif, read_motifs
 from gimmemotifs.shutils import which
 
@@ -199,6 +203,74 @@ class TestMotif(unittest.TestCase):
         self.assertEqual(9, len(motifs[-1]))
         self.assertEqual("RGGCAWGYC", motifs[-1].to_consensus().upper())
 
+    def test_compact_motif(self):
+        m = Motif(self.pfm)
+        m.id = "compact"
+
+        # Matrices are stored as arrays, lists are returned
+        self.assertEqual(self.pfm, m.pwm)
+        self.assertEqual(10, len(m))
+        self.assertEqual((10, 4), m.logodds.shape)
+        self.assertIs(Motif.iupac, m.iupac)
+        self.assertIs(Motif().config, m.config)
+        self.assertEqual({DIRECT_NAME: [], INDIRECT_NAME: []}, m.factors)
+
+        # Cached values are updated when the pwm changes
+        h = m.hash()
+        max_score = m.pwm_max_score()
+        m.pwm = m.pwm[:4]
+        self.assertEqual(4, len(m))
+        self.assertEqual((4, 4), m.logodds.shape)
+        self.assertNotEqual(h, m.hash())
+        self.assertLess(m.pwm_max_score(), max_score)
+        with self.assertRaises(ValueError):
+            m.logodds[0, 0] = 1
+
+        m.factors[DIRECT_NAME].append("TF")
+        m.align = ["ACGT"]
+        copy = pickle.loads(pickle.dumps(m))
+        self.assertEqual(m.to_pwm(), copy.to_pwm())
+        self.assertEqual(m.hash(), copy.hash())
+        self.assertEqual(["TF"], copy.factors[DIRECT_NAME])
+        self.assertEqual(["ACGT"], copy.align)
+
+    def test_motif_db(self):
+        tmpdir = tempfile.mkdtemp()
+        pfmfile = os.path.join(tmpdir, "motifs.pfm")
+        shutil.copyfile(self.pwm2, pfmfile)
+        with open(os.path.join(tmpdir, "motifs.motif2factors.txt"), "w") as f:
+            f.write("M5659_1.01\tTF1,TF2\n")
+
+        motifs = read_motifs(pfmfile)
+        self.assertTrue(os.path.exists(pfmfile + ".npz"))
+        # The database has the permissions of a new file
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = os.stat(pfmfile + ".npz").st_mode & 0o777
+        self.assertEqual(0o666 & ~umask, mode)
+        with open(self.pwm2) as f:
+            expected = read_motifs(f)
+        self.assertEqual([m.to_pfm() for m in expected], [m.to_pfm() for m in motifs])
+
+        # Motifs are created when they are accessed
+        db = read_motifs(pfmfile, lazy=True)
+        self.assertEqual(5, len(db))
+        self.assertIn("M5715_1.01", db)
+        self.assertEqual(expected[3].to_pwm(), db["M5715_1.01"].to_pwm())
+        self.assertEqual(expected[-1].to_pwm(), db[-1].to_pwm())
+        self.assertEqual(["TF1", "TF2"], sorted(db[1].factors[DIRECT_NAME]))
+        with self.assertRaises(KeyError):
+            db["unknown"]
+
+        # The database is created again when the motif file changes
+        with open(pfmfile, "a") as f:
+            f.write(">new\n0.5\t0.5\t0\t0\n")
+        db = read_motifs(pfmfile, lazy=True)
+        self.assertEqual(6, len(db))
+        self.assertEqual("new", db[-1].id)
+
+        shutil.rmtree(tmpdir)
+
     def tearDown(self):
         pass
 
@@ -0,0 +1,66 @@
+import pickle
+
+from gimmemotifs.motif import Motif, read_motifs
+from gimmemotifs.motifset import MotifSet
+from gimmemotifs.scanner import compile_motifs
+import numpy as np
+import pytest
+
+MOTIFS = "test/data/pwms/motifs.pwm"
+
+
+def test1_motifset():
+    motifs = read_motifs(MOTIFS)
+    ms = MotifSet(MOTIFS)
+    assert len(ms) == len(motifs)
+    assert ms.ids == tuple(m.id for m in motifs)
+    assert ms.hashes == tuple(m.hash() for m in motifs)
+    assert ms[1].id == motifs[1].id
+    assert ms[motifs[1].id].id == motifs[1].id
+    assert motifs[0].id in ms
+    assert list(ms.offsets) == [0] + list(np.cumsum([len(m) for m in motifs]))
+    np.testing.assert_allclose(ms.max_scores, [m.pwm_max_score() for m in motifs])
+
+    # Same motifs, same digest
+    assert MotifSet(motifs) == ms
+    assert MotifSet(motifs).digest == ms.digest
+    assert MotifSet(motifs[::-1]).digest != ms.digest
+    # Motifs with the same hash, the digest uses the exact matrices
+    m1 = Motif([[0.7, 0.1, 0.1, 0.1]] * 3)
+    m2 = Motif([[0.7004, 0.1, 0.1, 0.0996]] * 3)
+    assert m1.hash() == m2.hash()
+    assert MotifSet([m1]).digest != MotifSet([m2]).digest
+
+    with pytest.raises(KeyError):
+        ms.index("unknown")
+    with pytest.raises(ValueError):
+        MotifSet([])
+
+
+def test2_immutable():
+    ms = MotifSet(MOTIFS)
+    with pytest.raises(AttributeError):
+        ms.ids = ()
+    with pytest.raises(ValueError):
+        ms.logodds[0, 0] = 1
+
+    copy = pickle.loads(pickle.dumps(ms))
+    assert copy == ms
+    assert copy.index(ms.ids[-1]) == len(ms) - 1
+    np.testing.assert_array_equal(copy.logodds, ms.logodds)
+    with pytest.raises(AttributeError):
+        copy.ids = ()
+
+
+def test3_compile():
+    motifs = read_motifs(MOTIFS)
+    ms = MotifSet(motifs)
+    cutoffs = {m.id: m.pwm_min_score() for m in motifs}
+    cutoffs[motifs[0].id] = None
+
+    expected = compile_motifs([(m, cutoffs[m.id]) for m in motifs])
+    for result, array in zip(ms.compile(cutoffs), expected):
+        np.testing.assert_array_equal(result, array)
+
+    with pytest.raises(ValueError):
+        ms.cutoff_array([0.0])
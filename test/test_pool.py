@@ -0,0 +1,154 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+import gimmemotifs.pool
+
+from gimmemotifs.pool import (
+    get_pool,
+    set_pool_size,
+    close_pool,
+    share,
+    get_shared,
+    SharedArray,
+    MAX_SHARED,
+)
+
+
+def _is_worker(_):
+    # The shared pool is not available from within a worker
+    return get_pool(2) is None
+
+
+def _get_shared(key):
+    return get_shared(key)
+
+
+def _slow_get_shared(key):
+    time.sleep(0.2)
+    return get_shared(key)
+
+
+def _column_sum(shared, column):
+    return shared.array[:, column].sum()
+
+
+@pytest.fixture()
+def pool():
+    yield get_pool(2)
+    set_pool_size()
+    close_pool()
+
+
+def test1_shared_pool(pool):
+    assert pool is not None
+    assert get_pool(2) is pool
+    # A smaller request is served by the running pool
+    assert get_pool(1) is None
+    assert get_pool(2) is pool
+    assert pool.map(abs, [-1, 2, -3]) == [1, 2, 3]
+
+
+def test2_resize_pool(pool):
+    # A running pool is not closed by a larger request
+    assert get_pool(3) is pool
+    assert pool.apply_async(abs, (-1,)).get() == 1
+
+    set_pool_size(3)
+    larger = get_pool()
+    assert larger is not pool
+    assert get_pool(2) is larger
+
+    with pytest.raises(ValueError):
+        set_pool_size(0)
+
+
+def test3_close_pool(pool):
+    close_pool()
+    new_pool = get_pool(2)
+    assert new_pool is not None
+    assert new_pool is not pool
+
+
+def test4_worker_pool(pool):
+    assert all(pool.map(_is_worker, range(4)))
+
+
+def test5_thread_pool(pool):
+    threads = get_pool(2, backend="thread")
+    assert threads is not None
+    assert threads is not pool
+    assert get_pool(2, backend="thread") is threads
+    # Threads can start processes
+    assert not any(threads.map(_is_worker, range(4)))
+
+    close_pool("thread")
+    assert get_pool(2, backend="thread") is not threads
+    assert get_pool(2) is pool
+
+    with pytest.raises(ValueError):
+        get_pool(2, backend="cluster")
+
+
+def test6_share(pool):
+    share("test6", [1, 2, 3])
+    # The running pool is kept, the workers load the object when needed
+    assert get_pool(2) is pool
+    assert pool.map(_get_shared, ["test6"] * 4) == [[1, 2, 3]] * 4
+    assert get_shared("test6") == [1, 2, 3]
+
+    # Sharing an object again doesn't restart the pool
+    share("test6", [1, 2, 3])
+    assert get_pool(2) is pool
+
+    # Another object with the same key replaces the shared object
+    share("test6", [1, 2])
+    assert get_shared("test6") == [1, 2]
+    assert pool.map(_get_shared, ["test6"] * 4) == [[1, 2]] * 4
+
+    # Objects shared with a running pool are removed with the pool
+    share("test6b", [4, 5])
+    assert pool.map(_get_shared, ["test6b"] * 4) == [[4, 5]] * 4
+    fnames = [gimmemotifs.pool._shared_files[k] for k in ["test6", "test6b"]]
+    assert all(os.path.exists(fname) for fname in fnames)
+    close_pool()
+    assert not any(os.path.exists(fname) for fname in fnames)
+
+    with pytest.raises(KeyError):
+        get_shared("unknown")
+
+
+def test7_share_many(pool):
+    # Shared before the pool starts
+    close_pool()
+    share("test7", [1])
+    pool = get_pool(2)
+    assert pool.map(_get_shared, ["test7"] * 4) == [[1]] * 4
+    # Workers evict objects, the objects of the calling process stay available
+    for i in range(MAX_SHARED + 1):
+        share("test7", get_shared("test7"))
+        share("test7_{}".format(i), [i])
+        assert pool.map(_get_shared, ["test7_{}".format(i)] * 4) == [[i]] * 4
+    assert pool.map(_get_shared, ["test7"] * 4) == [[1]] * 4
+
+
+def test8_close_running_threads(pool):
+    share("test8", [1])
+    threads = get_pool(2, backend="thread")
+    result = threads.map_async(_slow_get_shared, ["test8"] * 4)
+    # Running tasks can get shared objects while the pool is joined
+    close_pool("thread")
+    assert result.get(timeout=10) == [[1]] * 4
+
+
+def test9_shared_array(pool):
+    array = np.arange(12, dtype=float).reshape(4, 3)
+    with SharedArray(array) as shared:
+        assert os.path.exists(shared.fname)
+        np.testing.assert_equal(array, shared.array)
+        assert not shared.array.flags.writeable
+        sums = [pool.apply_async(_column_sum, (shared, j)).get() for j in range(3)]
+        assert sums == [18, 22, 26]
+    assert not os.path.exists(shared.fname)
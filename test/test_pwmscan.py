@@ -42,6 +42,34 @@ class TestMotifPwm(unittest.TestCase):
                 self.assertTrue(float(vals[5]) < 9.06)
                 self.assertIn(vals[6], ["+", "-"])
 
+    def test3_pwm_scan_array(self):
+        """ Scan encoded sequences into hit arrays """
+        from gimmemotifs.c_metrics import pwmscan_array, pfmscan_array
+        from gimmemotifs.utils import encode_seq, HIT_DTYPE
+
+        logodds = np.array(self.motif.logodds)
+        c = self.motif.pwm_min_score() + 0.9 * (
+            self.motif.pwm_max_score() - self.motif.pwm_min_score()
+        )
+        for seq in self.prom.seqs:
+            codes = encode_seq(seq)
+            expected = np.zeros(5, dtype=HIT_DTYPE)
+            n = pfmscan_array(codes, np.array(self.motif.pwm), c, 5, True, expected)
+            self.assertGreater(n, 0)
+            self.assertTrue(np.all(np.diff(expected["score"][:n]) <= 0))
+            for dtype in [np.float64, np.float32]:
+                hits = np.zeros(5, dtype=HIT_DTYPE)
+                self.assertEqual(
+                    n, pwmscan_array(codes, logodds.astype(dtype), c, 5, True, hits)
+                )
+                np.testing.assert_allclose(expected["score"], hits["score"], rtol=1e-5)
+                if dtype == np.float64:
+                    np.testing.assert_array_equal(expected["pos"], hits["pos"])
+                    np.testing.assert_array_equal(expected["strand"], hits["strand"])
+
+        with self.assertRaises(ValueError):
+            pwmscan_array(codes, logodds, c, 5, True, np.zeros(1, dtype=HIT_DTYPE))
+
     def tearDown(self):
         pass
 
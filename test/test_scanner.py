@@ -3,6 +3,8 @@ import tempfile
 import os
 from gimmemotifs.scanner import *
 from gimmemotifs.fasta import Fasta
+from gimmemotifs.motif import Motif
+from gimmemotifs.cache import MemoryCache
 from time import sleep
 
 
@@ -65,6 +67,177 @@ class TestScanner(unittest.TestCase):
         for score, match in zip(scores, result["AP1"]):
             self.assertAlmostEqual(score, match, 5)
 
+    def test4_scan_sequence_multi(self):
+        """ Scan a sequence with all motifs in one pass """
+        from gimmemotifs.c_metrics import pwmscan
+
+        motifs = read_motifs(self.motifs)
+        f = Fasta(self.fa)
+        for nreport, scan_rc in [(1, True), (5, True), (3, False)]:
+            cutoffs = [
+                m.pwm_min_score() + 0.8 * (m.pwm_max_score() - m.pwm_min_score())
+                for m in motifs
+            ]
+            compiled = compile_motifs(list(zip(motifs, cutoffs)))
+            for seq in f.seqs:
+                result = scan_sequence(seq, compiled, nreport, scan_rc)
+                self.assertEqual(len(motifs), len(result))
+                for motif, cutoff, matches in zip(motifs, cutoffs, result):
+                    expected = pwmscan(
+                        seq, motif.logodds.tolist(), cutoff, nreport, scan_rc
+                    )
+                    self.assertEqual(len(expected), len(matches))
+                    for (s1, p1, st1), (s2, p2, st2) in zip(expected, matches):
+                        self.assertAlmostEqual(s1, s2, 5)
+                        self.assertEqual((p1, st1), (p2, st2))
+
+        # A cutoff of None means the motif is not scanned
+        compiled = compile_motifs([(m, None) for m in motifs])
+        self.assertEqual(
+            [[]] * len(motifs), scan_sequence(f.seqs[0], compiled, 1, True)
+        )
+
+    def test5_best_score_matrix(self):
+        """ Best score matrix of all motifs and sequences """
+        fname = "test/data/scan/scan_test_regions.fa"
+        for ncpus in [1, 2]:
+            s = Scanner(ncpus=ncpus)
+            s.set_motifs("test/data/pwms/motifs.pwm")
+            s.set_threshold(threshold=0.0)
+            expected = np.array([[m[0][0] for m in row] for row in s.scan(fname, 1)])
+
+            scores = s.best_score_matrix(fname)
+            self.assertEqual(np.float32, scores.dtype)
+            self.assertEqual(expected.shape, scores.shape)
+            np.testing.assert_allclose(expected, scores, rtol=1e-5)
+
+            blocks = list(s.best_score_blocks(fname, blocksize=10))
+            self.assertEqual(10, len(blocks[0]))
+            np.testing.assert_array_equal(scores, np.vstack(blocks))
+
+    def test6_count(self):
+        """ Count matches of all motifs in all sequences """
+        fname = "test/data/scan/scan_test_regions.fa"
+        s = Scanner(ncpus=2)
+        s.set_motifs("test/data/pwms/motifs.pwm")
+        for threshold in [0.0, 0.9]:
+            s.set_threshold(threshold=threshold)
+            for nreport in [0, 1, 10]:
+                expected = np.array(
+                    [[len(m) for m in row] for row in s.scan(fname, nreport)]
+                )
+                counts = np.vstack(list(s.count_blocks(fname, nreport)))
+                self.assertEqual(np.int32, counts.dtype)
+                np.testing.assert_array_equal(expected, counts)
+                np.testing.assert_array_equal(
+                    expected.sum(0), s.total_count(fname, nreport)
+                )
+
+    def test7_count_score(self):
+        """ Count matches and best scores in a single pass """
+        fname = "test/data/scan/scan_test_regions.fa"
+        s = Scanner(ncpus=2)
+        s.set_motifs("test/data/pwms/motifs.pwm")
+        s.set_threshold(threshold=0.9)
+        counts = np.vstack(list(s.count_blocks(fname)))
+        scores = s.best_score_matrix(fname)
+
+        s.set_threshold(threshold=0.9)
+        blocks = list(s.count_score_blocks(fname, blocksize=10))
+        np.testing.assert_array_equal(counts, np.vstack([b[0] for b in blocks]))
+        np.testing.assert_array_equal(scores, np.vstack([b[1] for b in blocks]))
+
+    def test8_command_scan_chunks(self):
+        """ Scan input in chunks """
+        kwargs = dict(cutoff=0.0, fpr=None, ncpus=1)
+        for fname in [self.fa, "test/data/scan/scan_test_regions.fa"]:
+            expected = list(command_scan(fname, self.motifs, **kwargs))
+            for chunksize in [1, 2]:
+                result = list(
+                    command_scan(fname, self.motifs, chunksize=chunksize, **kwargs)
+                )
+                self.assertEqual(expected, result)
+
+    def test9_thread_backend(self):
+        """ Scan with a pool of threads """
+        fname = "test/data/scan/scan_test_regions.fa"
+        s = Scanner(ncpus=1)
+        s.set_motifs("test/data/pwms/motifs.pwm")
+        s.set_threshold(threshold=0.9)
+        expected = list(s.scan(fname, 10))
+        counts = np.vstack(list(s.count_blocks(fname)))
+        scores = s.best_score_matrix(fname)
+
+        s = Scanner(ncpus=2, backend="thread")
+        s.set_motifs("test/data/pwms/motifs.pwm")
+        s.set_threshold(threshold=0.9)
+        self.assertEqual(expected, list(s.scan(fname, 10)))
+        np.testing.assert_array_equal(counts, np.vstack(list(s.count_blocks(fname))))
+        np.testing.assert_array_equal(scores, s.best_score_matrix(fname))
+
+        with self.assertRaises(ValueError):
+            Scanner(backend="cluster")
+
+    def test10_cache(self):
+        """ Scan with a result cache """
+        fname = "test/data/scan/scan_test_regions.fa"
+        s = Scanner(ncpus=2)
+        s.set_motifs("test/data/pwms/motifs.pwm")
+        s.set_threshold(threshold=0.9)
+        expected = list(s.scan(fname, 10))
+
+        # The cache is smaller than the number of sequences
+        cache = MemoryCache(5)
+        s = Scanner(ncpus=2, cache=cache)
+        s.set_motifs("test/data/pwms/motifs.pwm")
+        s.set_threshold(threshold=0.9)
+        self.assertEqual(expected, list(s.scan(fname, 10)))
+        self.assertEqual(0, cache.hits)
+        self.assertEqual(5, len(cache))
+
+        # Only the last five sequences are still cached
+        fa = Fasta(fname)
+        seqs = Fasta()
+        for seq_id, seq in list(zip(fa.ids[-5:], fa.seqs[-5:])) * 2:
+            seqs.add(seq_id, seq)
+        self.assertEqual(expected[-5:] * 2, list(s.scan(seqs, 10)))
+        self.assertEqual(5, cache.hits)
+
+        # Different thresholds use different results
+        s.set_threshold(threshold=0.8)
+        list(s.scan(seqs, 10))
+        self.assertEqual(5, cache.hits)
+
+    def test11_similar_motifs(self):
+        """ Scanners of nearly identical motifs """
+        fa = Fasta()
+        fa.add("seq1", "AAAAAAAA")
+        for ncpus in [1, 2]:
+            scores = []
+            for p in [0.7, 0.7004]:
+                s = Scanner(ncpus=ncpus)
+                s.set_motifs([Motif([[p, 0.1, 0.1, 0.8 - p]] * 3)])
+                s.set_threshold(threshold=0.0)
+                scores.append(list(s.best_score(fa))[0][0])
+            self.assertNotAlmostEqual(scores[0], scores[1], 5)
+
+    def test12_scan_zscore(self):
+        """ Scan with z-score normalized scores """
+        fname = "test/data/scan/scan_test_regions.fa"
+        s = Scanner(ncpus=2)
+        s.set_motifs("test/data/pwms/motifs.pwm")
+        s.set_background(fname=fname)
+        s.set_threshold(threshold=0.5)
+        result = list(s.scan(fname, 2, zscore=True))
+        fa = Fasta(fname)
+        mean, std = s._meanstd_arrays(s._seq_bin_index(fa.seqs))
+        for k, (zrow, row) in enumerate(zip(result, s.scan(fname, 2))):
+            for j, (zmatches, matches) in enumerate(zip(zrow, row)):
+                expected = [
+                    ((x[0] - mean[k, j]) / std[k, j], x[1], x[2]) for x in matches
+                ]
+                self.assertEqual(expected, zmatches)
+
     def testThreshold(self):
         s = Scanner()
         s.set_motifs("test/data/pwms/motifs.pwm")
@@ -73,6 +246,72 @@ class TestScanner(unittest.TestCase):
         s.set_background(fname=fname)
         s.set_threshold(fpr=0.02)
 
+    def test11_score_cdf(self):
+        """ Thresholds and p-values from the background score distribution """
+        fname = "test/data/scan/scan_test_regions.fa"
+        s = Scanner(ncpus=1)
+        s.set_motifs("test/data/pwms/motifs.pwm")
+        s.set_background(fname=fname)
+        s.set_threshold(fpr=0.05)
+        thresholds = s.threshold
+        scores = s.best_score_matrix(fname)
+        for i, motif_id in enumerate(s.motif_ids):
+            cdf = s.score_cdf[motif_id][None]
+            self.assertEqual(len(scores), len(cdf))
+            pvalues = s.hit_pvalues(motif_id, scores[:, i])
+            self.assertTrue(np.all(pvalues > 0))
+            self.assertTrue(np.all(pvalues <= 1))
+            # The threshold is the 95th percentile of the background scores
+            self.assertAlmostEqual(
+                np.percentile(scores[:, i], 95), cdf.threshold(0.05), 2
+            )
+            if thresholds[motif_id] is not None:
+                self.assertEqual(cdf.threshold(0.05), thresholds[motif_id])
+
+        # Matches have a p-value column
+        kwargs = dict(bgfile=fname, ncpus=1, bed=True, hit_pvalue=True)
+        for line in command_scan(fname, "test/data/pwms/motifs.pwm", **kwargs):
+            self.assertEqual(7, len(line.split("\t")))
+
+        with self.assertRaises(ValueError):
+            s.hit_pvalues("unknown", [1.0])
+
+    def test12_threshold_table(self):
+        """ Select the FPR of a threshold file """
+        motifs = read_motifs(self.motifs)
+        fname = os.path.join(self.tmpdir, "thresholds.txt")
+        with open(fname, "w") as f:
+            f.write("Motif\tScore_0.01\tCutoff_0.01\tScore_0.05\tCutoff_0.05\n")
+            for m in motifs:
+                f.write("{}\t0\t0.9\t0\t0.8\n".format(m.id))
+
+        s = Scanner(ncpus=1)
+        s.set_motifs(self.motifs)
+        for fpr, cutoff in [(0.01, 0.9), (0.05, 0.8)]:
+            s.set_threshold(fpr=fpr, threshold=fname)
+            for m in motifs:
+                expected = parse_threshold_values(self.motifs, cutoff)[m.id]
+                self.assertAlmostEqual(expected, s.threshold[m.id])
+
+        # The FPR is required with several cutoff columns
+        with self.assertRaises(SystemExit):
+            s.set_threshold(threshold=fname)
+
+    def test13_gc_bins(self):
+        """ Assign sequences to GC% bins """
+        s = Scanner(ncpus=1)
+        s.gc_bins = [(0.0, 0.2), (0.8, 1)]
+        s.gc_bins += [(b, b + 0.05) for b in np.arange(0.2, 0.799, 0.05)]
+        # Sequences on bin boundaries, the lowest and the highest bin
+        seqs = ["G" * 101 + "A" * 99, "G" * 20 + "A" * 80, "A" * 10, "gC"]
+        bins = ["0.50-0.55", "0.00-0.20", "0.00-0.20", "0.80-1.00"]
+        self.assertEqual(bins, [s.get_seq_bin(seq) for seq in seqs])
+        self.assertEqual(bins, [s._bin_name(i) for i in s._seq_bin_index(seqs)])
+
+        s.gc_bins = [(0.5, 1)]
+        with self.assertRaises(ValueError):
+            s._seq_bin_index(seqs)
+
     def tearDown(self):
         pass
 
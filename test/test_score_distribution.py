@@ -0,0 +1,115 @@
+from itertools import product
+
+from gimmemotifs.motif import read_motifs
+from gimmemotifs.scanner import Scanner
+from gimmemotifs.score_distribution import (
+    background_model,
+    score_distribution,
+    score_pvalues,
+    pvalue_threshold,
+    fpr_threshold,
+    ScoreCDF,
+)
+import numpy as np
+from scipy.stats import scoreatpercentile
+import pytest
+
+
+@pytest.fixture()
+def logodds():
+    rng = np.random.RandomState(2)
+    return rng.normal(size=(5, 4))
+
+
+def exact_pvalue(logodds, bg, score):
+    start = bg.sum(1) / bg.sum() if bg.ndim == 2 else bg
+    p = 0
+    for kmer in product(range(4), repeat=len(logodds)):
+        if sum(logodds[i, n] for i, n in enumerate(kmer)) >= score:
+            if bg.ndim == 1:
+                p += np.prod(bg[list(kmer)])
+            else:
+                trans = bg / bg.sum(1, keepdims=True)
+                p += start[kmer[0]] * np.prod(
+                    [trans[a, b] for a, b in zip(kmer[:-1], kmer[1:])]
+                )
+    return p
+
+
+def test1_background_model():
+    bg = background_model(["AACG", "TTNA"])
+    # Counts with a pseudocount of 1
+    np.testing.assert_allclose(np.array([4, 2, 2, 3]) / 11, bg)
+    bg = background_model(["AACG"], order=1)
+    assert bg.shape == (4, 4)
+    assert bg[0, 0] > bg[1, 0]
+
+    with pytest.raises(ValueError):
+        background_model(["AC"], order=2)
+
+
+def test2_score_distribution(logodds):
+    rng = np.random.RandomState(1)
+    dinuc = rng.random_sample((4, 4))
+    for bg in [np.full(4, 0.25), np.array([0.1, 0.2, 0.3, 0.4]), dinuc]:
+        scores, probs = score_distribution(logodds, bg=bg, step=0.0001)
+        assert np.isclose(probs.sum(), 1)
+        assert np.isclose(scores[0], logodds.min(1).sum(), atol=0.001)
+        assert np.isclose(scores[-1], logodds.max(1).sum(), atol=0.001)
+        for score in [-1, 0, 1.5]:
+            assert np.isclose(
+                exact_pvalue(logodds, bg, score),
+                score_pvalues(logodds, [score], bg=bg, step=0.0001)[0],
+            )
+
+
+def test3_thresholds(logodds):
+    t1 = pvalue_threshold(logodds, 0.01)
+    t2 = pvalue_threshold(logodds, 0.001)
+    assert t1 < t2
+    assert score_pvalues(logodds, [t1])[0] <= 0.01
+    assert pvalue_threshold(logodds, 1e-10) == pytest.approx(
+        logodds.max(1).sum(), abs=0.01
+    )
+
+    # An FPR of a sequence of the length of the motif is a p-value
+    assert fpr_threshold(logodds, 0.01, length=5, scan_rc=False) == t1
+    assert fpr_threshold(logodds, 0.01, length=200) > t1
+
+    with pytest.raises(ValueError):
+        pvalue_threshold(logodds, 0)
+
+
+def test4_scanner_threshold():
+    motifs = read_motifs("test/data/pwms/motifs.pwm")
+    s = Scanner(ncpus=1)
+    s.set_motifs("test/data/pwms/motifs.pwm")
+    s.set_threshold(fpr=0.01, method="analytical")
+    for m in motifs:
+        assert s.threshold[m.id] == fpr_threshold(m, 0.01, length=200)
+
+    s.set_threshold(pvalue=0.001)
+    for m in motifs:
+        assert s.threshold[m.id] == pvalue_threshold(m, 0.001)
+
+    with pytest.raises(ValueError):
+        s.set_threshold(fpr=0.01, pvalue=0.001)
+
+
+def test5_score_cdf():
+    rng = np.random.RandomState(3)
+    scores = np.round(rng.normal(size=1000), 3)
+    cdf = ScoreCDF(scores)
+    assert len(cdf) == 1000
+
+    for fpr in [0.0, 0.01, 0.05, 0.5, 1.0]:
+        assert cdf.threshold(fpr) == pytest.approx(
+            scoreatpercentile(scores, 100 - 100 * fpr)
+        )
+
+    test = np.array([-10, scores[0], scores.max(), 10])
+    expected = [((scores >= x).sum() + 1) / 1001 for x in test]
+    assert cdf.pvalues(test) == pytest.approx(expected)
+
+    with pytest.raises(ValueError):
+        ScoreCDF([])
@@ -1,5 +1,7 @@
 import os
 
+import numpy as np
+import pandas as pd
 import pytest
 
 from gimmemotifs.stats import calc_stats
@@ -135,3 +137,40 @@ def test2_stats_single_motif(kwargs):
 
     stats = calc_stats(**kwargs)
     assert stats[m_id]["roc_auc"] > 0.9
+
+
+def test3_score_metrics(stat_functions):
+    """ All score metrics from a single sort """
+    fg = pd.read_csv(fg_table, sep="\t", index_col=0, comment="#")
+    bg = pd.read_csv(bg_table, sep="\t", index_col=0, comment="#")
+    score_stats = [
+        f for f in stat_functions if getattr(rocmetrics, f).input_type == "score"
+    ]
+    score_stats += ["phyper_at_fpr", "matches_at_fpr"]
+    for motif_id in fg.columns:
+        fg_vals = list(fg[motif_id])
+        bg_vals = list(bg[motif_id])
+        result = rocmetrics.score_metrics(fg_vals, bg_vals, score_stats)
+        assert sorted(score_stats) == sorted(result.keys())
+        for f in score_stats:
+            expected = getattr(rocmetrics, f)(list(fg_vals), list(bg_vals))
+            assert expected == pytest.approx(result[f], rel=1e-9)
+
+    with pytest.raises(ValueError):
+        rocmetrics.score_metrics(fg_vals, bg_vals, ["ks_pvalue"])
+
+
+def test4_score_metrics_matrix():
+    """ Score metrics of all motifs at once """
+    fg = pd.read_csv(fg_table, sep="\t", index_col=0, comment="#")
+    bg = pd.read_csv(bg_table, sep="\t", index_col=0, comment="#")
+    result = rocmetrics.score_metrics_matrix(fg, bg, rocmetrics.MATRIX_METRICS)
+    for j, motif_id in enumerate(fg.columns):
+        for f in rocmetrics.MATRIX_METRICS:
+            expected = getattr(rocmetrics, f)(list(fg[motif_id]), list(bg[motif_id]))
+            assert np.allclose(expected, result[f][j], rtol=1e-9)
+
+    with pytest.raises(ValueError):
+        rocmetrics.score_metrics_matrix(fg, bg, ["roc_values"])
+    with pytest.raises(ValueError):
+        rocmetrics.score_metrics_matrix(fg, bg.iloc[:, :1])